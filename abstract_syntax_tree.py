@@ -1,27 +1,32 @@
 ###======================================================================###
-# This module contains the node classes used by the parser to implement    #
-# the abstract syntax tree from the parse tree.                            #
+# This module contains the node classes used by the parser to build the   #
+# abstract syntax tree.                                                    #
+# Names of functions and variables are interned ids, see symbols.py.       #
+# Nodes only have the fields of their kind (__slots__), there can be a lot #
+# of them. For keeping many trees around there is also the Arena, which    #
+# stores nodes as rows of typed arrays.                                    #
 ###======================================================================###
-from itertools import count
+from array import array
+import symbols
+
+# Integer codes for the kinds of nodes. Every node class has its kind as a
+# class attribute, kind_names maps a kind back to a name for debugging.
+(PROGRAM, FUNC, PARAM, BLOCK, DECL, ASSIGNMENT, FUNC_CALL, IF, CONDITION,
+ RETURN, BINARY_EXP, LITERAL, VARIABLE) = range(13)
+kind_names = ["program", "func", "param", "block", "decl", "assignment",
+              "func_call", "if", "condition", "return", "binary_exp",
+              "literal", "variable"]
 
 # Base class for nodes in the AST.
 class ASTNode:
-    _node_id = count(0, 1)
-    def __init__(self):
-        self.id = next(self._node_id)
-        self.succs = []
-
-    def add_succ(self, succ):
-        self.succs.append(succ)
-
-    def print(self):
-        print("Node ID: ", self.id)
+    __slots__ = ()
 
 # A program is a list of functions.
 class ProgramNode(ASTNode):
+    __slots__ = ("funcs",)
+    kind = PROGRAM
+
     def __init__(self):
-        super().__init__()
-        self.node_type = "prog_node"
         self.funcs = []
 
     def add_func(self, func):
@@ -35,10 +40,11 @@ class ProgramNode(ASTNode):
 # Function nodes can be either declarations or definitions. The parser only
 # deals with defintions.
 class FuncNode(ASTNode):
-    def __init__(self):
-        super().__init__()
-        self.node_type = "func_node"
-        self.name = None
+    __slots__ = ("name", "params", "block", "nbr_locals")
+    kind = FUNC
+
+    def __init__(self, name=None):
+        self.name = name
         self.params = []
         self.block = None
         self.nbr_locals = 0 # This is used by code gen to allocated stack space.
@@ -47,7 +53,7 @@ class FuncNode(ASTNode):
         self.params.append(param)
 
     def print(self):
-        print("Func name: ", self.name)
+        print("Func name: ", symbols.text(self.name))
         for param in self.params:
             param.print()
         if self.block:
@@ -56,20 +62,22 @@ class FuncNode(ASTNode):
 
 # Function parameter.
 class ParamNode(ASTNode):
-    def __init__(self):
-        super().__init__()
-        self.node_type = "param_node"
-        self.type = "int"   # The front end only deals with int types atm.
-        self.name = None
+    __slots__ = ("name",)
+    kind = PARAM
+    type = "int"   # The front end only deals with int types atm.
+
+    def __init__(self, name=None):
+        self.name = name
 
     def print(self):
-        print("Param name: ", self.name)
+        print("Param name: ", symbols.text(self.name))
 
 # A block is a section of code (list of stmts) delimited by brackets.
 class BlockNode(ASTNode):
+    __slots__ = ("stmts",)
+    kind = BLOCK
+
     def __init__(self):
-        super().__init__()
-        self.node_type = "block_node"
         self.stmts = []
 
     def add_stmt(self, stmt):
@@ -83,82 +91,105 @@ class BlockNode(ASTNode):
 
 # Variable declaration with an optional assignment.
 class DeclNode(ASTNode):
-    def __init__(self):
-        super().__init__()
-        self.node_type = "decl_node"
-        self.name = None
-        self.exp = None
+    __slots__ = ("name", "exp", "local_index")
+    kind = DECL
+
+    def __init__(self, name=None, exp=None):
+        self.name = name
+        self.exp = exp
         self.local_index = None # Used by code gen as: "-local_index*8(%rbp)".
 
     def print(self):
-        print("Decl name: ", self.name)
+        print("Decl name: ", symbols.text(self.name))
         if self.exp:
             self.exp.print()
 
-# Expressions can be single values, in which case op1 is used.
+# An expression is a binary exp, or a single value: a literal, a variable or
+# a function call (a FuncCallNode).
 class ExpNode(ASTNode):
-    def __init__(self):
-        super().__init__()
-        self.node_type = "exp_node"
-        self.name = None
-        self.val = None
-        self.is_exp = False  # If false this is single value.
-        self.op1 = None
-        self.op2 = None
-        self.operator = None
-        self.func_call = None
+    __slots__ = ("operator", "op1", "op2")
+    kind = BINARY_EXP
+
+    def __init__(self, operator=None, op1=None, op2=None):
+        self.operator = operator
+        self.op1 = op1
+        self.op2 = op2
+
+    # Printed with an explicit stack, since the tree can be very deep.
+    def print(self):
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.kind == BINARY_EXP:
+                print("---Exp node---: ", node.operator)
+                stack.append(node.op2)
+                stack.append(node.op1)
+            else:
+                node.print()
+
+# The value of a literal is its lexeme.
+class LiteralNode(ASTNode):
+    __slots__ = ("val",)
+    kind = LITERAL
+
+    def __init__(self, val=None):
+        self.val = val
+
+    def print(self):
+        print("Operand: ", self.val)
+
+class VariableNode(ASTNode):
+    __slots__ = ("name", "local_index")
+    kind = VARIABLE
+
+    def __init__(self, name=None):
+        self.name = name
         self.local_index = None # Used by code gen as: "-local_index*8(%rbp)".
 
     def print(self):
-        if self.is_exp:
-            print("---Exp node---: ", self.operator)
-            self.op1.print()
-            self.op2.print()
-        elif self.func_call:
-            self.func_call.print()
-        elif self.name:
-            print("Operand: ", self.name)
-        elif self.val:
-            print("Operand: ", self.val)
+        print("Operand: ", symbols.text(self.name))
 
 # Assignment.
 class AssignmentNode(ASTNode):
-    def __init__(self):
-        super().__init__()
-        self.node_type = "assignment_node"
-        self.name = None
-        self.exp = None
+    __slots__ = ("name", "exp", "local_index")
+    kind = ASSIGNMENT
+
+    def __init__(self, name=None, exp=None):
+        self.name = name
+        self.exp = exp
         self.local_index = None # Used by code gen as: "-local_index*8(%rbp)".
 
     def print(self):
-        print("Assignment name: ", self.name)
+        print("Assignment name: ", symbols.text(self.name))
         self.exp.print()
 
-# Function call.
+# Function call, either a statement or an expression.
 class FuncCallNode(ASTNode):
-    def __init__(self):
-        super().__init__()
-        self.node_type = "func_call_node"
-        self.name = None
+    __slots__ = ("name", "args")
+    kind = FUNC_CALL
+
+    def __init__(self, name=None):
+        self.name = name
         self.args = []
 
     def add_arg(self, arg):
         self.args.append(arg)
 
     def print(self):
-        print("Func call: ", self.name)
+        print("Func call: ", symbols.text(self.name))
         print("Args: ")
         for arg in self.args:
             arg.print()
 
 # If stmt with option else.
 class IfStmtNode(ASTNode):
-    def __init__(self):
-        super().__init__()
-        self.node_type = "if_node"
-        self.condition = None
-        self.stmt = None
-        self.opt_else = None
+    __slots__ = ("condition", "stmt", "opt_else")
+    kind = IF
+
+    def __init__(self, condition=None, stmt=None, opt_else=None):
+        self.condition = condition
+        self.stmt = stmt
+        self.opt_else = opt_else
 
     def print(self):
         print("---If---")
@@ -171,10 +202,11 @@ class IfStmtNode(ASTNode):
 
 # Condition of an if statment.
 class ConditionNode(ASTNode):
-    def __init__(self):
-        super().__init__()
-        self.node_type = "condition_node"
-        self.op1 = None
+    __slots__ = ("op1", "op2", "operator")
+    kind = CONDITION
+
+    def __init__(self, op1=None):
+        self.op1 = op1
         self.op2 = None
         self.operator = None
 
@@ -190,11 +222,219 @@ class ConditionNode(ASTNode):
 
 # Return statment.
 class ReturnStmtNode(ASTNode):
-    def __init__(self):
-        super().__init__()
-        self.node_type = "return_node"
-        self.exp = None
+    __slots__ = ("exp",)
+    kind = RETURN
+
+    def __init__(self, exp=None):
+        self.exp = exp
 
     def print(self):
         print("---Return---")
         self.exp.print()
+
+################################################################################
+
+# The operators of binary exps and conditions, numbered from 1 for the arena.
+operators = [None, "add", "sub", "mul", "div", "less_than", "less_than_equal",
+             "greater_than", "greater_than_equal", "equal", "not_equal"]
+operator_codes = { op : i for i, op in enumerate(operators) if op }
+
+# An arena stores trees in parallel arrays, one row per node, and a node is
+# addressed by its row (a handle). Handle 0 is never used, it stands for no
+# node. The columns are:
+#   kind    the kind of the node.
+#   op      the operator code of a binary exp or condition.
+#   name    the name id, or for a literal the index of its value in values.
+#           When ids is set, it holds the index of the name in ids instead
+#           (as the arenas loaded by serialize.py do), so that the names are
+#           only looked up for the nodes that are built.
+#   index   the local_index of a decl, assignment or variable (0 if the tree
+#           hasn't been type checked) or the nbr_locals of a func.
+#   child1, child2, child3
+#           the fields holding nodes, in the order of the class: op1 op2,
+#           exp, condition stmt opt_else, params block. For a list (funcs,
+#           params, stmts, args) it is the first node in the list.
+#   next    the next node in the list the node is in.
+class Arena:
+    def __init__(self):
+        self.kind = array('B', [0])
+        self.op = array('B', [0])
+        self.name = array('i', [0])
+        self.index = array('i', [0])
+        self.child1 = array('i', [0])
+        self.child2 = array('i', [0])
+        self.child3 = array('i', [0])
+        self.next = array('i', [0])
+        self.values = [] # The values of literals.
+        self.ids = None # The name ids, if the name column holds indices.
+
+    def __len__(self):
+        return len(self.kind) - 1
+
+    # Add a row for a node with no children yet, return its handle.
+    def new_node(self, kind, op=0, name=0, index=0):
+        self.kind.append(kind)
+        self.op.append(op)
+        self.name.append(name)
+        self.index.append(index)
+        self.child1.append(0)
+        self.child2.append(0)
+        self.child3.append(0)
+        self.next.append(0)
+        return len(self.kind) - 1
+
+    # Store the tree rooted at node, return the handle of the root. The tree
+    # is walked with an explicit stack of (node, column, row), where the
+    # handle of the node is to be written to column[row]. The nodes of a
+    # list are linked by their next column, so for a node in a list the
+    # column is None and row is a [column, row] shared by the whole list: the
+    # nodes are popped in order and each one moves it to its own next.
+    def add_tree(self, node):
+        root = array('i', [0])
+        stack = [(node, root, 0)]
+        while stack:
+            node, column, row = stack.pop()
+            kind = node.kind
+            h = self.new_node(kind)
+            if column is None:
+                link = row
+                column, row = link
+                link[0], link[1] = self.next, h
+            column[row] = h
+            children = ()
+            if kind == BINARY_EXP or kind == CONDITION:
+                self.op[h] = operator_codes.get(node.operator, 0)
+                children = (node.op1, node.op2)
+            elif kind == LITERAL:
+                self.name[h] = len(self.values)
+                self.values.append(node.val)
+            elif kind == PROGRAM:
+                self.push_list(stack, node.funcs, h)
+            elif kind == FUNC:
+                self.name[h] = node.name
+                self.index[h] = node.nbr_locals
+                self.push_list(stack, node.params, h)
+                children = (None, node.block)
+            elif kind == BLOCK:
+                self.push_list(stack, node.stmts, h)
+            elif kind == FUNC_CALL:
+                self.name[h] = node.name
+                self.push_list(stack, node.args, h)
+            elif kind == IF:
+                children = (node.condition, node.stmt, node.opt_else)
+            elif kind == RETURN:
+                children = (node.exp,)
+            else: # A param, decl, assignment or variable.
+                self.name[h] = node.name
+                if kind != PARAM:
+                    self.index[h] = node.local_index or 0
+                if kind == DECL or kind == ASSIGNMENT:
+                    children = (node.exp,)
+            columns = (self.child1, self.child2, self.child3)
+            for column, child in reversed(list(zip(columns, children))):
+                if child is not None:
+                    stack.append((child, column, h))
+        return root[0]
+
+    # Push the nodes of a list, the first one is written to child1 of h.
+    def push_list(self, stack, nodes, h):
+        link = [self.child1, h]
+        for node in reversed(nodes):
+            stack.append((node, None, link))
+
+    # Build the object tree of the node at handle h. Every node of the tree
+    # is created first, then the nodes are linked to their children.
+    def tree(self, h):
+        handles = [h]
+        i = 0
+        while i < len(handles):
+            g = handles[i]
+            for column in (self.child1, self.child2, self.child3, self.next):
+                if column[g]:
+                    handles.append(column[g])
+            i += 1
+        nodes = dict()
+        for g in handles:
+            nodes[g] = self.new_object(g)
+        for g in handles:
+            self.link(nodes, g)
+        return nodes[h]
+
+    # The name id of the node at handle h.
+    def name_id(self, h):
+        if self.ids is None:
+            return self.name[h]
+        return self.ids[self.name[h]]
+
+    def new_object(self, h):
+        kind = self.kind[h]
+        if kind == BINARY_EXP:
+            return ExpNode(operators[self.op[h]])
+        elif kind == LITERAL:
+            return LiteralNode(self.values[self.name[h]])
+        elif kind == VARIABLE:
+            node = VariableNode(self.name_id(h))
+        elif kind == PROGRAM:
+            return ProgramNode()
+        elif kind == FUNC:
+            node = FuncNode(self.name_id(h))
+            node.nbr_locals = self.index[h]
+            return node
+        elif kind == PARAM:
+            return ParamNode(self.name_id(h))
+        elif kind == BLOCK:
+            return BlockNode()
+        elif kind == DECL:
+            node = DeclNode(self.name_id(h))
+        elif kind == ASSIGNMENT:
+            node = AssignmentNode(self.name_id(h))
+        elif kind == FUNC_CALL:
+            return FuncCallNode(self.name_id(h))
+        elif kind == IF:
+            return IfStmtNode()
+        elif kind == CONDITION:
+            node = ConditionNode()
+            node.operator = operators[self.op[h]]
+            return node
+        else:
+            return ReturnStmtNode()
+        node.local_index = self.index[h] or None
+        return node
+
+    # The nodes of the list starting at handle h.
+    def list(self, nodes, h):
+        result = []
+        while h:
+            result.append(nodes[h])
+            h = self.next[h]
+        return result
+
+    def link(self, nodes, h):
+        kind = self.kind[h]
+        node = nodes[h]
+        child1 = nodes.get(self.child1[h])
+        child2 = nodes.get(self.child2[h])
+        if kind == BINARY_EXP or kind == CONDITION:
+            node.op1 = child1
+            node.op2 = child2
+        elif kind == PROGRAM:
+            node.funcs = self.list(nodes, self.child1[h])
+        elif kind == FUNC:
+            node.params = self.list(nodes, self.child1[h])
+            node.block = child2
+        elif kind == BLOCK:
+            node.stmts = self.list(nodes, self.child1[h])
+        elif kind == FUNC_CALL:
+            node.args = self.list(nodes, self.child1[h])
+        elif kind == IF:
+            node.condition = child1
+            node.stmt = child2
+            node.opt_else = nodes.get(self.child3[h])
+        elif kind == DECL or kind == ASSIGNMENT or kind == RETURN:
+            node.exp = child1
+
+    # The number of bytes used by the columns (not counting literal values).
+    def size(self):
+        columns = (self.kind, self.op, self.name, self.index, self.child1,
+                   self.child2, self.child3, self.next)
+        return sum(len(c) * c.itemsize for c in columns)
@@ -0,0 +1,1166 @@
+###======================================================================###
+# Micro benchmarks for the phases of the compiler. Run with the name of a  #
+# benchmark and an input file, used as the seed program (input.txt next to #
+# this file by default, many benchmarks make programs of their own):       #
+#   python benchmark.py lexer input.txt                                    #
+# Benchmarks also check what they measure, and exit with status 1 if a     #
+# check fails, so that they can be run as tests.                           #
+###======================================================================###
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+import abstract_syntax_tree as ast
+import cache
+import cfg
+import codegen
+import compiler
+import dispatch
+import gc
+import incremental
+import inline
+import io
+import ir_instr
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import lexer
+import numpy_lexer
+import optimize
+import parser
+import serialize
+import symbols
+import type_checker
+
+compiler_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "parser.py")
+
+# Best wall clock time (in seconds) out of a few runs of f(*args).
+def best_time(f, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f(*args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+# The old scan() works on lexer.inputStr, so point it at the source first.
+def run_scan(source):
+    lexer.inputStr = source
+    return lexer.scan()
+
+# Compare tokens/sec of scan() and the single pass tokenize() on growing
+# copies of the input.
+def bench_lexer(seed):
+    print("%10s %12s %14s %14s %8s" % ("bytes", "tokens", "scan tok/s",
+                                        "tokenize tok/s", "speedup"))
+    for copies in (10, 100, 1000, 5000):
+        source = seed * copies
+        kinds, starts, ends = lexer.tokenize(source)
+        if lexer.token_list(source, kinds, starts, ends) != run_scan(source):
+            print("tokenize() and scan() disagree!")
+            sys.exit(1)
+        nbr_tokens = len(kinds)
+        scan_time = best_time(run_scan, source)
+        tokenize_time = best_time(lexer.tokenize, source)
+        print("%10d %12d %14.0f %14.0f %7.2fx" % (len(source), nbr_tokens,
+              nbr_tokens / scan_time, nbr_tokens / tokenize_time,
+              scan_time / tokenize_time))
+
+# Time and peak traced memory of f(*args).
+def time_and_peak(f, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    f(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+# Pull every token out of the iterator, the way the parser does.
+def drain(tokens):
+    for tok in tokens:
+        pass
+
+def scan_file(path):
+    lexer.inputStr = lexer.read_input(path)
+    lexer.scan()
+
+def tokens_file(path):
+    drain(lexer.tokens(lexer.read_input(path)))
+
+def stream_file(path):
+    drain(lexer.stream(path))
+
+# Peak memory of lexing a file with scan(), tokens() and stream(). The pages
+# of the mapped file are not counted by tracemalloc, they belong to the page
+# cache rather than to the Python heap.
+def bench_stream(seed):
+    print("%10s %-8s %10s %12s" % ("bytes", "lexer", "time (s)",
+                                    "peak (KiB)"))
+    for copies in (100, 1000, 5000):
+        with tempfile.NamedTemporaryFile('w', suffix=".c",
+                                         delete=False) as file:
+            file.write(seed * copies)
+        for name, f in (("scan", scan_file), ("tokens", tokens_file),
+                        ("stream", stream_file)):
+            elapsed, peak = time_and_peak(f, file.name)
+            print("%10d %-8s %10.3f %12d" % (len(seed) * copies, name,
+                                              elapsed, peak // 1024))
+        os.remove(file.name)
+
+# Compare the regex and numpy tokenizers as the input grows. The numpy
+# backend has a fixed cost per call but a much lower cost per byte.
+def bench_numpy(seed):
+    if not numpy_lexer.available():
+        print("numpy is not installed.")
+        sys.exit(1)
+    print("%10s %12s %12s %12s %8s" % ("bytes", "tokens", "regex (s)",
+                                        "numpy (s)", "speedup"))
+    for copies in (1, 3, 10, 30, 100, 300, 1000, 3000, 10000):
+        source = seed * copies
+        kinds, starts, ends = lexer.tokenize(source)
+        if numpy_lexer.tokenize(source) != (kinds, starts, ends):
+            print("The numpy and regex tokenizers disagree!")
+            sys.exit(1)
+        regex_time = best_time(lexer.tokenize, source)
+        numpy_time = best_time(numpy_lexer.tokenize, source)
+        print("%10d %12d %12.5f %12.5f %7.2fx" % (len(source), len(kinds),
+              regex_time, numpy_time, regex_time / numpy_time))
+
+# A program with many functions, a main with many statements, and long
+# expressions. Used to check that no phase recurses once per list element.
+def stress_program(nbr_funcs, nbr_stmts, nbr_operands):
+    lines = []
+    for i in range(nbr_funcs):
+        lines.append("int f%d(int a, int b) { int c = a + b; if (c < %d) "
+                     "return c; return a * b; }" % (i, i))
+    lines.append("int main() {")
+    lines.append("int x = 0;")
+    for i in range(nbr_stmts):
+        lines.append("x = f%d(x, %d);" % (i % nbr_funcs, i))
+    lines.append("int y = " + " + ".join(["x"] * nbr_operands) + ";")
+    lines.append("y = " + " * ".join(["y"] * nbr_operands) + ";")
+    lines.append("print(f0(x, " + " - ".join(["y"] * nbr_operands) + "));")
+    lines.append("return 0; }")
+    return "\n".join(lines) + "\n"
+
+# Programs whose statements or calls nest depth deep, far deeper than the
+# recursion limit of Python: else if arms, blocks in blocks, and calls in
+# the arguments of calls. Each one prints depth. Used to check that no phase
+# recurses once per level of nesting.
+def nesting_programs(depth):
+    arms = ["int main() {", "int x = %d;" % (depth - 1)]
+    for i in range(depth):
+        arms.append("%sif (x == %d) { x = %d; }" % ("else " if i else "", i,
+                                                     depth))
+    arms.append("print(x); return 0; }")
+    blocks = ["int main() {", "int x = 0;"]
+    blocks.extend(["{ int y = 1; x = x + y;"] * depth)
+    blocks.append("}" * depth)
+    blocks.append("print(x); return 0; }")
+    calls = ["int f(int a) { return a + 1; }",
+             "int main() { print(" + "f(" * depth + "0" + ")" * depth +
+             "); return 0; }"]
+    return [("else if", "\n".join(arms) + "\n"),
+            ("blocks", "\n".join(blocks) + "\n"),
+            ("calls", "\n".join(calls) + "\n")]
+
+# Compile stress programs with the command line compiler, and programs that
+# nest deep with a Compiler at each optimization level (and run them, with
+# as and ld). Exits with status 1 if one fails. The seed program is not
+# used.
+def bench_stress(seed):
+    print("%8s %8s %10s %10s %10s" % ("funcs", "stmts", "operands", "bytes",
+                                       "time (s)"))
+    for nbr_funcs, nbr_stmts, nbr_operands in ((1000, 10000, 1000),
+                                               (5000, 100000, 10000)):
+        source = stress_program(nbr_funcs, nbr_stmts, nbr_operands)
+        with tempfile.NamedTemporaryFile('w', suffix=".c",
+                                         delete=False) as file:
+            file.write(source)
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, compiler_path, file.name],
+                                capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        os.remove(file.name)
+        if result.returncode != 0 or "_start:" not in result.stdout:
+            print("Failed to compile the stress program:")
+            print(result.stdout[-500:], result.stderr[-500:])
+            sys.exit(1)
+        print("%8d %8d %10d %10d %10.2f" % (nbr_funcs, nbr_stmts,
+              nbr_operands, len(source), elapsed))
+    native = shutil.which("as") and shutil.which("ld")
+    depth = 5000
+    print()
+    print("%-8s %6s" % ("nesting", "depth") +
+          "".join("%10s" % ("-O%d (s)" % level)
+                  for level in range(optimize.max_level + 1)))
+    for name, source in nesting_programs(depth):
+        times = []
+        for opt_level in range(optimize.max_level + 1):
+            start = time.perf_counter()
+            try:
+                asm = compiler.Compiler(opt_level=opt_level).compile(source)
+            except RecursionError:
+                print("Compiling the %s program at -O%d ran out of stack!"
+                      % (name, opt_level))
+                sys.exit(1)
+            times.append(time.perf_counter() - start)
+            if native and run_native(asm)[1] != "%d\n" % depth:
+                print("The %s program at -O%d printed the wrong value!"
+                      % (name, opt_level))
+                sys.exit(1)
+        print("%-8s %6d" % (name, depth) +
+              "".join("%10.2f" % t for t in times))
+
+# Parse building the concrete parse tree as well, the way the parser used
+# to, and directly.
+def parse_via_tree(source):
+    return parser.parse_program(lexer.tokens(source), [])[1]
+
+def parse_direct(source):
+    return parser.parse_program(lexer.tokens(source))[1]
+
+# The printed ast, to check that both parsers build the same tree.
+def ast_text(prog):
+    out = io.StringIO()
+    with redirect_stdout(out):
+        prog.print()
+    return out.getvalue()
+
+# Time and peak memory of getting the ast with and without the parse tree.
+def bench_parse(seed):
+    print("%10s %-8s %10s %12s" % ("bytes", "parser", "time (s)",
+                                    "peak (KiB)"))
+    for copies in (10, 100, 1000):
+        source = seed * copies
+        if ast_text(parse_via_tree(source)) != ast_text(parse_direct(source)):
+            print("The parsers build different trees!")
+            sys.exit(1)
+        for name, f in (("tree", parse_via_tree), ("direct", parse_direct)):
+            elapsed, peak = time_and_peak(f, source)
+            print("%10d %-8s %10.3f %12d" % (len(source), name, elapsed,
+                                              peak // 1024))
+
+# A program made of long expressions, mixing all operators, unary minus and
+# parentheses.
+def exp_program(nbr_stmts, nbr_operands):
+    ops = [" + ", " - ", " * ", " / "]
+    lines = ["int main() {", "int x = 7;"]
+    for i in range(nbr_stmts):
+        exp = ["x"]
+        for j in range(1, nbr_operands):
+            exp.append(ops[(i + j) % 4])
+            if j % 7 == 0:
+                exp.append("(x - %d)" % j)
+            elif j % 5 == 0:
+                exp.append("-x")
+            else:
+                exp.append(str(j))
+        lines.append("x = " + "".join(exp) + ";")
+    lines.append("return x; }")
+    return "\n".join(lines) + "\n"
+
+# Expression parsing with the prediction table (parser.py), building the
+# parse tree through the exp/exp2/exp3 cascade of the grammar, and building
+# only the ast.
+def bench_exp(seed):
+    print("%8s %10s %10s %12s %12s %8s" % ("stmts", "operands", "bytes",
+          "tree (s)", "ast (s)", "speedup"))
+    for nbr_stmts, nbr_operands in ((1000, 10), (1000, 100), (100, 1000)):
+        source = exp_program(nbr_stmts, nbr_operands)
+        if ast_text(parse_via_tree(source)) != ast_text(parse_direct(source)):
+            print("The parsers build different trees!")
+            sys.exit(1)
+        tree_time = best_time(parse_via_tree, source)
+        ast_time = best_time(parse_direct, source)
+        print("%8d %10d %10d %12.3f %12.3f %7.2fx" % (nbr_stmts,
+              nbr_operands, len(source), tree_time, ast_time,
+              tree_time / ast_time))
+
+# Variations of the seed program, each with a function of its own added so
+# that every program is different.
+def seed_programs(seed, count):
+    programs = []
+    for i in range(count):
+        programs.append(seed + "\nint variant%d(int a) { return a * %d; }\n"
+                        % (i, i))
+    return programs
+
+# Whether the operand tables of the IR (see ir_instr.py) stay right when
+# they grow from many threads at once, and don't keep the constants of
+# programs that were compiled.
+def check_operands(c):
+    first = len(ir_instr.temps)
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        ops = list(pool.map(ir_instr.temp, range(first + 4000, first, -1)))
+    if ops != ir_instr.temps[first + 4000:first:-1] or \
+       any(op.id != i for i, op in enumerate(ir_instr.temps)):
+        print("Temporaries made from several threads have the wrong ids!")
+        sys.exit(1)
+    before = len(ir_instr.constants)
+    c.compile("int main() {\n%s\nreturn 0;\n}\n" %
+              "\n".join("print(%d);" % (1000003 + i) for i in range(1000)))
+    gc.collect()
+    if len(ir_instr.constants) > before:
+        print("The constants of a compiled program are still kept!")
+        sys.exit(1)
+
+# Compile many small programs in one warm process with a Compiler, against
+# starting the command line compiler once per program. The same programs are
+# also compiled from several threads at once, which has to give the same
+# assembly as compiling them one after the other.
+def bench_session(seed):
+    programs = seed_programs(seed, 200)
+    expected = []
+    start = time.perf_counter()
+    for source in programs[:20]:
+        with tempfile.NamedTemporaryFile('w', suffix=".c",
+                                         delete=False) as file:
+            file.write(source)
+        result = subprocess.run([sys.executable, compiler_path, file.name],
+                                capture_output=True, text=True)
+        os.remove(file.name)
+        expected.append(result.stdout)
+    process_time = (time.perf_counter() - start) / 20
+    c = compiler.Compiler()
+    start = time.perf_counter()
+    asm = [c.compile(source) for source in programs]
+    session_time = (time.perf_counter() - start) / len(programs)
+    if asm[:20] != expected:
+        print("Compiler.compile() and the command line compiler disagree!")
+        sys.exit(1)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        threaded = list(pool.map(c.compile, programs * 5))
+    if threaded != asm * 5:
+        print("Compiling from several threads gave different assembly!")
+        sys.exit(1)
+    check_operands(c)
+    print("%-24s %14s" % ("", "ms per program"))
+    print("%-24s %14.2f" % ("process per program", process_time * 1000))
+    print("%-24s %14.2f" % ("warm Compiler", session_time * 1000))
+    print("%d programs compiled from 8 threads, same assembly." %
+          len(threaded))
+
+# Bytes of memory still allocated after f(*args) has returned, and the
+# result, which is kept alive while measuring.
+def retained(f, *args):
+    tracemalloc.start()
+    result = f(*args)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, result
+
+# The IR of a type checked ast, to check that the arena keeps the local
+# indices of the variables.
+def ir_text(prog):
+    translator = ir_instr.Translator()
+    translator.translate_ast(prog)
+    return [instr.instr_str() for instr in translator.program]
+
+# Memory per node of the ast as objects, and stored in an arena. The seed
+# program is not used. The typed tree is stored in the arena and rebuilt
+# from it, which has to give the same tree back.
+def bench_ast(seed):
+    print("%10s %10s %14s %14s" % ("bytes", "nodes", "objects (B/n)",
+                                    "arena (B/n)"))
+    for source in (exp_program(1000, 100), stress_program(100, 10000, 1000)):
+        size, prog = retained(parse_direct, source)
+        type_checker.TypeChecker().type_check(prog)
+        arena = ast.Arena()
+        arena_size, root = retained(arena.add_tree, prog)
+        copy = arena.tree(root)
+        if ast_text(copy) != ast_text(prog) or ir_text(copy) != ir_text(prog):
+            print("The tree rebuilt from the arena is different!")
+            sys.exit(1)
+        print("%10d %10d %14.1f %14.1f" % (len(source), len(arena),
+              size / len(arena), arena_size / len(arena)))
+
+# The number of nodes in a tree.
+def count_nodes(prog):
+    arena = ast.Arena()
+    arena.add_tree(prog)
+    return len(arena)
+
+# A pass that does nothing but dispatch on the ops of IR instructions, and
+# the chain of comparisons codegen used to select the code to generate,
+# with the same order of ops, to measure the cost of dispatch by itself.
+class NullPass(dispatch.Pass):
+    @dispatch.handles(*range(len(ir_instr.op_names)))
+    def null(self, instr):
+        pass
+
+def chain_dispatch(instr):
+    op = instr.op
+    if op == ir_instr.BEGIN:
+        pass
+    elif op == ir_instr.CALL:
+        pass
+    elif (op == ir_instr.BL or op == ir_instr.BLE or op == ir_instr.BG
+          or op == ir_instr.BGE or op == ir_instr.BEQ or op == ir_instr.BNE):
+        pass
+    elif op == ir_instr.JUMP:
+        pass
+    elif op == ir_instr.LABEL:
+        pass
+    elif op == ir_instr.MOV:
+        pass
+    elif (op == ir_instr.ADD or op == ir_instr.SUB or op == ir_instr.MUL
+          or op == ir_instr.DIV):
+        pass
+    elif op == ir_instr.RET:
+        pass
+
+def run_table(instrs):
+    table = NullPass().dispatch
+    for instr in instrs:
+        table[instr.op](instr)
+
+def run_chain(instrs):
+    for instr in instrs:
+        chain_dispatch(instr)
+
+# Time per node of the phases that dispatch on the kinds of nodes, and per
+# instruction of codegen, which dispatches on the ops of the IR. The seed
+# program is not used.
+def bench_dispatch(seed):
+    print("%8s %8s %9s %15s %16s %14s %12s %12s" % ("nodes", "instrs",
+          "bytes", "check (ns/node)", "translate (ns/n)", "codegen (ns/i)",
+          "chain (ns/i)", "table (ns/i)"))
+    for source in (stress_program(1000, 20000, 10),
+                   stress_program(100, 2000, 1000)):
+        prog = parse_direct(source)
+        nbr_nodes = count_nodes(prog)
+        check_time = translate_time = codegen_time = float("inf")
+        for i in range(3):
+            prog = parse_direct(source)
+            start = time.perf_counter()
+            type_checker.TypeChecker().type_check(prog)
+            check_time = min(check_time, time.perf_counter() - start)
+            translator = ir_instr.Translator()
+            start = time.perf_counter()
+            translator.translate_ast(prog)
+            translate_time = min(translate_time, time.perf_counter() - start)
+            start = time.perf_counter()
+            codegen.CodeGen().code_gen(translator.program)
+            codegen_time = min(codegen_time, time.perf_counter() - start)
+        nbr_instrs = len(translator.program)
+        chain_time = best_time(run_chain, translator.program)
+        table_time = best_time(run_table, translator.program)
+        print("%8d %8d %9d %15.0f %16.0f %14.0f %12.0f %12.0f" % (nbr_nodes,
+              nbr_instrs, len(source), check_time / nbr_nodes * 1e9,
+              translate_time / nbr_nodes * 1e9,
+              codegen_time / nbr_instrs * 1e9, chain_time / nbr_instrs * 1e9,
+              table_time / nbr_instrs * 1e9))
+
+# Memory per instruction of the IR, and time per instruction to build it
+# and generate code from it. The seed program is translated and printed,
+# and its IR has to come back the same from the binary format.
+def bench_ir(seed):
+    session = compiler.CompilationSession()
+    session.front_end(lexer.tokens(seed))
+    program = session.translator.program
+    text = io.StringIO()
+    with redirect_stdout(text):
+        ir_instr.print_program(program)
+    copy = serialize.load_ir(serialize.dump_ir(program))
+    if [i.instr_str() for i in copy] != [i.instr_str() for i in program]:
+        print("The IR loaded from the binary format is different!")
+        sys.exit(1)
+    print(text.getvalue(), end="")
+    print("%8s %9s %12s %18s %16s" % ("instrs", "bytes", "memory (B/i)",
+          "translate (ns/i)", "codegen (ns/i)"))
+    for source in (stress_program(1000, 20000, 10), exp_program(1000, 100)):
+        prog = parse_direct(source)
+        type_checker.TypeChecker().type_check(prog)
+        size, program = retained(ir_instr.Translator().translate_ast, prog)
+        translate_time = best_time(lambda: ir_instr.Translator()
+                                   .translate_ast(prog))
+        codegen_time = best_time(lambda: codegen.CodeGen().code_gen(program))
+        print("%8d %9d %12.1f %18.0f %16.0f" % (len(program), len(source),
+              size / len(program), translate_time / len(program) * 1e9,
+              codegen_time / len(program) * 1e9))
+
+# A function with nbr_ifs if statements, one after the other or nested.
+def branch_program(nbr_ifs, nested):
+    lines = ["int f(int a) {", "int x = 0;"]
+    for i in range(nbr_ifs):
+        if nested:
+            lines.append("if (a < %d) {" % i)
+        else:
+            lines.append("if (a < %d) { x = x + 1; } else { x = x - 1; }" % i)
+    if nested:
+        lines.append("x = 1;")
+        lines.extend(["} else { x = x - 1; }"] * nbr_ifs)
+    lines.append("return x; }")
+    lines.append("int main() { print(f(3)); return 0; }")
+    return "\n".join(lines) + "\n"
+
+# The dominators of every block of a graph, by index, as sets. Each block is
+# dominated by itself and by what dominates all of its predecessors.
+def naive_dominators(graph):
+    reachable = set(block.index for block in graph.rpo())
+    everything = set(reachable)
+    doms = [everything] * len(graph.blocks)
+    doms[0] = {0}
+    changed = True
+    while changed:
+        changed = False
+        for block in graph.rpo()[1:]:
+            new = set(everything)
+            for pred in block.preds:
+                if pred.index in reachable:
+                    new &= doms[pred.index]
+            new.add(block.index)
+            if new != doms[block.index]:
+                doms[block.index] = new
+                changed = True
+    return doms
+
+# Time per block to build the control flow graph of a function and its
+# dominator tree, for functions with more and more branches. The seed
+# program and small functions are checked against the dominators computed
+# the slow way (of the reachable blocks, nothing dominates the others).
+def bench_cfg(seed):
+    for source in (seed, branch_program(50, False), branch_program(50, True)):
+        session = compiler.CompilationSession()
+        session.front_end(lexer.tokens(source))
+        for func in cfg.functions(session.translator.program):
+            graph = func.cfg()
+            doms = naive_dominators(graph)
+            for a in graph.blocks:
+                for b in graph.rpo():
+                    if graph.dominates(a, b) != (a.index in doms[b.index]):
+                        print("The dominators are wrong!")
+                        sys.exit(1)
+    print("%8s %8s %8s %14s" % ("ifs", "", "blocks", "time (us/b)"))
+    for nested, sizes in ((False, (1000, 4000, 16000)), (True, (100, 300))):
+        for nbr_ifs in sizes:
+            session = compiler.CompilationSession()
+            session.front_end(lexer.tokens(branch_program(nbr_ifs, nested)))
+            func = cfg.functions(session.translator.program)[0]
+            def analyze():
+                func.changed()
+                graph = func.cfg()
+                graph.dominates(graph.blocks[0], graph.blocks[-1])
+                return graph
+            # The graphs have cycles, so the collector would run while
+            # timing, with more work the more objects there are. It is off
+            # then, as in timeit.
+            gc.collect()
+            gc.disable()
+            elapsed = best_time(analyze)
+            gc.enable()
+            nbr_blocks = len(func.cfg().blocks)
+            print("%8d %8s %8d %14.2f" % (nbr_ifs, "nested" if nested else
+                  "", nbr_blocks, elapsed / nbr_blocks * 1e6))
+
+# Loading the IR and the typed ast from the binary format and with pickle,
+# and building the objects of the ast from the arena it loads as, then
+# compiling with a cold and a warm front end cache. Then many programs
+# are compiled with a small cache, which has to stay within its size.
+def bench_cache(seed):
+    print("%9s %-4s %10s %10s %12s %12s %10s" % ("bytes", "", "binary (B)",
+          "pickle (B)", "binary (ms)", "pickle (ms)", "tree (ms)"))
+    directory = tempfile.mkdtemp()
+    front_end_cache = cache.Cache(directory)
+    c = compiler.Compiler(cache=front_end_cache)
+    times = []
+    for source in (seed, stress_program(100, 2000, 100), exp_program(300, 30)):
+        session = compiler.CompilationSession()
+        session.front_end(lexer.tokens(source))
+        for name, dump, load, data in (("ir", serialize.dump_ir,
+                serialize.load_ir, session.translator.program),
+                ("ast", serialize.dump_ast, serialize.load_ast,
+                 session.prog_ast)):
+            binary = dump(data)
+            pickled = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+            tree_time = "-"
+            if name == "ast":
+                # The loaded arena builds the objects of the tree on demand,
+                # which has to give the tree that was stored.
+                arena = load(binary)
+                if ast_text(arena.tree(1)) != ast_text(data):
+                    print("The binary format gave a different ast!")
+                    sys.exit(1)
+                tree_time = "%.2f" % (best_time(arena.tree, 1) * 1000)
+            print("%9d %-4s %10d %10d %12.2f %12.2f %10s" % (len(source),
+                  name, len(binary), len(pickled),
+                  best_time(load, binary) * 1000,
+                  best_time(pickle.loads, pickled) * 1000, tree_time))
+        start = time.perf_counter()
+        cold = c.compile(source)
+        cold_time = time.perf_counter() - start
+        warm_time = best_time(c.compile, source)
+        if cold != c.compile(source):
+            print("The cache gave different assembly!")
+            sys.exit(1)
+        times.append((len(source), cold_time, warm_time))
+    print("%9s %12s %12s" % ("bytes", "cold (ms)", "warm (ms)"))
+    for size, cold_time, warm_time in times:
+        print("%9d %12.2f %12.2f" % (size, cold_time * 1000, warm_time * 1000))
+    small_cache = cache.Cache(directory, max_size=20000)
+    c = compiler.Compiler(cache=small_cache)
+    programs = seed_programs(seed, 50)
+    for source in programs:
+        c.compile(source)
+    size = sum(entry[1] for entry in small_cache.entries())
+    if size > small_cache.max_size:
+        print("The cache is larger than its max size!")
+        sys.exit(1)
+    if small_cache.read(small_cache.key(programs[-1])) is None:
+        print("The last program compiled was evicted from the cache!")
+        sys.exit(1)
+    print("%d programs compiled with a cache of %d bytes, %d entries kept." %
+          (len(programs), small_cache.max_size, len(small_cache.entries())))
+    small_cache.clear()
+    os.remove(os.path.join(directory, "version"))
+    os.rmdir(directory)
+
+# A main with nbr_blocks nested blocks, each declaring a variable that is
+# set from variables of the outermost blocks, and then nbr_locals locals in
+# the innermost block, each used by an if in a scope of its own.
+def scope_program(nbr_blocks, nbr_locals):
+    lines = ["int main() {", "int v0 = 1;"]
+    for i in range(1, nbr_blocks):
+        lines.append("{ int v%d = v0 + v%d;" % (i, i // 2))
+    for i in range(nbr_locals):
+        lines.append("int w%d = v0 + %d;" % (i, i))
+        lines.append("if (w%d < v%d) { int u = w%d; print(u); }" %
+                     (i, nbr_blocks // 2, i))
+    lines.append("}" * (nbr_blocks - 1))
+    lines.append("return v0; }")
+    return "\n".join(lines) + "\n"
+
+# Type checking with deep nesting and with wide scopes. The seed program is
+# not used.
+def bench_scopes(seed):
+    print("%8s %8s %10s %12s" % ("blocks", "locals", "bytes", "check (ms)"))
+    for nbr_blocks, nbr_locals in ((10, 100), (400, 100), (10, 5000),
+                                   (400, 5000)):
+        source = scope_program(nbr_blocks, nbr_locals)
+        trees = [parse_direct(source) for i in range(3)]
+        check = lambda: type_checker.TypeChecker().type_check(trees.pop())
+        print("%8d %8d %10d %12.2f" % (nbr_blocks, nbr_locals, len(source),
+              best_time(check) * 1000))
+
+# Compile a program of many functions in one process and with pools of
+# processes, up to one per core, twice with each pool. The assembly has to
+# be the same. Then compile small programs from the seed program, starting
+# the processes for each of them or keeping them.
+def bench_parallel(seed):
+    source = stress_program(10000, 20000, 10)
+    start = time.perf_counter()
+    expected = compiler.Compiler().compile(source)
+    serial_time = time.perf_counter() - start
+    print("%8s %10s %10s %10s" % ("workers", "first (s)", "next (s)",
+                                   "speedup"))
+    print("%8s %10.2f %10.2f %10.2f" % ("serial", serial_time, serial_time,
+                                         1))
+    nbr_workers = 1
+    while True:
+        times = []
+        with compiler.Compiler(workers=nbr_workers) as c:
+            for i in range(2):
+                start = time.perf_counter()
+                asm = c.compile(source)
+                times.append(time.perf_counter() - start)
+                if asm != expected:
+                    print("Parallel compilation gave different assembly!")
+                    sys.exit(1)
+        print("%8d %10.2f %10.2f %10.2f" % (nbr_workers, times[0], times[1],
+                                             serial_time / times[1]))
+        if nbr_workers >= os.cpu_count():
+            break
+        nbr_workers = min(nbr_workers * 2, os.cpu_count())
+    # Small programs, with the processes started for each program, and
+    # with the processes of one Compiler kept for all of them.
+    programs = seed_programs(seed, 20)
+    expected = [compiler.Compiler().compile(source) for source in programs]
+    start = time.perf_counter()
+    for source in programs:
+        with compiler.Compiler(workers=4) as c:
+            c.compile(source)
+    new_time = (time.perf_counter() - start) / len(programs)
+    with compiler.Compiler(workers=4) as c:
+        c.compile(programs[0])
+        start = time.perf_counter()
+        asm = [c.compile(source) for source in programs]
+        kept_time = (time.perf_counter() - start) / len(programs)
+    if asm != expected:
+        print("Parallel compilation gave different assembly!")
+        sys.exit(1)
+    print()
+    print("%-24s %14s" % ("4 workers", "ms per program"))
+    print("%-24s %14.2f" % ("processes per program", new_time * 1000))
+    print("%-24s %14.2f" % ("processes kept", kept_time * 1000))
+
+# Compile stress programs incrementally, then again after editing the body
+# of one function, and compare with compiling them in one go. Changing only
+# the spaces in the body after that must not compile anything.
+def bench_incremental(seed):
+    print("%6s %10s %10s %10s %10s %9s %11s" % ("funcs", "serial (s)",
+          "cold (s)", "same (s)", "edit (s)", "compiled", "spaces (s)"))
+    for nbr_funcs in (1000, 10000):
+        directory = tempfile.mkdtemp()
+        function_cache = cache.Cache(directory, max_size=1 << 30)
+        source = stress_program(nbr_funcs, nbr_funcs, 10)
+        edited = source.replace("f%d(int a, int b) { int c = a + b;" %
+                                (nbr_funcs // 2), "f%d(int a, int b) { "
+                                "int c = a - b;" % (nbr_funcs // 2))
+        respaced = edited.replace("f%d(int a, int b) { int c = a - b;" %
+                                  (nbr_funcs // 2), "f%d(int a, int b)\n{\n"
+                                  "    int c = a-b;\n" % (nbr_funcs // 2))
+        start = time.perf_counter()
+        expected = compiler.Compiler().compile(edited)
+        serial_time = time.perf_counter() - start
+        times = []
+        compiled = []
+        for program in (source, source, edited, respaced):
+            start = time.perf_counter()
+            asm, nbr_compiled = incremental.compile_incremental(
+                program, function_cache, name="stress")
+            times.append(time.perf_counter() - start)
+            compiled.append(nbr_compiled)
+            if program is edited and asm != expected:
+                print("Incremental compilation gave different assembly!")
+                sys.exit(1)
+        if asm != expected or compiled[3]:
+            print("Changing the spaces of a function compiled it again!")
+            sys.exit(1)
+        print("%6d %10.2f %10.2f %10.2f %10.2f %9d %11.2f" % (nbr_funcs,
+              serial_time, *times[:3], compiled[2], times[3]))
+        function_cache.clear()
+        os.remove(os.path.join(directory, "version"))
+        os.rmdir(directory)
+
+# A function whose branches mostly test settings that are constants, as
+# with debug flags, so that constant propagation can remove them.
+def settings_program(nbr_ifs):
+    lines = ["int f(int a) {", "int debug = 0;", "int level = 2;",
+             "int x = 0;"]
+    for i in range(nbr_ifs):
+        if i % 3 == 0:
+            lines.append("if (debug) { x = x + a * %d; print(x); }" % i)
+        elif i % 3 == 1:
+            lines.append("if (level * 2 >= 4) { x = x + %d; } "
+                         "else { level = 0; }" % i)
+        else:
+            lines.append("if (a < %d) { x = x - level; }" % i)
+    lines.append("return x; }")
+    lines.append("int main() { print(f(3)); return 0; }")
+    return "\n".join(lines) + "\n"
+
+# Straight-line code with constants, copies and arithmetic on them, as in
+# code that names its settings and intermediate values.
+def straight_program(nbr_stmts):
+    lines = ["int f(int a) {", "int x0 = a;", "int k0 = 4;"]
+    for i in range(1, nbr_stmts):
+        if i % 4 == 0:
+            lines.append("int k%d = k%d * 3 - %d / 2;" % (i, i - 4, i))
+        elif i % 4 == 1:
+            lines.append("int x%d = x%d;" % (i, max(i - 3, 0)))
+        elif i % 4 == 2:
+            lines.append("int x%d = x%d + k%d;" % (i, i - 1, i - 2))
+        else:
+            lines.append("int k%d = k%d / 3 + 1;" % (i, i - 3))
+    lines.append("return x%d; }" % ((nbr_stmts - 1) // 4 * 4 + 2))
+    lines.append("int main() { print(f(3)); return 0; }")
+    return "\n".join(lines) + "\n"
+
+# Run the IR of a program from main. Returns what it prints, the number of
+# instructions it executes, of jumps and branches taken and of calls.
+def run_ir(program):
+    bodies = dict() # Function name -> body and the index of each label.
+    for func in cfg.functions(program):
+        labels = dict((instr.dest, i) for i, instr in enumerate(func.body)
+                      if instr.op == ir_instr.LABEL)
+        bodies[func.name()] = (func.body, labels)
+    output = []
+    counts = [0, 0, 0]
+    # The values of variables are kept by local index, those of temporaries
+    # by operand.
+    def call(name, args):
+        counts[2] += 1
+        body, labels = bodies[name]
+        values = dict((i + 2, arg) for i, arg in enumerate(args))
+        def get(op):
+            if op.kind == ir_instr.CONST:
+                return op.val
+            if op.kind == ir_instr.VAR:
+                return values.get(op.local_index, 0)
+            return values[op]
+        def put(op, value):
+            if op.kind == ir_instr.VAR:
+                op = op.local_index
+            values[op] = value
+        i = 0
+        while i < len(body):
+            instr = body[i]
+            op = instr.op
+            counts[0] += 1
+            i += 1
+            if op == ir_instr.MOV:
+                put(instr.dest, get(instr.src1))
+            elif op in ir_instr.arithmetic:
+                put(instr.dest, ir_instr.fold(op, get(instr.src1),
+                                              get(instr.src2)))
+            elif op == ir_instr.JUMP:
+                counts[1] += 1
+                i = labels[instr.dest]
+            elif op in ir_instr.branches:
+                if ir_instr.compare[op](get(instr.src1), get(instr.src2)):
+                    counts[1] += 1
+                    i = labels[instr.dest]
+            elif op == ir_instr.CALL:
+                args = [get(arg) for arg in instr.args]
+                if instr.src1.name == symbols.PRINT:
+                    output.append(args[0])
+                else:
+                    result = call(instr.src1.name, args)
+                    if instr.dest:
+                        put(instr.dest, result)
+            elif op == ir_instr.RET:
+                return get(instr.dest)
+        return 0
+    call(symbols.MAIN, [])
+    return output, counts[0], counts[1], counts[2] - 1
+
+# Functions whose expressions repeat their subexpressions, as in
+# f(a*b + c, a*b - c), in different orders of the commutative operands.
+def repeated_program(nbr_funcs):
+    lines = ["int g(int x, int y) { return x - y; }"]
+    for i in range(nbr_funcs):
+        lines.append("int f%d(int a, int b, int c) {" % i)
+        lines.append("int d = g(a * b + c, b * a - c);")
+        lines.append("int e = (a + %d) * (c + b) + (b + c) * (%d + a);"
+                     % (i, i))
+        lines.append("if (a * b > c + b) { d = d + a * b; }")
+        lines.append("c = c + 1;")
+        lines.append("return d + e + (c + b) * (b + c); }")
+    lines.append("int main() { int s = 0;")
+    for i in range(nbr_funcs):
+        lines.append("s = s + f%d(%d, 3, 2);" % (i, i))
+    lines.append("print(s); return 0; }")
+    return "\n".join(lines) + "\n"
+
+# Small helper functions called from a function that does the work.
+def helpers_program(nbr_calls):
+    lines = ["int square(int x) { return x * x; }",
+             "int clamp(int x, int low, int high) {",
+             "if (x < low) { return low; } if (x > high) { return high; }",
+             "return x; }",
+             "int mix(int a, int b) { return square(a) + clamp(b, 0, 50); }",
+             "int f(int a) { int s = 0;"]
+    for i in range(nbr_calls):
+        lines.append("s = s + mix(a + %d, s - %d);" % (i, i))
+    lines.append("return s; }")
+    lines.append("int main() { print(f(3)); return 0; }")
+    return "\n".join(lines) + "\n"
+
+# Sums of numbers up to n, where each call returns the call to itself that
+# goes on with the rest, so every call is in tail position.
+def accumulator_program(n):
+    return ("int sum(int n, int acc) {\n"
+            "if (n == 0) { return acc; }\n"
+            "return sum(n - 1, acc + n); }\n"
+            "int steps(int a, int b, int n) {\n"
+            "if (n < 1) { return a; }\n"
+            "return steps(b, a + b, n - 1); }\n"
+            "int main() { print(sum(%d, 0)); print(steps(0, 1, %d)); "
+            "return 0; }\n" % (n, min(n, 90)))
+
+# The number of instructions and of conditional branches in the IR of
+# programs before optimizing and after each pass of the highest level, the
+# number of instructions executed, of jumps and branches taken and of calls
+# when running them, and the time the optimizer takes per instruction.
+def bench_optimize(seed):
+    print("%-10s %-20s %8s %8s %9s %8s %6s" % ("program", "after", "instrs",
+          "branches", "executed", "taken", "calls"))
+    times = []
+    for name, source in (("seed", seed), ("ifs", branch_program(1000, False)),
+                         ("settings", settings_program(1000)),
+                         ("straight", straight_program(4000)),
+                         ("repeated", repeated_program(500)),
+                         ("helpers", helpers_program(500)),
+                         ("tail", accumulator_program(300))):
+        session = compiler.CompilationSession()
+        session.front_end(lexer.tokens(source))
+        program = session.translator.program
+        funcs = cfg.functions(optimize.copy(program))
+        expected = run_ir(program)[0]
+        def count(after):
+            program = cfg.program(funcs)
+            output, executed, taken, calls = run_ir(program)
+            if output != expected:
+                print("The optimized program prints something else!")
+                sys.exit(1)
+            print("%-10s %-20s %8d %8d %9d %8d %6d" % (name, after,
+                  len(program), sum(instr.op in ir_instr.branches
+                                    for instr in program),
+                  executed, taken, calls))
+        count("translation")
+        for level, run in optimize.program_passes:
+            run(funcs, inline.default_threshold)
+            count(run.__name__)
+        for level, run in optimize.passes:
+            for func in funcs:
+                run(func)
+            count(run.__name__)
+        elapsed = best_time(optimize.optimize, program, optimize.max_level)
+        times.append((name, elapsed / len(program) * 1e6))
+    print()
+    print("%-10s %14s" % ("program", "time (us/i)"))
+    for name, elapsed in times:
+        print("%-10s %14.2f" % (name, elapsed))
+    # Compilers with inlining thresholds of their own, used from several
+    # threads at once, each compile as they do on their own.
+    source = helpers_program(100)
+    compilers = [compiler.Compiler(opt_level=3, inline_threshold=threshold)
+                 for threshold in (0, inline.default_threshold)]
+    expected = [c.compile(source) for c in compilers]
+    if expected[0] == expected[1]:
+        print("The inlining threshold makes no difference!")
+        sys.exit(1)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        threaded = list(pool.map(lambda c: c.compile(source), compilers * 20))
+    if threaded != expected * 20:
+        print("Compilers with different inlining thresholds interfere!")
+        sys.exit(1)
+
+# Assemble, link and run the assembly of a program. Returns the time it
+# takes, what it prints and its exit status (negative for a signal).
+def run_native(asm):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "program")
+    with open(path + ".s", 'w') as file:
+        file.write(asm)
+    for command in (["as", path + ".s", "-o", path + ".o"],
+                    ["ld", path + ".o", "-o", path]):
+        subprocess.run(command, check=True)
+    start = time.perf_counter()
+    result = subprocess.run([path], capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    for name in (path + ".s", path + ".o", path):
+        os.remove(name)
+    os.rmdir(directory)
+    return elapsed, result.stdout, result.returncode
+
+# Run recursions that only make tail calls, deeper and deeper, without and
+# with tail call elimination. Without it the stack grows by a frame per
+# call until the program crashes, with it the stack doesn't grow. The seed
+# program is not used.
+def bench_tail(seed):
+    if not shutil.which("as") or not shutil.which("ld"):
+        print("Running the programs needs as and ld.")
+        sys.exit(1)
+    print("%10s %6s %10s" % ("calls", "level", "time (s)"))
+    for n in (10 ** 4, 10 ** 6, 10 ** 7):
+        source = accumulator_program(n)
+        for level in (0, 2):
+            asm = compiler.Compiler(opt_level=level).compile(source)
+            elapsed, output, status = run_native(asm)
+            if status < 0:
+                print("%10d %6d %10s" % (n, level, "crashed"))
+                continue
+            if output.split()[0] != str(n * (n + 1) // 2):
+                print("The program printed the wrong sum!")
+                sys.exit(1)
+            print("%10d %6d %10.2f" % (n, level, elapsed))
+
+# Programs the code generator of the first version got wrong, with what they
+# print. It kept the temporaries on the stack with pushq and popq, so that a
+# condition on two temporaries popped them twice and the temporaries passed
+# to a call came in the wrong order (the first two printed 2 and -1). It
+# cleared %rdx instead of sign extending %rax before idivq, so that a
+# negative dividend was divided as a huge positive one, and a function that
+# ended without a return ran into the code after it (the last one crashed).
+wrong_code_programs = [
+    ("condition", "int main() { int x = 1; int y = 0;\n"
+     "if (x + 1 > y + 1) { y = 1; } else { y = 2; }\n"
+     "print(y); return 0; }\n", "1\n"),
+    ("arguments", "int sub(int a, int b) { return a - b; }\n"
+     "int main() { int x = 2; print(sub(x + 1, x)); return 0; }\n", "1\n"),
+    ("division", "int half(int a) { if (a < 0) { return a / 2; } }\n"
+     "int main() { print(half(0 - 28) + half(5)); return 0; }\n", "-14\n")]
+
+# Run the programs the first code generator got wrong, at each optimization
+# level, and check what they print. The seed program is not used.
+def bench_codegen(seed):
+    if not shutil.which("as") or not shutil.which("ld"):
+        print("Running the programs needs as and ld.")
+        sys.exit(1)
+    print("%-10s %6s %8s %8s" % ("program", "level", "expected", "printed"))
+    for name, source, expected in wrong_code_programs:
+        for level in range(optimize.max_level + 1):
+            asm = compiler.Compiler(opt_level=level).compile(source)
+            elapsed, output, status = run_native(asm)
+            print("%-10s %6d %8s %8s" % (name, level, expected.strip(),
+                                         output.strip() or status))
+            if output != expected or status:
+                print("The program printed the wrong value!")
+                sys.exit(1)
+
+# The constants and dividends strength reduction is checked with: 0, 1, -1,
+# powers of two and their neighbours, the ends of the 32 and 64 bit ranges
+# and a few others, with their negations.
+def edge_values():
+    values = set([0, 1, 3, 5, 7, 9, 10, 24, 45, 100, 641, 1000000007,
+                   2 ** 31 - 1, 2 ** 62 + 1, 6700417])
+    for k in (1, 2, 3, 4, 8, 16, 31, 32, 62):
+        values.update([2 ** k - 1, 2 ** k, 2 ** k + 1])
+    values.update([-value for value in values])
+    values.update([2 ** 63 - 1, -2 ** 63, -2 ** 63 + 1])
+    return sorted(values)
+
+# An int literal, which can't be the smallest integer, but can be an
+# expression for it.
+def literal(value):
+    if value == -2 ** 63:
+        return "(-9223372036854775807 - 1)"
+    return "(%d)" % value if value < 0 else str(value)
+
+# Functions that print x times and divided by each constant, called with
+# each dividend (except 0 and -1 as divisors, on which idivq traps).
+def strength_program(constants, values):
+    lines = []
+    for i, c in enumerate(constants):
+        lines.append("int f%d(int x) { print(x * %s);" % (i, literal(c)))
+        if c != 0 and c != -1:
+            lines.append("print(x / %s);" % literal(c))
+        lines.append("return 0; }")
+    lines.append("int main() {")
+    for value in values:
+        for i in range(len(constants)):
+            lines.append("f%d(%s);" % (i, literal(value)))
+    lines.append("return 0; }")
+    return "\n".join(lines) + "\n"
+
+# The values strength_program() prints, computed as the IR would.
+def strength_output(constants, values):
+    output = []
+    for value in values:
+        for c in constants:
+            output.append(ir_instr.fold(ir_instr.MUL, value, c))
+            if c != 0 and c != -1:
+                output.append(ir_instr.fold(ir_instr.DIV, value, c))
+    return "".join("%d\n" % value for value in output)
+
+# A loop, as a recursion of tail calls, that multiplies and divides by
+# constants on each step.
+def divisions_program(n):
+    return ("int f(int n, int s) { if (n == 0) { return s; }\n"
+            "return f(n - 1, s + n / 7 - n / 16 + n * 10 - n / (-1000) + "
+            "(s / 3) * 5 - s * 24 - n * 4); }\n"
+            "int main() { print(f(%d, 0)); return 0; }\n" % n)
+
+# The assembly of the optimized IR of a session with and without strength
+# reduction.
+def strength_asm(session):
+    asms = []
+    for opt_level in (0, 1):
+        generator = codegen.CodeGen(opt_level=opt_level)
+        generator.code_gen(session.program)
+        asms.append(generator.asm())
+    return asms
+
+# Differential test of the strength reduction of multiplications and
+# divisions by constants against imulq and idivq, on edge values, then the
+# time a loop that multiplies and divides by constants takes with and
+# without it. The seed program is not used.
+def bench_strength(seed):
+    if not shutil.which("as") or not shutil.which("ld"):
+        print("Running the programs needs as and ld.")
+        sys.exit(1)
+    values = edge_values()
+    for start in range(0, len(values), 16):
+        constants = values[start:start + 16]
+        session = compiler.CompilationSession(opt_level=2)
+        session.compile_tokens(lexer.tokens(strength_program(constants,
+                                                              values)))
+        expected = strength_output(constants, values)
+        for asm in strength_asm(session):
+            elapsed, output, status = run_native(asm)
+            if output != expected:
+                print("Strength reduction gave a different result!")
+                sys.exit(1)
+    print("%d constants, %d dividends: same results" % (len(values),
+                                                        len(values)))
+    session = compiler.CompilationSession(opt_level=2)
+    session.compile_tokens(lexer.tokens(divisions_program(10 ** 7)))
+    print("%8s %10s %8s" % ("reduced", "time (s)", "idivq"))
+    outputs = set()
+    for opt_level, asm in enumerate(strength_asm(session)):
+        elapsed, output, status = run_native(asm)
+        outputs.add(output)
+        print("%8s %10.2f %8d" % (("no", "yes")[opt_level], elapsed,
+                                  asm.count("idivq")))
+    if len(outputs) != 1:
+        print("Strength reduction gave a different result!")
+        sys.exit(1)
+
+# The peephole rules that apply to the code of a corpus of programs,
+# optimized at -O2: the lines of assembly without and with the peephole
+# optimizer, and the hits of each rule. With as and ld, the programs are
+# also run, and have to print the same with and without it.
+def bench_peephole(seed):
+    native = shutil.which("as") and shutil.which("ld")
+    hits = dict()
+    print("%-10s %8s %8s" % ("program", "before", "after"))
+    for name, source in (("seed", seed), ("stress", stress_program(50, 500,
+                                                                   20)),
+                         ("settings", settings_program(300)),
+                         ("straight", straight_program(1000)),
+                         ("repeated", repeated_program(100)),
+                         ("helpers", helpers_program(100)),
+                         ("tail", accumulator_program(1000)),
+                         ("divisions", divisions_program(1000))):
+        session = compiler.CompilationSession(opt_level=2)
+        session.compile_tokens(lexer.tokens(source))
+        generators = [codegen.CodeGen(opt_level=2) for i in range(2)]
+        generators[0].peephole = None
+        for generator in generators:
+            generator.code_gen(session.program)
+        for rule, count in generators[1].peephole.hits.items():
+            hits[rule] = hits.get(rule, 0) + count
+        print("%-10s %8d %8d" % (name, len(generators[0].program),
+                                 len(generators[1].program)))
+        if native and len(set(run_native(generator.asm())[1:]
+                              for generator in generators)) != 1:
+            print("The peephole optimizer changed what the program does!")
+            sys.exit(1)
+    print()
+    print("%-16s %8s" % ("rule", "hits"))
+    for rule, count in hits.items():
+        print("%-16s %8d" % (rule, count))
+
+benchmarks = { "lexer" : bench_lexer, "stream" : bench_stream,
+               "numpy" : bench_numpy, "stress" : bench_stress,
+               "parse" : bench_parse, "exp" : bench_exp,
+               "session" : bench_session, "ast" : bench_ast,
+               "dispatch" : bench_dispatch, "cache" : bench_cache,
+               "scopes" : bench_scopes, "parallel" : bench_parallel,
+               "incremental" : bench_incremental, "ir" : bench_ir,
+               "cfg" : bench_cfg, "optimize" : bench_optimize,
+               "tail" : bench_tail, "codegen" : bench_codegen,
+               "strength" : bench_strength, "peephole" : bench_peephole }
+
+default_seed_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 "input.txt")
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3) or sys.argv[1] not in benchmarks:
+        print("Usage: python benchmark.py [" + "|".join(benchmarks) +
+              "] [file]")
+        sys.exit(1)
+    path = sys.argv[2] if len(sys.argv) == 3 else default_seed_path
+    with open(path, 'r') as file:
+        seed = file.read()
+    benchmarks[sys.argv[1]](seed)
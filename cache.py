@@ -0,0 +1,194 @@
+###======================================================================###
+# Cache of the front end on disk. An entry holds the typed ast and the IR  #
+# of a program (see serialize.py), keyed on a hash of the source, so that  #
+# compiling an unchanged program goes straight to codegen. Incremental     #
+# compilation keeps entries for single functions in it too, see            #
+# incremental.py. The cache is a directory with one file per entry. It is  #
+# bounded in size, the entries used least recently are removed first, and  #
+# it is emptied when the compiler changes. Several processes can share a   #
+# cache directory. The total size of the entries is kept in a file, so     #
+# that it is only counted again when the cache is full.                    #
+###======================================================================###
+import hashlib
+import os
+import serialize
+import struct
+import sys
+import threading
+
+# The compiler is whatever the modules next to this one and the grammar
+# say it is, so the version of the compiler is a hash of all of them, which
+# no module can be left out of. The byte order is part of it since arrays
+# are written in the byte order of the machine.
+def version_files(directory):
+    names = [name for name in os.listdir(directory) if name.endswith(".py")]
+    return sorted(names) + ["productions.txt"]
+
+def compiler_version():
+    h = hashlib.sha256(sys.byteorder.encode())
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in version_files(directory):
+        h.update(name.encode() + b"\0")
+        with open(os.path.join(directory, name), 'rb') as file:
+            h.update(file.read())
+    return h.hexdigest()
+
+version = compiler_version()
+
+# An entry is the number of blobs and their lengths, followed by the blobs.
+count_header = struct.Struct("<I")
+
+default_max_size = 64 * 1024 * 1024 # Bytes.
+
+class Cache:
+    def __init__(self, path, max_size=default_max_size):
+        self.path = path
+        self.max_size = max_size
+        self.size_path = os.path.join(path, "size")
+        self.written = 0 # Bytes written since the size file was updated.
+        os.makedirs(path, exist_ok=True)
+        version_path = os.path.join(path, "version")
+        try:
+            with open(version_path, 'r') as file:
+                cached_version = file.read()
+        except OSError:
+            cached_version = None
+        if cached_version != version:
+            self.clear()
+            self.write_file(version_path, version.encode())
+
+    # The key of a source, which is bytes or a str.
+    def key(self, source):
+        if isinstance(source, str):
+            source = source.encode("utf-8")
+        return hashlib.sha256(version.encode() + source).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key + ".bin")
+
+    # The entries, as (time of last use, size, path), oldest first.
+    def entries(self):
+        result = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(".bin"):
+                try:
+                    stat = entry.stat()
+                except OSError: # Removed by another process.
+                    continue
+                result.append((stat.st_mtime, stat.st_size, entry.path))
+        result.sort()
+        return result
+
+    def clear(self):
+        for mtime, size, path in self.entries():
+            remove(path)
+        remove(self.size_path)
+
+    # Get the entry of a key, as a list of the bytes of its blobs, or None if
+    # there is no such entry. The time of last use of the entry is updated.
+    def read(self, key):
+        path = self.entry_path(key)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+            os.utime(path)
+        except OSError:
+            return None
+        try:
+            count, = count_header.unpack_from(data)
+            sizes = struct.unpack_from("<%dI" % count, data,
+                                       count_header.size)
+        except struct.error:
+            return None
+        pos = count_header.size + 4 * count
+        if pos + sum(sizes) != len(data):
+            return None
+        data = memoryview(data)
+        blobs = []
+        for size in sizes:
+            blobs.append(data[pos:pos + size])
+            pos += size
+        return blobs
+
+    # Store the blobs as the entry of a key. The cache is made to fit in
+    # max_size again, unless evict is False, evict() has to be called later
+    # then (when storing many entries at once).
+    def write(self, key, *blobs, evict=True):
+        sizes = struct.pack("<%dI" % len(blobs), *map(len, blobs))
+        self.write_file(self.entry_path(key), count_header.pack(len(blobs)),
+                        sizes, *blobs)
+        self.written += count_header.size + len(sizes) + sum(map(len, blobs))
+        if evict:
+            self.evict()
+
+    # Remove the entries used least recently until the cache fits in
+    # max_size. The entries are only listed when the size file says the
+    # cache may be too large. Replacing an entry counts it twice, and
+    # entries removed by other processes are still counted, which only makes
+    # the entries get listed sooner. Two processes updating the size at once
+    # can lose a write, which makes the cache grow past max_size by that
+    # much.
+    def evict(self):
+        try:
+            with open(self.size_path, 'r') as file:
+                size = int(file.read()) + self.written
+        except (OSError, ValueError):
+            size = None
+        if size is None or size > self.max_size:
+            entries = self.entries()
+            size = sum(entry[1] for entry in entries)
+            for mtime, entry_size, path in entries:
+                if size <= self.max_size:
+                    break
+                remove(path)
+                size -= entry_size
+        self.write_file(self.size_path, str(size).encode())
+        self.written = 0
+
+    # The IR of the program with the key, or None on a miss. A broken entry
+    # is a miss.
+    def load_ir(self, key):
+        entry = self.read(key)
+        if entry:
+            try:
+                return serialize.load_ir(entry[1])
+            except (ValueError, struct.error, IndexError):
+                remove(self.entry_path(key))
+        return None
+
+    # The typed ast of the program with the key, as an Arena with the root at
+    # handle 1 (see serialize.load_ast), or None on a miss.
+    def load_ast(self, key):
+        entry = self.read(key)
+        if entry:
+            try:
+                return serialize.load_ast(entry[0])
+            except (ValueError, struct.error, IndexError):
+                remove(self.entry_path(key))
+        return None
+
+    # Store the typed ast and the IR of a program.
+    def store(self, key, prog_ast, program):
+        self.write(key, serialize.dump_ast(prog_ast),
+                   serialize.dump_ir(program))
+
+    # Files are written to a temporary file that is then renamed, so that a
+    # reader never sees half an entry. The name of the temporary file is
+    # unique to the process and thread writing it, which is much cheaper
+    # than a random name from tempfile when many entries are written.
+    def write_file(self, path, *parts):
+        temp_path = "%s.%d-%d.tmp" % (path, os.getpid(), threading.get_ident())
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            data = memoryview(b"".join(parts))
+            while data:
+                data = data[os.write(fd, data):]
+        finally:
+            os.close(fd)
+        os.replace(temp_path, path)
+
+def remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,289 @@
+###======================================================================###
+# Control flow analysis of the IR. A program is split into its functions,  #
+# and the body of a function (the instructions between begin and end) into #
+# basic blocks, which make up its control flow graph. The graph gives the  #
+# blocks in reverse postorder, and the dominator tree, computed with the   #
+# algorithm of Cooper, Harvey and Kennedy, "A Simple, Fast Dominance       #
+# Algorithm". A function keeps its graph until its IR is changed:          #
+#   funcs = cfg.functions(program)                                         #
+#   for func in funcs:                                                     #
+#       graph = func.cfg()                                                 #
+#       ...                                                                #
+#       func.set_body(graph.instrs())                                      #
+#   program = cfg.program(funcs)                                           #
+###======================================================================###
+from ir_instr import BEGIN, END, LABEL, JUMP, RET, TEMP, branches
+
+# The instructions that end a block.
+terminators = frozenset((JUMP, RET) + branches)
+
+# A block is a run of instructions that is only entered at its first one
+# and only left after its last one. Its first instruction is its label, if
+# it has one, and its last one a branch, jump or return, unless it falls
+# through to the next block. The index of a block is its position in the
+# function.
+class Block:
+    __slots__ = ("index", "label", "instrs", "succs", "preds")
+
+    def __init__(self, index, label):
+        self.index = index
+        self.label = label # The Label operand, or None.
+        self.instrs = []
+        self.succs = []
+        self.preds = []
+
+    # The last instruction, if it ends the block.
+    def terminator(self):
+        if self.instrs and self.instrs[-1].op in terminators:
+            return self.instrs[-1]
+        return None
+
+# The control flow graph of the body of a function. The first block is the
+# entry, which has no label, so that no block branches to it (it is empty if
+# the body starts with a label). A block that returns, or falls through the
+# end of the function, has no successors. The successors of a conditional
+# branch are the block branched to and the next block, in that order, or
+# just one of them if they are the same block.
+class CFG:
+    def __init__(self, body):
+        self.blocks = []
+        self.label_blocks = dict() # Label operand -> block.
+        block = self.new_block(None)
+        for instr in body:
+            if instr.op == LABEL:
+                if block.instrs or block.label or block.index == 0:
+                    block = self.new_block(instr.dest)
+                else:
+                    block.label = instr.dest
+                self.label_blocks[instr.dest] = block
+            elif block.terminator():
+                block = self.new_block(None)
+            block.instrs.append(instr)
+        blocks = self.blocks
+        label_blocks = self.label_blocks
+        for block in blocks:
+            last = block.terminator()
+            succs = block.succs
+            if last is None or last.op != JUMP and last.op != RET:
+                if block.index + 1 < len(blocks):
+                    succs.append(blocks[block.index + 1])
+            if last and last.op != RET:
+                target = label_blocks[last.dest]
+                if target not in succs:
+                    succs.insert(0, target)
+            for succ in succs:
+                succ.preds.append(block)
+        self.order = None # The reachable blocks in reverse postorder.
+        self.idoms = None # The index of the immediate dominator of each block.
+        self.dom_children = None # Blocks immediately dominated by each block.
+        self.dom_pre = self.dom_post = None # Numbering of the dominator tree.
+        self.frontiers = None # The dominance frontier of each block.
+
+    def new_block(self, label):
+        block = Block(len(self.blocks), label)
+        self.blocks.append(block)
+        return block
+
+    # The instructions of the blocks, in order.
+    def instrs(self):
+        instrs = []
+        for block in self.blocks:
+            instrs.extend(block.instrs)
+        return instrs
+
+    # The blocks reachable from the entry, in reverse postorder: a block
+    # comes before its successors, except along back edges.
+    def rpo(self):
+        if self.order is None:
+            visited = [False] * len(self.blocks)
+            postorder = []
+            entry = self.blocks[0]
+            visited[0] = True
+            stack = [(entry, iter(entry.succs))]
+            while stack:
+                block, succs = stack[-1]
+                for succ in succs:
+                    if not visited[succ.index]:
+                        visited[succ.index] = True
+                        stack.append((succ, iter(succ.succs)))
+                        break
+                else:
+                    stack.pop()
+                    postorder.append(block)
+            postorder.reverse()
+            self.order = postorder
+        return self.order
+
+    # The index of the immediate dominator of each block, by index. The
+    # entry is its own immediate dominator, and unreachable blocks have
+    # None. Each pass over the blocks in reverse postorder intersects the
+    # dominators of the predecessors of a block, by walking up from both to
+    # their common dominator, until nothing changes. For a graph without
+    # loops one pass is enough.
+    def idom(self):
+        if self.idoms is None:
+            order = self.rpo()
+            number = [-1] * len(self.blocks) # Position in reverse postorder.
+            for i, block in enumerate(order):
+                number[block.index] = i
+            idoms = [None] * len(self.blocks)
+            idoms[0] = 0
+            changed = True
+            while changed:
+                changed = False
+                for block in order[1:]:
+                    new_idom = None
+                    for pred in block.preds:
+                        p = pred.index
+                        if idoms[p] is None:
+                            continue
+                        if new_idom is None:
+                            new_idom = p
+                            continue
+                        while p != new_idom:
+                            while number[p] > number[new_idom]:
+                                p = idoms[p]
+                            while number[new_idom] > number[p]:
+                                new_idom = idoms[new_idom]
+                    if idoms[block.index] != new_idom:
+                        idoms[block.index] = new_idom
+                        changed = True
+            self.idoms = idoms
+        return self.idoms
+
+    # The children of each block in the dominator tree, by index.
+    def dominator_tree(self):
+        if self.dom_children is None:
+            idoms = self.idom()
+            children = [[] for block in self.blocks]
+            for block in self.rpo()[1:]:
+                children[idoms[block.index]].append(self.blocks[block.index])
+            self.dom_children = children
+        return self.dom_children
+
+    # The dominance frontier of each block, by index: the blocks that it
+    # doesn't strictly dominate but dominates a predecessor of. A join block
+    # is in the frontier of each block from its predecessors up to, but not
+    # including, its immediate dominator.
+    def dominance_frontiers(self):
+        if self.frontiers is None:
+            idoms = self.idom()
+            frontiers = [[] for block in self.blocks]
+            for block in self.rpo():
+                if len(block.preds) < 2:
+                    continue
+                b = block.index
+                for pred in block.preds:
+                    runner = pred.index
+                    if idoms[runner] is None:
+                        continue
+                    while runner != idoms[b]:
+                        frontier = frontiers[runner]
+                        if not frontier or frontier[-1] is not block:
+                            frontier.append(block)
+                        runner = idoms[runner]
+            self.frontiers = frontiers
+        return self.frontiers
+
+    # Whether block a dominates block b (every block dominates itself). The
+    # dominator tree is numbered in preorder and postorder, a dominates b
+    # when b is numbered within a in both.
+    def dominates(self, a, b):
+        if self.dom_pre is None:
+            children = self.dominator_tree()
+            pre = [-1] * len(self.blocks)
+            post = [-1] * len(self.blocks)
+            counter = 0
+            stack = [(self.blocks[0], False)]
+            while stack:
+                block, done = stack.pop()
+                if done:
+                    post[block.index] = counter
+                else:
+                    pre[block.index] = counter
+                    stack.append((block, True))
+                    for child in children[block.index]:
+                        stack.append((child, False))
+                counter += 1
+            self.dom_pre = pre
+            self.dom_post = post
+        pre = self.dom_pre
+        post = self.dom_post
+        return pre[b.index] >= 0 and pre[a.index] <= pre[b.index] and \
+            post[b.index] <= post[a.index]
+
+################################################################################
+
+# A function of a program: its begin and end instructions and the
+# instructions in between. Its graph is made when it is first asked for, and
+# made again after the body has been changed, with set_body(), or changed in
+# place, which has to be told with changed().
+class Function:
+    __slots__ = ("begin", "body", "end", "version", "graph", "graph_version")
+
+    def __init__(self, begin, body, end):
+        self.begin = begin
+        self.body = body
+        self.end = end
+        self.version = 0
+        self.graph = None
+        self.graph_version = -1
+
+    # The name of the function, an interned id.
+    def name(self):
+        return self.begin.dest.name
+
+    def cfg(self):
+        if self.graph_version != self.version:
+            self.graph = CFG(self.body)
+            self.graph_version = self.version
+        return self.graph
+
+    def set_body(self, body):
+        self.body = body
+        self.version += 1
+
+    def changed(self):
+        self.version += 1
+
+    # The number of temporaries of the function, one more than the largest
+    # id, and the same for labels.
+    def nbr_temps(self):
+        count = 0
+        for instr in self.body:
+            for op in (instr.dest, instr.src1, instr.src2):
+                if op and op.kind == TEMP and op.id >= count:
+                    count = op.id + 1
+            if instr.args:
+                for op in instr.args:
+                    if op.kind == TEMP and op.id >= count:
+                        count = op.id + 1
+        return count
+
+    def nbr_labels(self):
+        count = 0
+        for instr in self.body:
+            if instr.op == LABEL and instr.dest.id >= count:
+                count = instr.dest.id + 1
+        return count
+
+# The functions of a program.
+def functions(program):
+    funcs = []
+    begin = 0
+    for i, instr in enumerate(program):
+        if instr.op == BEGIN:
+            begin = i
+        elif instr.op == END:
+            funcs.append(Function(program[begin], program[begin + 1:i],
+                                  instr))
+    return funcs
+
+# The program made of functions.
+def program(funcs):
+    instrs = []
+    for func in funcs:
+        instrs.append(func.begin)
+        instrs.extend(func.body)
+        instrs.append(func.end)
+    return instrs
@@ -4,295 +4,358 @@
 # However(!!!) I wouldn't trust it. For anything but the simplest programs #
 # the current codegen is very, very messy. (It does not like recursion.)   #
 ###======================================================================###
+from dispatch import Pass, handles
+from errors import CompileError
+from ir_instr import (BEGIN, END, LABEL, JUMP, BL, BLE, BG, BGE, BEQ, BNE, MOV,
+                      ADD, SUB, MUL, DIV, CALL, RET, CONST, TEMP)
+import peephole
+import symbols
 
 ws = "         " # White space to align instructions in a nice column.
-program = []
-program.append(".global _start")
-program.append(".data")
-program.append("buf: .skip 1024") # Buffer for the pring function.
-program.append(".text")
 
-def code_gen(ir_code):
-    call_print = False
-    current_nbr_locals = 0 # Used to avoid seg fault.
-    is_main = False # Used to call sys_exit on return from main.
-    for i in ir_code:
-        if i.op == "begin":
-            if i.dest.func_name == "main":
-                program.append("_start:")
-                is_main = True
-            else:
-                program.append("\n" + i.dest.func_name + ":")
-            program.append(ws + "pushq %rbp")
-            program.append(ws + "movq %rsp, %rbp")
-            if i.dest.nbr_locals > 0:
-                current_nbr_locals = i.dest.nbr_locals
-                size = str(8*current_nbr_locals)
-                program.append(ws + "subq $" + size + ", %rsp")
-        elif i.op == "CALL":
-            call_print = gen_call_instr(i, call_print)
-        elif (i.op == "bl" or i.op == "ble" or i.op == "bg" or i.op == "bge"
-              or i.op == "beq" or i.op == "bne"):
-              gen_conditional_branch(i)
-        elif i.op == "b":
-            program.append(ws + "jmp " + i.dest.name)
-        elif i.op == "label":
-            program.append(i.dest.name + ":")
-        elif i.op == "mov":
-            gen_mov(i)
-        elif i.op == "add" or i.op == "sub" or i.op == "mul" or i.op == "div":
-            gen_arithmetic(i)
-        elif i.op == "ret":
-            if is_main:
-                program.append(ws + "movq $0, %rdi")
-                program.append(ws + "movq $60, %rax") # sys_exit
-                program.append(ws + "syscall")
-            else:
-                if i.dest.val:
-                    program.append(ws + "movq $" + i.dest.val + ", %rax")
-                elif i.dest.func_name:
-                    gen_call_operand(i.dest)
-                elif i.dest.temp_var:
-                    program.append(ws + "popq %rax")
-                elif i.dest.name:
-                    dest = str(8 * i.dest.local_index)
-                    program.append(ws + "movq " + dest + "(%rbp), %rax")
-                if current_nbr_locals > 0:
-                    program.append(ws + "movq %rbp, %rsp")
-                program.append(ws + "popq %rbp")
-                program.append(ws + "ret")
+# The instructions of the arithmetic ops, on %rax and %rbx. The dividend is
+# sign extended into %rdx, so that division truncates like in C.
+arithmetic_instrs = { ADD : [ws + "addq %rbx, %rax"],
+                      SUB : [ws + "subq %rbx, %rax"],
+                      MUL : [ws + "imulq %rbx, %rax"],
+                      DIV : [ws + "cqto", ws + "idivq %rbx"] }
+
+# The jump instruction for each branch op.
+jumps = { BL : "jl", BLE : "jle", BG : "jg", BGE : "jge", BEQ : "je",
+          BNE : "jne" }
+
+# The first lines of every program.
+header = [".global _start",
+          ".data",
+          "buf: .skip 1024", # Buffer for the pring function.
+          ".text"]
 
+# Constants that fit in the 32 bit immediate of most instructions.
+def is_imm32(val):
+    return -0x80000000 <= val <= 0x7fffffff
 
-    if call_print:
-        output_asm_func()
+# The scale of the lea that multiplies a register by 3, 5 or 9, by adding it
+# to itself scaled.
+lea_scales = { 3 : 2, 5 : 4, 9 : 8 }
 
-# Generate code for move instructions.
-def gen_mov(instr):
-    dest = str(8 * instr.dest.local_index)
-    if instr.src1.val:
-        program.append(ws + "movq $" + instr.src1.val + ", " + dest + "(%rbp)")
-    elif instr.src1.func_name:
-        gen_call_operand(instr.src1)
-        program.append(ws + "movq %rax, " + dest + "(%rbp)")
-    elif instr.src1.temp_var:
-        program.append(ws + "popq " + dest + "(%rbp)")
-    elif instr.src1.name:
-        address = str(8 * instr.src1.local_index)
-        program.append(ws + "movq " + address + "(%rbp), %rax")
-        program.append(ws + "movq %rax, " + dest + "(%rbp)")
+# The instructions that multiply %rax by the constant c, with shifts and
+# leas, or None if imulq is better, which is when they take more than two
+# instructions (imulq takes three cycles, a shift or a lea one). The result
+# wraps around in 64 bits like that of imulq.
+def multiply_instrs(c):
+    if c == 0:
+        return [ws + "movq $0, %rax"]
+    m = abs(c)
+    shift = (m & -m).bit_length() - 1
+    odd = m >> shift
+    instrs = []
+    for factor in (9, 5, 3):
+        while odd % factor == 0 and odd > 1:
+            instrs.append(ws + "leaq (%%rax,%%rax,%d), %%rax" %
+                          lea_scales[factor])
+            odd //= factor
+    if odd != 1:
+        return None
+    if shift:
+        instrs.append(ws + "salq $%d, %%rax" % shift)
+    if c < 0:
+        instrs.append(ws + "negq %rax")
+    return instrs if len(instrs) <= 2 else None
 
-def gen_arithmetic(instr):
-    src1 = instr.src1
-    src2 = instr.src2
+# The magic number and shift for signed division by d, where 2 < d < 2**63
+# isn't a power of two (see Hacker's Delight, 10-1): the quotient of n is
+# the high 64 bits of magic*n (plus n if magic is negative), shifted right
+# by shift, plus one if that is negative, which rounds toward zero.
+def division_magic(d):
+    two63 = 1 << 63
+    anc = two63 - 1 - two63 % d # The largest n with n % d == d - 1.
+    p = 63
+    q1, r1 = divmod(two63, anc)
+    q2, r2 = divmod(two63, d)
+    while True:
+        p += 1
+        q1, r1 = 2 * q1, 2 * r1
+        if r1 >= anc:
+            q1, r1 = q1 + 1, r1 - anc
+        q2, r2 = 2 * q2, 2 * r2
+        if r2 >= d:
+            q2, r2 = q2 + 1, r2 - d
+        delta = d - r2
+        if not (q1 < delta or (q1 == delta and r1 == 0)):
+            break
+    magic = q2 + 1
+    if magic >= two63:
+        magic -= 1 << 64
+    return magic, p - 64
 
-    # We want src1 in rax, and src2 in rbx.
-    if src1.temp_var and src2.temp_var:
-        program.append(ws + "popq %rbx")
-        program.append(ws + "popq %rax")
-    elif src1.temp_var:
-        if src2.val:
-            program.append(ws + "movq $" + src2.val + ", %rbx")
-            program.append(ws + "popq %rax")
-        elif src2.func_name:
-            gen_call_operand(src2)
-            program.append(ws + "movq %rax, %rbx")
-            program.append(ws + "popq %rax")
-        elif src2.name:
-            address = str(8 * src2.local_index)
-            program.append(ws + "movq " + address + "(%rbp), %rbx")
-            program.append(ws + "popq %rax")
-    elif src2.temp_var:
-        if src1.val:
-            program.append(ws + "movq $" + src1.val + ", %rax")
-            program.append(ws + "popq %rbx")
-        elif src1.func_name:
-            gen_call_operand(src1)
-            program.append(ws + "popq %rbx")
-        elif src1.name:
-            address = str(8 * src1.local_index)
-            program.append(ws + "movq " + address + "(%rbp), %rax")
-            program.append(ws + "popq %rbx")
+# The instructions that divide %rax by the constant d, truncating like
+# idivq, or None if idivq is kept: by 0 and -1, idivq traps (on 0 and on
+# the smallest integer divided by -1), and so does the program.
+def divide_instrs(d):
+    if d == 0 or d == -1:
+        return None
+    m = abs(d)
+    k = m.bit_length() - 1
+    if m == 1:
+        instrs = []
+    elif m == 1 << k:
+        # Negative dividends are biased by m - 1 to round toward zero.
+        instrs = [ws + "movq %rax, %rdx"]
+        if k > 1:
+            instrs.append(ws + "sarq $63, %rdx")
+        instrs.extend([ws + "shrq $%d, %%rdx" % (64 - k),
+                       ws + "addq %rdx, %rax",
+                       ws + "sarq $%d, %%rax" % k])
     else:
-        if src1.val:
-            program.append(ws + "movq $" + src1.val + ", %rax")
-        elif src1.func_name:
-            gen_call_operand(src1)
-        elif src1.name:
-            address = str(8 * src1.local_index)
-            program.append(ws + "movq " + address + "(%rbp), %rax")
+        magic, shift = division_magic(m)
+        instrs = []
+        if magic < 0:
+            instrs.append(ws + "movq %rax, %rcx")
+        instrs.extend([ws + "movq $%d, %%rdx" % magic,
+                       ws + "imulq %rdx"]) # The high 64 bits go in %rdx.
+        if magic < 0:
+            instrs.append(ws + "addq %rcx, %rdx")
+        if shift:
+            instrs.append(ws + "sarq $%d, %%rdx" % shift)
+        instrs.extend([ws + "movq %rdx, %rax",
+                       ws + "shrq $63, %rax",
+                       ws + "addq %rdx, %rax"])
+    if d < 0:
+        instrs.append(ws + "negq %rax")
+    return instrs
 
-        if src2.val:
-            program.append(ws + "movq $" + src2.val + ", %rbx")
-        elif src2.func_name:
-            program.append(ws + "pushq %rax")
-            gen_call_operand(src2)
-            program.append(ws + "movq %rax, %rbx")
-            program.append(ws + "popq %rax")
-        elif src2.name:
-            address = str(8 * src2.local_index)
-            program.append(ws + "movq " + address + "(%rbp), %rbx")
+# The state of generating code for one program: the lines of assembly, and
+# what is known about the function being generated. The handlers are keyed
+# on the op of the IR instructions. Without the header, the lines are only
+# those of the functions, see parallel.py.
+# Variables and temporaries live in the stack frame of the function: the
+# params above %rbp, then the locals below it and the temporaries below
+# them. The size of the frame is known once the whole function has been
+# generated, so the lines of a function are kept apart until its end.
+# From opt_level 1 on, multiplications and divisions by constants are
+# strength reduced, and the code of each function goes through a peephole
+# optimizer (see peephole.py), whose rules can be changed.
+class CodeGen(Pass):
+    def __init__(self, with_header=True, opt_level=0):
+        super().__init__()
+        self.reduce_strength = opt_level >= 1
+        self.peephole = peephole.Peephole() if opt_level >= 1 else None
+        self.call_print = False # The print function is added if it's used.
+        self.current_nbr_locals = 0 # Used to avoid seg fault.
+        self.nbr_temps = 0 # The temporaries of the function, so far.
+        self.temp_base = 0
+        self.is_main = False # Used to call sys_exit on return from main.
+        self.label_prefix = ".L"
+        self.code = [] # The lines of the function being generated.
+        self.ret_end = 0 # Where the code of the last return ends.
+        self.program = list(header) if with_header else []
 
-    if instr.op == "add":
-        program.append(ws + "addq %rbx, %rax")
-    elif instr.op == "sub":
-        program.append(ws + "subq %rbx, %rax")
-    elif instr.op == "mul":
-        program.append(ws + "imulq %rbx, %rax")
-    elif instr.op == "div":
-        program.append(ws + "xor %rdx, %rdx")
-        program.append(ws + "idivq %rbx")
+    # Instructions are generated by the handler of their op. The print
+    # function is added after them if it is used, unless print_func is False.
+    def code_gen(self, ir_code, print_func=True):
+        dispatch = self.dispatch
+        for i in ir_code:
+            dispatch[i.op](i)
+        if self.call_print and print_func:
+            self.output_asm_func()
 
-    program.append(ws + "pushq %rax") # Store the temp on stack.
+    # The address of a variable or temporary in the stack frame.
+    def address(self, op):
+        if op.kind == TEMP:
+            if op.id >= self.nbr_temps:
+                self.nbr_temps = op.id + 1
+            return "%d(%%rbp)" % (self.temp_base - 8 * op.id)
+        return "%d(%%rbp)" % (8 * op.local_index)
 
-# Generate code for branch instructions.
-def gen_conditional_branch(instr):
-    src1 = instr.src1
-    src2 = instr.src2
+    # The line that loads an operand into a register.
+    def load(self, op, register):
+        if op.kind == CONST:
+            return "%smovq $%d, %s" % (ws, op.val, register)
+        if op.kind == TEMP:
+            return "%smovq %d(%%rbp), %s" % (ws, self.temp_base - 8 * op.id,
+                                             register)
+        return "%smovq %d(%%rbp), %s" % (ws, 8 * op.local_index, register)
 
-    if src1.temp_var and src2.temp_var:
-        program.append(ws + "popq %r9")
-        program.append(ws + "popq %r8")
+    @handles(BEGIN)
+    def gen_begin(self, instr):
+        self.is_main = instr.dest.name == symbols.MAIN
+        self.current_nbr_locals = instr.src1.val
+        self.temp_base = -8 * (self.current_nbr_locals + 1) # Of t0.
+        self.nbr_temps = 0
+        self.label_prefix = ".L" + symbols.text(instr.dest.name) + "_"
+        self.code = []
+        self.ret_end = -1
 
-    if src1.val:
-        program.append(ws + "movq $" + src1.val + ", %r8")
-    elif src1.func_name:
-        gen_call_operand(src1)
-        program.append(ws + "movq %rax, %r8")
-    elif src1.temp_var:
-        program.append(ws + "popq %r8")
-    elif src1.name:
-        address = str(8 * src1.local_index)
-        program.append(ws + "movq " + address + "(%rbp), %r8")
+    # The prologue is generated at the end of the function, once the size
+    # of its frame is known. A function that doesn't end with a return
+    # returns 0.
+    @handles(END)
+    def gen_end(self, instr):
+        program = self.program
+        if self.ret_end != len(self.code):
+            self.gen_return(None)
+        if self.peephole:
+            self.code = self.peephole.optimize(self.code)
+        if self.is_main:
+            program.append("_start:")
+        else:
+            name = symbols.text(instr.dest.name)
+            program.append("\n" + name + ":")
+        program.append(ws + "pushq %rbp")
+        program.append(ws + "movq %rsp, %rbp")
+        size = self.current_nbr_locals + self.nbr_temps
+        if size > 0:
+            program.append(ws + "subq $" + str(8 * size) + ", %rsp")
+        program.extend(self.code)
+        self.code = []
 
-    if src2.val:
-        program.append(ws + "movq $" + src2.val + ", %r9")
-    elif src2.func_name:
-        gen_call_operand(src2)
-        program.append(ws + "movq %rax, %r9")
-    elif src2.temp_var:
-        program.append(ws + "popq %r9")
-    elif src2.name:
-        address = str(8 * src2.local_index)
-        program.append(ws + "movq " + address + "(%rbp), %r9")
+    @handles(JUMP)
+    def gen_jump(self, instr):
+        self.code.append(ws + "jmp " + self.label_prefix + str(instr.dest.id))
 
-    program.append(ws + "cmpq %r9, %r8")
-    opcode = instr.op
-    label = instr.dest.name
-    if opcode == "bl":
-        program.append(ws + "jl " + label)
-    elif opcode == "ble":
-        program.append(ws + "jle " + label)
-    elif opcode == "bg":
-        program.append(ws + "jg " + label)
-    elif opcode == "bge":
-        program.append(ws + "jge " + label)
-    elif opcode == "beq":
-        program.append(ws + "je " + label)
-    elif opcode == "bne":
-        program.append(ws + "jne " + label)
+    @handles(LABEL)
+    def gen_label(self, instr):
+        self.code.append(self.label_prefix + str(instr.dest.id) + ":")
 
-# Generate code for call instructions.
-def gen_call_instr(instr, call_print):
-    if instr.dest.func_name == "print":
-        call_print = True
-        arg = instr.dest.args[0]
-        if arg.val:
-            program.append(ws + "movq $" + arg.val + ", %rax")
-            program.append(ws + "pushq %rax")
-            program.append(ws + "call print")
-            program.append(ws + "addq $8, %rsp")
-        elif arg.func_name:
-            gen_call_operand(arg)
-            program.append(ws + "pushq %rax")
-            program.append(ws + "call print")
-            program.append(ws + "addq $8, %rsp")
-        elif arg.temp_var:
-            program.append(ws + "call print")
-            program.append(ws + "addq $8, %rsp")
-        elif arg.name:
-            address = str(8 * arg.local_index)
-            program.append(ws + "movq " + address + "(%rbp), %rax")
-            program.append(ws + "pushq %rax")
-            program.append(ws + "call print")
-            program.append(ws + "addq $8, %rsp")
-    else:
-        for arg in reversed(instr.dest.args):
-            if arg.val:
-                program.append(ws + "movq $" + arg.val + ", %rax")
-                program.append(ws + "pushq %rax")
-            elif arg.func_name:
-                gen_call_operand(arg)
-                program.append(ws + "pushq %rax")
-            elif arg.name and not arg.temp_var:
-                address = str(8*arg.local_index)
-                program.append(ws + "movq " + address + "(%rbp), %rax")
-                program.append(ws + "pushq %rax")
-        program.append(ws + "call " + instr.dest.func_name)
-        if instr.dest.args:
-            size = str(8*len(instr.dest.args))
-            program.append(ws + "addq $" + size + ", %rsp")
-    return call_print
+    @handles(RET)
+    def gen_ret(self, instr):
+        self.gen_return(instr.dest)
 
-# Generate code for calls that are operands.
-def gen_call_operand(op):
-    if op.func_name == "print":
-        print("Codegen failed. Print is void.")
-        sys.exit()
-    else:
-        for arg in reversed(op.args):
-            if arg.val:
-                program.append(ws + "movq $" + arg.val + ", %rax")
-                program.append(ws + "pushq %rax")
-            elif arg.func_name:
-                gen_call_operand(arg)
-                program.append(ws + "pushq %rax")
-            elif arg.name and not arg.temp_var:
-                address = str(8*arg.local_index)
-                program.append(ws + "movq " + address + "(%rbp), %rax")
-                program.append(ws + "pushq %rax")
-        program.append(ws + "call " + op.func_name)
-        if op.args:
-            size = str(8*len(op.args))
-            program.append(ws + "addq $" + size + ", %rsp")
+    # Return the value of op, or 0 if op is None.
+    def gen_return(self, op):
+        code = self.code
+        if self.is_main:
+            code.append(ws + "movq $0, %rdi")
+            code.append(ws + "movq $60, %rax") # sys_exit
+            code.append(ws + "syscall")
+        else:
+            if op is None:
+                code.append(ws + "movq $0, %rax")
+            else:
+                code.append(self.load(op, "%rax"))
+            code.append(ws + "movq %rbp, %rsp")
+            code.append(ws + "popq %rbp")
+            code.append(ws + "ret")
+        self.ret_end = len(code)
+
+    # Generate code for move instructions.
+    @handles(MOV)
+    def gen_mov(self, instr):
+        code = self.code
+        src1 = instr.src1
+        if src1.kind == CONST and is_imm32(src1.val):
+            code.append(ws + "movq $" + str(src1.val) + ", "
+                        + self.address(instr.dest))
+        else:
+            code.append(self.load(src1, "%rax"))
+            code.append(ws + "movq %rax, " + self.address(instr.dest))
+
+    # We want src1 in rax, and src2 in rbx. The result is stored from rax.
+    # A constant that is multiplied by or divided by may be done with the
+    # instructions for it instead, on rax alone.
+    @handles(ADD, SUB, MUL, DIV)
+    def gen_arithmetic(self, instr):
+        code = self.code
+        load = self.load
+        op = instr.op
+        src1 = instr.src1
+        src2 = instr.src2
+        instrs = None
+        if self.reduce_strength:
+            if op == MUL and src1.kind == CONST and src2.kind != CONST:
+                src1, src2 = src2, src1
+            if src2.kind == CONST:
+                if op == MUL:
+                    instrs = multiply_instrs(src2.val)
+                elif op == DIV:
+                    instrs = divide_instrs(src2.val)
+        code.append(load(src1, "%rax"))
+        if instrs is None:
+            code.append(load(src2, "%rbx"))
+            code.extend(arithmetic_instrs[op])
+        else:
+            code.extend(instrs)
+        code.append(ws + "movq %rax, " + self.address(instr.dest))
+
+    # Generate code for branch instructions.
+    @handles(BL, BLE, BG, BGE, BEQ, BNE)
+    def gen_conditional_branch(self, instr):
+        code = self.code
+        code.append(self.load(instr.src1, "%r8"))
+        code.append(self.load(instr.src2, "%r9"))
+        code.append(ws + "cmpq %r9, %r8")
+        code.append(ws + jumps[instr.op] + " " + self.label_prefix
+                    + str(instr.dest.id))
+
+    # Generate code for call instructions. The arguments are pushed from
+    # the last to the first, and the result is stored from rax.
+    @handles(CALL)
+    def gen_call(self, instr):
+        code = self.code
+        name = instr.src1.name
+        if name == symbols.PRINT:
+            if instr.dest:
+                raise CompileError("Codegen failed. Print is void.")
+            self.call_print = True
+        for arg in reversed(instr.args):
+            if arg.kind == CONST:
+                if is_imm32(arg.val):
+                    code.append(ws + "pushq $" + str(arg.val))
+                else:
+                    code.append(self.load(arg, "%rax"))
+                    code.append(ws + "pushq %rax")
+            else:
+                code.append(ws + "pushq " + self.address(arg))
+        code.append(ws + "call " + symbols.text(name))
+        if instr.args:
+            code.append(ws + "addq $" + str(8 * len(instr.args)) + ", %rsp")
+        if instr.dest:
+            code.append(ws + "movq %rax, " + self.address(instr.dest))
+
+    # This function add a function written in assembly, which converts an
+    # integer to a sequence of characters and sends it to sys_write.
+    def output_asm_func(self):
+        program = self.program
+        program.append("\nprint:")
+        program.append(ws + "pushq %rbp")
+        program.append(ws + "movq %rsp, %rbp")
+        program.append(ws + "movq 16(%rbp), %rax")
+        program.append(ws + "leaq buf(%rip), %rsi")
+        program.append(ws + "addq $1023, %rsi") # buf is filled-in lsd first
+        program.append(ws + "movb $0x0A, (%rsi)") # ascii code for newline
+        program.append(ws + "movq $1, %rcx")
+        program.append(ws + "movq $10, %rdi") # in itoa we divide by 10
+        program.append(ws + "cmpq $0, %rax")
+        program.append(ws + "jge itoa")
+        program.append(ws + "negq %rax") # make it positive, will add sign last
+        program.append("itoa:")
+        program.append(ws + "xor %rdx, %rdx") # clear rdx
+        program.append(ws + "idivq %rdi") # reminder is put in rdx
+        program.append(ws + "addq $0x30, %rdx") # get the correct ascii code.
+        program.append(ws + "decq %rsi")
+        # move lower byte of rdx into buf
+        program.append(ws + "movb %dl, (%rsi)")
+        program.append(ws + "incq %rcx")
+        program.append(ws + "cmpq $0, %rax") # rax holds quotient
+        program.append(ws + "jg itoa")
+        program.append(ws + "movq 16(%rbp), %rax")
+        program.append(ws + "cmpq $0, %rax")
+        program.append(ws + "jge print_end")
+        program.append(ws + "decq %rsi")
+        program.append(ws + "incq %rcx")
+        program.append(ws + "movb $0x2D, (%rsi)") # ascii code for minus sign
+        program.append("print_end:")
+        program.append(ws + "movq $1, %rdi")
+        program.append(ws + "movq %rcx, %rdx")
+        program.append(ws + "movq $1, %rax") # sys_write
+        program.append(ws + "syscall")
+        program.append(ws + "popq %rbp")
+        program.append(ws + "ret")
 
-# This function add a function written in assembly, which converts an integer
-# to a sequence of characters and sends it to sys_write.
-def output_asm_func():
-    program.append("\nprint:")
-    program.append(ws + "pushq %rbp")
-    program.append(ws + "movq %rsp, %rbp")
-    program.append(ws + "movq 16(%rbp), %rax")
-    program.append(ws + "leaq buf(%rip), %rsi")
-    program.append(ws + "addq $1023, %rsi") # buf is filled-in lsd first
-    program.append(ws + "movb $0x0A, (%rsi)") # ascii code for newline
-    program.append(ws + "movq $1, %rcx")
-    program.append(ws + "movq $10, %rdi") # in itoa we divide by 10
-    program.append(ws + "cmpq $0, %rax")
-    program.append(ws + "jge itoa")
-    program.append(ws + "negq %rax") # make it positive, will add sign last
-    program.append("itoa:")
-    program.append(ws + "xor %rdx, %rdx") # clear rdx
-    program.append(ws + "idivq %rdi") # reminder is put in rdx
-    program.append(ws + "addq $0x30, %rdx") # get the correct ascii code.
-    program.append(ws + "decq %rsi")
-    program.append(ws + "movb %dl, (%rsi)") # move lower byte of rdx into buf
-    program.append(ws + "incq %rcx")
-    program.append(ws + "cmpq $0, %rax") # rax holds quotient
-    program.append(ws + "jg itoa")
-    program.append(ws + "movq 16(%rbp), %rax")
-    program.append(ws + "cmpq $0, %rax")
-    program.append(ws + "jge print_end")
-    program.append(ws + "decq %rsi")
-    program.append(ws + "incq %rcx")
-    program.append(ws + "movb $0x2D, (%rsi)") # ascii code for minus sign
-    program.append("print_end:")
-    program.append(ws + "movq $1, %rdi")
-    program.append(ws + "movq %rcx, %rdx")
-    program.append(ws + "movq $1, %rax") # sys_write
-    program.append(ws + "syscall")
-    program.append(ws + "popq %rbp")
-    program.append(ws + "ret")
+    def print_asm_program(self):
+        for instr in self.program:
+            print(instr)
 
-def print_asm_program():
-    for instr in program:
-        print(instr)
+    # The whole assembly program as a string.
+    def asm(self):
+        return "\n".join(self.program) + "\n"
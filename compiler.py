@@ -0,0 +1,159 @@
+###======================================================================###
+# The compiler as a library. A Compiler holds the options, and each call   #
+# to compile() runs the phases in a CompilationSession of its own, which   #
+# holds all the state of that one compilation. The only things shared      #
+# between compilations are the prediction table of the parser, which is    #
+# never written to, the interned names and the operands of the IR (see     #
+# symbols.py and ir_instr.py), which are made under a lock. A Compiler can #
+# be used for any number of programs, and from many threads at once:       #
+#   asm = Compiler().compile(source)                                       #
+###======================================================================###
+from concurrent.futures import ProcessPoolExecutor
+from errors import CompileError
+from lexer import EOF
+import codegen
+import incremental
+import inline
+import ir_instr
+import lexer
+import numpy_lexer
+import optimize
+import parallel
+import parser
+import threading
+import type_checker
+
+# The state of compiling one program, at an optimization level (see
+# optimize.py) and with an inlining threshold (see inline.py). After
+# compile_tokens() the results of each phase are kept in the session, for
+# debugging.
+class CompilationSession:
+    def __init__(self, opt_level=0, inline_threshold=inline.default_threshold):
+        self.opt_level = opt_level
+        self.inline_threshold = inline_threshold
+        self.prog_ast = None # The program node of the ast.
+        self.type_checker = type_checker.TypeChecker()
+        self.translator = ir_instr.Translator()
+        self.program = None # The optimized IR.
+        self.codegen = codegen.CodeGen(opt_level=opt_level)
+
+    # Compile the tokens of a program, from lexer.tokens() or lexer.stream(),
+    # and return the assembly. Raises CompileError if the program is wrong.
+    def compile_tokens(self, tokens):
+        self.front_end(tokens)
+        return self.back_end()
+
+    # Parse, type check and translate the tokens of a program to IR. If tree
+    # is a list, the root of the concrete parse tree is appended to it (see
+    # parser.parse_program()).
+    def front_end(self, tokens, tree=None):
+        tok, self.prog_ast = parser.parse_program(tokens, tree)
+        if tok[0] != EOF:
+            raise CompileError("Failed to parse input!")
+        self.type_checker.type_check(self.prog_ast)
+        self.translator.translate_ast(self.prog_ast)
+
+    # Optimize the IR of the program and generate the assembly.
+    def back_end(self):
+        self.program = optimize.optimize(self.translator.program,
+                                         self.opt_level, self.inline_threshold)
+        self.codegen.code_gen(self.program)
+        return self.codegen.asm()
+
+    # Compile a program with a front end cache (see cache.py). On a hit the
+    # IR is loaded from the cache and only codegen is run, prog_ast is then
+    # left as None (cache.load_ast() gets it). On a miss the tokens, from
+    # get_tokens(), are compiled and the result stored under the key. The
+    # IR is cached before it is optimized.
+    def compile_cached(self, cache, key, get_tokens):
+        program = cache.load_ir(key)
+        if program is None:
+            self.front_end(get_tokens())
+            cache.store(key, self.prog_ast, self.translator.program)
+        else:
+            self.translator.program = program
+        return self.back_end()
+
+# backend is the tokenizer to use, "regex" or "numpy" (see numpy_lexer.py).
+# cache is an optional cache.Cache for the front end. With incremental, the
+# cache holds the compiled functions instead, and only the functions that
+# changed are compiled again (see incremental.py). With workers, programs
+# are compiled by that many processes (see parallel.py), without the cache.
+# The processes are started when the first program needs them, and are
+# kept for the next ones until close(), which a with statement calls:
+#   with Compiler(workers=4) as c:
+#       asms = [c.compile(source) for source in sources]
+# opt_level is the optimization level, from 0 to optimize.max_level, and
+# inline_threshold the largest number of IR instructions of a function that
+# is inlined (at -O3).
+class Compiler:
+    def __init__(self, backend="regex", cache=None, workers=None,
+                 incremental=False, opt_level=0,
+                 inline_threshold=inline.default_threshold):
+        if cache and workers:
+            raise ValueError("the cache can't be used with workers")
+        if incremental and not cache:
+            raise ValueError("incremental compilation requires a cache")
+        if not 0 <= opt_level <= optimize.max_level:
+            raise ValueError("unknown optimization level: %d" % opt_level)
+        if inline_threshold < 0:
+            raise ValueError("the inlining threshold can't be negative")
+        self.cache = cache
+        self.workers = workers
+        self.incremental = incremental
+        self.opt_level = opt_level
+        self.inline_threshold = inline_threshold
+        self.pool = None # The processes of the workers.
+        self.pool_lock = threading.Lock()
+        if backend == "numpy":
+            if not numpy_lexer.available():
+                raise ValueError("the numpy lexer requires numpy")
+            self.tokenize = numpy_lexer.tokenize
+        elif backend == "regex":
+            self.tokenize = lexer.tokenize
+        else:
+            raise ValueError("unknown lexer backend: " + backend)
+
+    # Compile the source of a program and return the assembly. Raises
+    # CompileError if the program is wrong. In incremental mode, name (such
+    # as the path of the source) tells which earlier build to start from.
+    def compile(self, source, name=None):
+        if self.workers and not optimize.whole_program(self.opt_level):
+            asm = parallel.compile_parallel(source, self.workers,
+                                            self.tokenize, self.opt_level,
+                                            self.worker_pool())
+            if asm is not None:
+                return asm
+        if self.incremental:
+            result = incremental.compile_incremental(source, self.cache,
+                                                     self.tokenize, name,
+                                                     self.opt_level)
+            if result is not None:
+                return result[0]
+        session = CompilationSession(self.opt_level, self.inline_threshold)
+        get_tokens = lambda: lexer.tokens(source, self.tokenize)
+        if self.cache:
+            key = self.cache.key(source)
+            return session.compile_cached(self.cache, key, get_tokens)
+        return session.compile_tokens(get_tokens())
+
+    # The pool of the workers, which is made the first time it is needed.
+    def worker_pool(self):
+        with self.pool_lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(self.workers)
+            return self.pool
+
+    # Stop the processes of the workers, if they were started. The Compiler
+    # can still be used, it starts them again.
+    def close(self):
+        with self.pool_lock:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,43 @@
+###======================================================================###
+# The framework for the passes of the compiler. A pass is a class whose    #
+# handlers are methods registered with @handles for the kinds of ast nodes #
+# (or the ops of IR instructions) they deal with. The table from kind to   #
+# handler is built once per class, so dispatching on a node is one lookup: #
+#   class Count(Pass):                                                     #
+#       @handles(ast.DECL, ast.ASSIGNMENT)                                 #
+#       def count_def(self, stmt): ...                                     #
+###======================================================================###
+
+# Mark a method as the handler of the given kinds.
+def handles(*kinds):
+    def register(method):
+        method.handled_kinds = kinds
+        return method
+    return register
+
+# Base class for passes. A subclass gets the handlers of its base classes,
+# and can override them by registering its own for the same kinds.
+class Pass:
+    handlers = {} # Kind to the name of the method handling it.
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        handlers = dict(cls.handlers)
+        for name, method in vars(cls).items():
+            for kind in getattr(method, "handled_kinds", ()):
+                handlers[kind] = name
+        cls.handlers = handlers
+
+    # The dispatch table of an instance holds the bound methods, so that a
+    # handler is called without looking it up on the class.
+    def __init__(self):
+        self.dispatch = { kind : getattr(self, name)
+                          for kind, name in self.handlers.items() }
+
+    # Register a handler for a kind in this instance only, handler is called
+    # with the node.
+    def register(self, kind, handler):
+        self.dispatch[kind] = handler
+
+    def visit(self, node):
+        return self.dispatch[node.kind](node)
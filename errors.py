@@ -0,0 +1,8 @@
+###======================================================================###
+# Errors found in the input program. Every phase reports an error by       #
+# raising a CompileError with the message to show, the command line        #
+# compiler prints it and exits, see parser.py.                             #
+###======================================================================###
+
+class CompileError(Exception):
+    pass
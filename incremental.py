@@ -0,0 +1,306 @@
+###======================================================================###
+# Incremental compilation. The IR and the assembly of every function are   #
+# kept in a cache (see cache.py) under a fingerprint of the function, and  #
+# a rebuild only compiles the functions whose fingerprint changed. What a  #
+# function compiles to depends only on its own tokens and on the           #
+# signatures of the functions it names, so that is what the fingerprint is #
+# made of, not its text: editing the spaces between the tokens compiles    #
+# nothing. The assembly of the functions is then linked in source order.   #
+# The cache also keeps a manifest of the last build of each named program, #
+# so that after an edit only the text that changed is looked at again.     #
+# Builds at different optimization levels have entries of their own.       #
+###======================================================================###
+from array import array
+from bisect import bisect_left
+import codegen
+import lexer
+import optimize
+import parallel
+import re
+import serialize
+import struct
+import symbols
+import type_checker
+
+id_pattern = re.compile(lexer.id)
+
+manifest_magic = b"INC1"
+
+# The fingerprint of the function at index, from split_functions(). text
+# is the source from offset on and tokens are its tokens (from tokenize()).
+# The functions a function names can be called by it, and clash with its
+# variables, if they are declared before it. So the fingerprint is made of
+# the lexemes of the function, from its first token to its last, and of the
+# number of params of each id that is a function and whether that function
+# is declared before it. The text between the tokens isn't part of it, so
+# changing the spaces or the text the lexer skips doesn't change it.
+def fingerprint(text, tokens, funcs, index, signatures, offset=0):
+    name, nbr_params, start, end = funcs[index]
+    kinds, starts, ends = tokens
+    i = bisect_left(starts, start - offset)
+    j = bisect_left(starts, end - offset, i)
+    lexemes = [text[lexeme_start:lexeme_end] for lexeme_start, lexeme_end
+               in zip(starts[i:j], ends[i:j])]
+    parts = [" ".join(lexemes)]
+    ids = set(lexeme for kind, lexeme in zip(kinds[i:j], lexemes)
+              if kind == lexer.ID)
+    for name in sorted(ids):
+        signature = signatures.get(name)
+        if signature:
+            parts.append("%s %d %d" % (name, signature[0],
+                                       signature[1] <= index))
+    return "\0".join(parts)
+
+# The cache key of the function at index, compiled at opt_level.
+def function_key(cache, text, tokens, funcs, index, signatures, opt_level,
+                 offset=0):
+    return cache.key("%d\0%s" % (opt_level, fingerprint(
+        text, tokens, funcs, index, signatures, offset)))
+
+# Name -> (nbr_params, index) for the functions, print comes before all
+# functions.
+def signature_table(funcs):
+    signatures = { "print" : (1, -1) }
+    for index, (name, nbr_params, start, end) in enumerate(funcs):
+        signatures[name] = (nbr_params, index)
+    return signatures
+
+# The length of the longest common prefix of a and b, and of the longest
+# common suffix that doesn't overlap it, found by comparing halves so that
+# the characters are compared in C.
+def common_prefix(a, b):
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[low:mid] == b[low:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+def common_suffix(a, b, prefix):
+    low, high = 0, min(len(a), len(b)) - prefix
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[len(a) - mid:len(a) - low] == b[len(b) - mid:len(b) - low]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+# The function table of the type checker for compiling the functions in
+# source[start:end], which only needs the functions they name.
+def function_table(source, start, end, signatures):
+    f_table = type_checker.TypeChecker().f_table
+    for name in set(id_pattern.findall(source, start, end)):
+        signature = signatures.get(name)
+        if signature and signature[1] >= 0:
+            sym = symbols.intern(name)
+            f_table[sym] = type_checker.f_entry(sym, *signature)
+    return f_table
+
+################################################################################
+
+# The tokens of source[start:end], taken from the tokens of the whole source
+# (from tokenize()), with an EOF at end. Both ends are between tokens.
+def span_tokens(tokens, start, end):
+    kinds, starts, ends = tokens
+    i, j = bisect_left(starts, start), bisect_left(starts, end)
+    return (kinds[i:j] + array(kinds.typecode, [lexer.EOF]),
+            starts[i:j] + array(starts.typecode, [end]),
+            ends[i:j] + array(ends.typecode, [end]))
+
+################################################################################
+
+# The manifest of a build is the source, the functions from
+# split_functions(), their cache keys, their assembly and whether they call
+# print. The signatures of the functions, from signature_table(), are made
+# once per build, when they are first needed. A manifest made from scratch
+# also keeps the tokens of the source, so that they aren't made again to
+# compile the functions.
+class Manifest:
+    def __init__(self, source, funcs, keys, fragments, calls,
+                 signatures=None, tokens=None):
+        self.source = source
+        self.funcs = funcs
+        self.keys = keys
+        self.fragments = fragments
+        self.calls = calls
+        self.signatures = signatures
+        self.tokens = tokens
+
+    def signature_table(self):
+        if self.signatures is None:
+            self.signatures = signature_table(self.funcs)
+        return self.signatures
+
+    def dump(self):
+        out = [manifest_magic]
+        serialize.write_strings(out, [self.source])
+        serialize.write_strings(out, [func[0] for func in self.funcs])
+        for column in range(1, 4):
+            serialize.write_array(out, array('q', [func[column]
+                                                   for func in self.funcs]))
+        serialize.write_strings(out, self.keys)
+        serialize.write_strings(out, self.fragments)
+        serialize.write_array(out, array('B', self.calls))
+        return b"".join(out)
+
+def load_manifest(data):
+    reader = serialize.Reader(data, manifest_magic)
+    source = "\0".join(reader.strings())
+    names = reader.strings()
+    nbr_params = reader.array('q')
+    starts = reader.array('q')
+    ends = reader.array('q')
+    funcs = list(zip(names, nbr_params, starts, ends))
+    keys = reader.strings()
+    fragments = reader.strings()
+    calls = list(reader.array('B'))
+    if not len(funcs) == len(keys) == len(fragments) == len(calls):
+        raise ValueError("bad manifest")
+    return Manifest(source, funcs, keys, fragments, calls)
+
+# The manifest of source, made from the manifest of an earlier build. Only
+# the functions around the text that changed are split and fingerprinted
+# again, their fragments are left as None. Returns None if the signatures
+# changed (all the fingerprints have to be made again then), or if the text
+# that changed isn't a list of functions.
+def update_manifest(previous, source, cache, tokenize, opt_level):
+    old = previous.source
+    if old == source:
+        return previous
+    prefix = common_prefix(old, source)
+    suffix = common_suffix(old, source, prefix)
+    funcs = previous.funcs
+    # The functions that are all in the common prefix or suffix are kept,
+    # the ones from first to last (excluded) are split again. A function
+    # ends with a "}", which is a token by itself, and begins with "int",
+    # which doesn't join with the text before it if that is a function, so
+    # the tokens of the kept functions are the same.
+    first = 0
+    while first < len(funcs) and funcs[first][3] <= prefix:
+        first += 1
+    last = len(funcs)
+    while last > first and funcs[last - 1][2] >= len(old) - suffix:
+        last -= 1
+    shift = len(source) - len(old)
+    start = funcs[first - 1][3] if first else 0
+    end = funcs[last][2] + shift if last < len(funcs) else len(source)
+    text = source[start:end]
+    tokens = tokenize(text)
+    changed = parallel.split_functions(text, *tokens)
+    if changed is None or [func[:2] for func in changed] != \
+       [func[:2] for func in funcs[first:last]]:
+        return None
+    changed = [(name, nbr_params, func_start + start, func_end + start)
+               for name, nbr_params, func_start, func_end in changed]
+    kept = [(name, nbr_params, func_start + shift, func_end + shift)
+            for name, nbr_params, func_start, func_end in funcs[last:]]
+    funcs = funcs[:first] + changed + kept
+    signatures = signature_table(funcs)
+    keys = list(previous.keys)
+    fragments = list(previous.fragments)
+    for i in range(first, last):
+        keys[i] = function_key(cache, text, tokens, funcs, i, signatures,
+                               opt_level, start)
+        fragments[i] = None
+    return Manifest(source, funcs, keys, fragments, list(previous.calls),
+                    signatures)
+
+# The manifest of source made from scratch, with no fragments. Returns None
+# if source can't be split into functions or redeclares a function.
+def new_manifest(source, cache, tokenize, opt_level):
+    tokens = tokenize(source)
+    funcs = parallel.split_functions(source, *tokens)
+    if funcs is None:
+        return None
+    if parallel.check_signatures(funcs)[1]:
+        return None
+    signatures = signature_table(funcs)
+    keys = [function_key(cache, source, tokens, funcs, i, signatures,
+                         opt_level) for i in range(len(funcs))]
+    return Manifest(source, funcs, keys, [None] * len(funcs),
+                    [0] * len(funcs), signatures, tokens)
+
+################################################################################
+
+# Compile source incrementally with a cache.Cache. Returns the assembly and
+# the number of functions that were compiled (the others were found in the
+# cache), or None if the program has an error, can't be split into
+# functions or the optimizer needs the whole program. It is then compiled
+# in one go (to report the error). With a name, such as the path of the
+# source, the manifest of the build is kept in the cache under that name,
+# and the next build of the name at the same optimization level starts from
+# it.
+def compile_incremental(source, cache, tokenize=lexer.tokenize, name=None,
+                        opt_level=0):
+    if optimize.whole_program(opt_level):
+        return None
+    previous = manifest = None
+    if name is not None:
+        manifest_key = cache.key("manifest\0%d\0%s" % (opt_level, name))
+        entry = cache.read(manifest_key)
+        if entry:
+            try:
+                previous = load_manifest(entry[0])
+            except (ValueError, struct.error, IndexError):
+                pass
+    if previous:
+        manifest = update_manifest(previous, source, cache, tokenize,
+                                   opt_level)
+    if manifest is None:
+        manifest = new_manifest(source, cache, tokenize, opt_level)
+        if manifest is None:
+            return None
+    funcs, keys, fragments, calls = (manifest.funcs, manifest.keys,
+                                     manifest.fragments, manifest.calls)
+    for i, key in enumerate(keys):
+        if fragments[i] is None:
+            entry = cache.read(key)
+            if entry:
+                fragments[i] = str(entry[1], "utf-8")
+                calls[i] = entry[2] == b"1"
+    # The runs of functions that aren't in the cache are compiled a run at a
+    # time, which is a lot faster than one function at a time.
+    nbr_compiled = 0
+    first = 0
+    while first < len(fragments):
+        if fragments[first] is not None:
+            first += 1
+            continue
+        last = first
+        while last + 1 < len(fragments) and fragments[last + 1] is None:
+            last += 1
+        start, end = funcs[first][2], funcs[last][3]
+        f_table = function_table(source, start, end,
+                                 manifest.signature_table())
+        if manifest.tokens:
+            run = span_tokens(manifest.tokens, start, end)
+            result, error = parallel.compile_functions(
+                source, first, f_table, per_function=True,
+                opt_level=opt_level, tokenize=lambda text: run)
+        else:
+            result, error = parallel.compile_functions(
+                source[start:end], first, f_table, per_function=True,
+                opt_level=opt_level, tokenize=tokenize)
+        if error:
+            return None
+        for i, (lines, calls[i], program) in enumerate(result[2], first):
+            fragments[i] = "\n".join(lines)
+            cache.write(keys[i], serialize.dump_ir(program),
+                        fragments[i].encode("utf-8"),
+                        b"1" if calls[i] else b"0", evict=False)
+        nbr_compiled += last + 1 - first
+        first = last + 1
+    if name is not None and manifest is not previous:
+        cache.write(manifest_key, manifest.dump(), evict=False)
+    if nbr_compiled:
+        cache.evict()
+    program = list(codegen.header)
+    program.extend(fragment for fragment in fragments if fragment)
+    if any(calls):
+        generator = codegen.CodeGen(with_header=False)
+        generator.output_asm_func()
+        program.extend(generator.program)
+    return "\n".join(program) + "\n", nbr_compiled
@@ -0,0 +1,156 @@
+###======================================================================###
+# Inlining of small functions. A call to a function of at most threshold   #
+# instructions is replaced by the body of the function: the arguments are  #
+# moved to variables of the caller that take the place of the params, the  #
+# locals of the callee become locals of the caller (its frame grows by     #
+# them, see codegen.py), and its temporaries and labels are numbered after #
+# those of the caller. A return moves the value to the dest of the call    #
+# and jumps to the end of the body, where the code after the call goes on: #
+#   CALL f(x, 1), t0   ->   mov x, p; mov 1, q; ...; mov v, t0; b .L7;     #
+#                           label .L7                                      #
+# A function that can call itself, directly or through other functions,    #
+# is never inlined, which the strongly connected components of the call    #
+# graph tell. The callees are done before their callers, so a function is  #
+# inlined with the calls in it already inlined. main, which ends the       #
+# program when it returns, and print are never inlined.                    #
+###======================================================================###
+from ir_instr import (IRInstr, BEGIN, LABEL, JUMP, MOV, CALL, RET, VAR, TEMP,
+                      LABEL_ID, const, var, temp, label)
+import symbols
+
+# The largest number of instructions of a function that is inlined, unless
+# a compilation asks for another threshold (see compiler.py).
+default_threshold = 30
+
+# Inline the calls to small functions in a program, given as a list of
+# cfg.Function, that have at most threshold instructions.
+def inline_calls(funcs, threshold=default_threshold):
+    by_name = dict((func.name(), func) for func in funcs)
+    recursive = set()
+    for component in call_components(funcs, by_name):
+        if len(component) > 1 or component[0].name() in callees(component[0]):
+            recursive.update(func.name() for func in component)
+        for func in component:
+            inline_in(func, by_name, recursive, threshold)
+
+# The names of the functions a function calls.
+def callees(func):
+    return set(instr.src1.name for instr in func.body if instr.op == CALL)
+
+# The strongly connected components of the call graph, with Tarjan's
+# algorithm (without recursion), callees before callers.
+def call_components(funcs, by_name):
+    index = dict() # Function -> the order it was reached in.
+    low = dict() # Function -> the lowest index reached from it.
+    stack = []
+    on_stack = set()
+    components = []
+    for root in funcs:
+        if root in index:
+            continue
+        work = [(root, None)]
+        while work:
+            func, succs = work.pop()
+            if succs is None:
+                index[func] = low[func] = len(index)
+                stack.append(func)
+                on_stack.add(func)
+                succs = iter([by_name[name] for name in callees(func)
+                              if name in by_name])
+            for succ in succs:
+                if succ not in index:
+                    work.append((func, succs))
+                    work.append((succ, None))
+                    break
+                if succ in on_stack:
+                    low[func] = min(low[func], index[succ])
+            else:
+                if low[func] == index[func]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member is func:
+                            break
+                    components.append(component)
+                if work:
+                    caller = work[-1][0]
+                    low[caller] = min(low[caller], low[func])
+    return components
+
+# Inline the calls in func to the functions that can be inlined.
+def inline_in(func, by_name, recursive, threshold):
+    body = []
+    next_temp = next_label = None
+    nbr_locals = func.begin.src1.val
+    for instr in func.body:
+        callee = by_name.get(instr.src1.name) if instr.op == CALL else None
+        if callee is None or callee.name() in recursive or \
+           callee.name() == symbols.MAIN or len(callee.body) > threshold:
+            body.append(instr)
+            continue
+        if next_temp is None:
+            next_temp = func.nbr_temps()
+            next_label = func.nbr_labels()
+        # The variables of the callee, by local index, become new locals.
+        variables = dict()
+        for op in operands(callee):
+            if op.kind == VAR and op.local_index not in variables:
+                variables[op.local_index] = op.name
+        for index in sorted(variables, reverse=True):
+            nbr_locals += 1
+            variables[index] = var(variables[index], -nbr_locals)
+        def rename(op):
+            if op is None:
+                return None
+            if op.kind == VAR:
+                return variables[op.local_index]
+            if op.kind == TEMP:
+                return temp(next_temp + op.id)
+            if op.kind == LABEL_ID:
+                return label(next_label + op.id)
+            return op
+        for i, arg in enumerate(instr.args):
+            if i + 2 in variables:
+                body.append(IRInstr(MOV, arg, None, variables[i + 2]))
+        end = label(next_label + callee.nbr_labels())
+        # A temporary is only set once, so with more than one return, the
+        # value goes through a new local named after the callee.
+        result = instr.dest
+        returns = [callee_instr.op == RET for callee_instr in callee.body]
+        if result and (sum(returns) > 1 or not returns[-1:] == [True]):
+            nbr_locals += 1
+            result = var(callee.name(), -nbr_locals)
+        for callee_instr in callee.body:
+            if callee_instr.op == RET:
+                if result:
+                    body.append(IRInstr(MOV, rename(callee_instr.dest), None,
+                                        result))
+                body.append(IRInstr(JUMP, None, None, end))
+            else:
+                args = callee_instr.args
+                body.append(IRInstr(callee_instr.op,
+                                    rename(callee_instr.src1),
+                                    rename(callee_instr.src2),
+                                    rename(callee_instr.dest),
+                                    args and [rename(arg) for arg in args]))
+        if result and (not callee.body or callee.body[-1].op != RET):
+            # The callee returns 0 when it runs off its end.
+            body.append(IRInstr(MOV, const(0), None, result))
+        body.append(IRInstr(LABEL, None, None, end))
+        if result is not instr.dest:
+            body.append(IRInstr(MOV, result, None, instr.dest))
+        next_temp += callee.nbr_temps()
+        next_label = end.id + 1
+    if next_temp is not None:
+        func.begin = IRInstr(BEGIN, const(nbr_locals), None, func.begin.dest)
+        func.set_body(body)
+
+# The operands the instructions of a function read and set.
+def operands(func):
+    for instr in func.body:
+        for op in instr.uses():
+            yield op
+        if instr.dest:
+            yield instr.dest
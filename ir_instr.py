@@ -3,206 +3,404 @@
 # form of three address code. Similar to a RISC language.                  #
 # A node in the abstract syntax tree is translated to an equivalent        #
 # sequence of instructions in the intermediate language.                   #
+# Instructions only have slots, and their op is an integer. Operands are   #
+# shared: there is one operand object per variable, constant, temporary    #
+# and label, so an operand is compared with "is" and costs nothing to use  #
+# again. Temporaries and labels are numbered per function.                 #
 ###======================================================================###
+from dispatch import Pass, handles
 from itertools import count
+import abstract_syntax_tree as ast
+import symbols
+import threading
+import weakref
 
-next_temp = count(0, 1)
-next_label = count(0, 1)
+# The ops of the instructions, and their names for printing.
+(BEGIN, END, LABEL, JUMP, BL, BLE, BG, BGE, BEQ, BNE, MOV, ADD, SUB, MUL, DIV,
+ CALL, RET, PHI) = range(18)
+op_names = ["begin", "end", "label", "b", "bl", "ble", "bg", "bge", "beq",
+            "bne", "mov", "add", "sub", "mul", "div", "CALL", "ret", "phi"]
 
-# A program is a list of IR instructions.
-program = []
+# The conditional branches and the arithmetic ops.
+branches = (BL, BLE, BG, BGE, BEQ, BNE)
+arithmetic = (ADD, SUB, MUL, DIV)
 
-# Proivde a new temporary variable.
-def new_temp():
-    return "t" + str(next(next_temp))
-
-# Provide a new label.
-def new_label():
-    return "L" + str(next(next_label))
+# The ops that set their dest.
+defining = frozenset((MOV, CALL, PHI) + arithmetic)
 
 # Instructions have an operand code, 0-2 srcs operands and 1 dest.
 # For example: a = b + c;
-# Translates into: ADD b, c, t0; mov t0, c
+# Translates into: ADD b, c, t0; mov t0, a
+# A branch has the label to go to as dest. A call has the function as src1,
+# its arguments in args and the temporary it sets as dest (None for a call
+# statement). The begin of a function has the function as dest and the
+# number of its local variables as src1. A phi, which is only found in SSA
+# form (see ssa.py), has a value for each predecessor of its block in args.
 class IRInstr:
-    def __init__(self, op, src1, src2, dest):
+    __slots__ = ("op", "src1", "src2", "dest", "args")
+
+    def __init__(self, op, src1, src2, dest, args=None):
         self.op = op
         self.src1 = src1
         self.src2 = src2
         self.dest = dest
+        self.args = args
+
+    # The operands the instruction reads.
+    def uses(self):
+        if self.args is not None:
+            return self.args
+        if self.op == RET:
+            return [self.dest]
+        if self.src2:
+            return [self.src1, self.src2]
+        if self.src1 and self.op != BEGIN:
+            return [self.src1]
+        return []
 
-    # Returns a string for pretty printing of the IR instruction.
-    def instr_str(self):
-        padding = ' '
-        x = padding.ljust(12 - len(self.op))
-        instr_str = self.op + x
+    # Returns a string for pretty printing of the IR instruction. Labels
+    # are named after the function they are in by label_prefix.
+    def instr_str(self, label_prefix=".L"):
+        name = op_names[self.op]
+        instr_str = name + ' '.ljust(12 - len(name))
+        if self.op == BEGIN or self.op == END:
+            return instr_str + self.dest.instr_str(label_prefix)
+        if self.op == CALL or self.op == PHI:
+            args = ", ".join(arg.instr_str(label_prefix) if arg else "?"
+                             for arg in self.args)
+            if self.op == CALL:
+                instr_str += self.src1.instr_str(label_prefix)
+            instr_str += "(" + args + ")"
+            if self.dest:
+                instr_str += ", " + self.dest.instr_str(label_prefix)
+            return instr_str
         if self.src1:
-            instr_str += self.src1.instr_str() + ", "
+            instr_str += self.src1.instr_str(label_prefix) + ", "
         if self.src2:
-            instr_str += self.src2.instr_str() + ", "
+            instr_str += self.src2.instr_str(label_prefix) + ", "
         if self.dest:
-            instr_str += self.dest.instr_str()
+            instr_str += self.dest.instr_str(label_prefix)
         return instr_str
 
-# Name is used only for printing purpose. For variables the interesting thing
-# is the local index.
+# The result of an arithmetic op on constants, as the generated code
+# computes it: on 64 bit integers, with division truncated toward 0. None
+# if the code would trap (division by 0, or overflow).
+def fold(op, a, b):
+    if op == ADD:
+        result = a + b
+    elif op == SUB:
+        result = a - b
+    elif op == MUL:
+        result = a * b
+    else:
+        if b == 0:
+            return None
+        result = abs(a) // abs(b)
+        if (a < 0) != (b < 0):
+            result = -result
+        if result >= 1 << 63:
+            return None
+    return (result + (1 << 63)) % (1 << 64) - (1 << 63)
+
+# Whether a branch is taken, for constant operands.
+compare = { BL : lambda a, b: a < b, BLE : lambda a, b: a <= b,
+            BG : lambda a, b: a > b, BGE : lambda a, b: a >= b,
+            BEQ : lambda a, b: a == b, BNE : lambda a, b: a != b }
+
+################################################################################
+
+# The kinds of operands.
+VAR, CONST, TEMP, LABEL_ID, FUNC = range(5)
+
+# An operand is made by the functions below, which give the same object for
+# the same operand. Name is used only for printing purpose. For variables
+# the interesting thing is the local index. The names of variables and
+# functions are interned ids.
 class Operand:
+    __slots__ = ()
+
+class Var(Operand):
+    __slots__ = ("name", "local_index", "__weakref__")
+    kind = VAR
+
+    def instr_str(self, label_prefix):
+        return symbols.text(self.name)
+
+class Const(Operand):
+    __slots__ = ("val", "__weakref__")
+    kind = CONST
+
+    def instr_str(self, label_prefix):
+        return str(self.val)
+
+class Temp(Operand):
+    __slots__ = ("id",)
+    kind = TEMP
+
+    def instr_str(self, label_prefix):
+        return "t" + str(self.id)
+
+class Label(Operand):
+    __slots__ = ("id",)
+    kind = LABEL_ID
+
+    def instr_str(self, label_prefix):
+        return label_prefix + str(self.id)
+
+class Func(Operand):
+    __slots__ = ("name",)
+    kind = FUNC
+
+    def instr_str(self, label_prefix):
+        return symbols.text(self.name)
+
+# The operands made so far, which are shared by all compilations, like
+# interned names, and are never changed once made. A new operand is made
+# under the lock, so that two threads can't make different objects for the
+# same operand, or give two temporaries the same id. Looking up an operand
+# that was made needs no lock. Temporaries, labels and functions are few (as
+# many as in the largest function, or as names), but there is no end to the
+# constants and variables a long running process can see. They are only
+# kept while some IR uses them, which is all the time they have to be
+# unique for.
+lock = threading.Lock()
+variables = weakref.WeakValueDictionary() # (name, local_index) -> Var.
+constants = weakref.WeakValueDictionary() # Value -> Const.
+temps = [] # Temp of each id.
+labels = [] # Label of each id.
+functions = dict() # Name -> Func.
+
+def var(name, local_index):
+    op = variables.get((name, local_index))
+    if op is None:
+        with lock:
+            op = variables.get((name, local_index))
+            if op is None:
+                op = Var()
+                op.name = name
+                op.local_index = local_index
+                variables[(name, local_index)] = op
+    return op
+
+def const(val):
+    op = constants.get(val)
+    if op is None:
+        with lock:
+            op = constants.get(val)
+            if op is None:
+                op = Const()
+                op.val = val
+                constants[val] = op
+    return op
+
+# The operand of an id in a table of temporaries or labels, which is made
+# with the operands of all smaller ids if it isn't there yet.
+def numbered(table, cls, id):
+    with lock:
+        while len(table) <= id:
+            op = cls()
+            op.id = len(table)
+            table.append(op)
+    return table[id]
+
+def temp(id):
+    if id < len(temps):
+        return temps[id]
+    return numbered(temps, Temp, id)
+
+def label(id):
+    if id < len(labels):
+        return labels[id]
+    return numbered(labels, Label, id)
+
+def func(name):
+    op = functions.get(name)
+    if op is None:
+        with lock:
+            op = functions.get(name)
+            if op is None:
+                op = Func()
+                op.name = name
+                functions[name] = op
+    return op
+
+################################################################################
+
+# The branch instruction for each operator of a condition, and the
+# instruction of each operator of an expression.
+branch_ops = { "less_than" : BL, "less_than_equal" : BLE,
+               "greater_than" : BG, "greater_than_equal" : BGE,
+               "equal" : BEQ, "not_equal" : BNE }
+arithmetic_ops = { "add" : ADD, "sub" : SUB, "mul" : MUL, "div" : DIV }
+
+# The state of translating one program: the IR instructions so far, and the
+# counters for numbering temporaries and labels.
+class Translator(Pass):
     def __init__(self):
-        self.name = None
-        self.local_index = None
-        self.val = None
-        self.func_name = None
-        self.args = []
-        self.nbr_locals = 0 # This is used by code gen to allocated stack space.
-        self.temp_var = False
-
-    # Returns a string for pretty printing of the IR instruction.
-    def instr_str(self):
-        if self.name:
-            return self.name
-        elif self.val:
-            return self.val
-
-# The functions used to translate code into an IR are similar to those that
-# were used in type checking.
-def translate_ast(prog_ast):
-    for func in prog_ast.funcs:
-        op = Operand()
-        op.name = func.name
-        op.func_name = func.name
-        op.nbr_locals = func.nbr_locals
-        program.append(IRInstr("begin", None, None, op))
-        translate_block(func.block)
-        program.append(IRInstr("end", None, None, op))
-    return program
-
-def translate_stmt(stmt):
-    if stmt.node_type == "decl_node":
+        super().__init__()
+        self.next_temp = count(0, 1)
+        self.next_label = count(0, 1)
+        self.program = [] # A program is a list of IR instructions.
+        self.work = [] # What is left to translate, see translate_stmts.
+
+    # Proivde a new temporary variable.
+    def new_temp(self):
+        return temp(next(self.next_temp))
+
+    # Provide a new label. Labels are numbered per function, and codegen
+    # names them after it (.Lf_0, .Lf_1, ...), so the labels of a function
+    # don't depend on the functions before it, see parallel.py.
+    def new_label(self):
+        return label(next(self.next_label))
+
+    # The functions used to translate code into an IR are similar to those that
+    # were used in type checking.
+    def translate_ast(self, prog_ast):
+        for func in prog_ast.funcs:
+            self.translate_func(func)
+        return self.program
+
+    def translate_func(self, func_node):
+        self.next_temp = count(0, 1)
+        self.next_label = count(0, 1)
+        op = func(func_node.name)
+        self.program.append(IRInstr(BEGIN, const(func_node.nbr_locals), None,
+                                    op))
+        self.translate_stmts(func_node.block)
+        self.program.append(IRInstr(END, None, None, op))
+
+    # Statements nest (blocks, ifs and else ifs) as deep as the program
+    # likes, so they are translated with an explicit stack of work instead
+    # of recursion, in the same order. The work is (function, argument)
+    # pairs: the handler of a statement translates what it can at once, and
+    # pushes the statements in it and what comes after each of them.
+    def translate_stmts(self, stmt):
+        work = self.work = []
+        self.translate_stmt(stmt)
+        while work:
+            function, argument = work.pop()
+            function(argument)
+
+    # Statements are translated by the handler of their kind.
+    def translate_stmt(self, stmt):
+        self.work.append((self.dispatch[stmt.kind], stmt))
+
+    @handles(ast.BLOCK)
+    def translate_block(self, block):
+        dispatch = self.dispatch
+        self.work.extend((dispatch[stmt.kind], stmt)
+                         for stmt in reversed(block.stmts))
+
+    @handles(ast.DECL, ast.ASSIGNMENT)
+    def translate_assignment(self, stmt):
         if stmt.exp:
-            t = translate_exp(stmt.exp)
-            dest_op = Operand()
-            dest_op.name = stmt.name
-            dest_op.local_index = stmt.local_index
-            program.append(IRInstr("mov", t, None, dest_op))
-    elif stmt.node_type == "block_node":
-        translate_block(stmt)
-    elif stmt.node_type == "assignment_node":
-        t = translate_exp(stmt.exp)
-        dest_op = Operand()
-        dest_op.name = stmt.name
-        dest_op.local_index = stmt.local_index
-        program.append(IRInstr("mov", t, None, dest_op))
-    elif stmt.node_type == "func_call_node":
-        program.append(translate_func_call(stmt))
-    elif stmt.node_type == "if_node":
-        translate_if_stmt(stmt)
-    elif stmt.node_type == "return_node":
-        translate_return_stmt(stmt)
-
-def translate_block(block):
-    for stmt in block.stmts:
-        translate_stmt(stmt)
-
-# Func call IR instructions look like: CALL f(a,b,c,...)
-def translate_func_call(stmt):
-    func_instr = IRInstr("CALL", None, None, None)
-    op = Operand()
-    op.func_name = stmt.name
-    func_call = stmt.name + "("
-    for arg in stmt.args:
-        t = translate_exp(arg)
-        op.args.append(t)
-        if t.name:
-            func_call += t.name + ", "
-        elif t.val:
-            func_call += t.val + ", "
-    func_call = func_call[:-2]
-    func_call += ")"
-    op.name = func_call
-    func_instr.dest = op
-    return func_instr
-
-# The instructions directly after the conditional branch is an unconditional
-# branch to the end of the if-block.
-def translate_if_stmt(stmt):
-    begin_if = translate_condition(stmt.condition)
-    end_if = Operand()
-    end_if.name = new_label()
-    b_end_if = IRInstr("b", None, None, end_if)
-    program.append(b_end_if)
-    label_begin_if = IRInstr("label", None, None, begin_if)
-    label_end_if = IRInstr("label", None, None, end_if)
-    program.append(label_begin_if)
-    translate_stmt(stmt.stmt)
-    if stmt.opt_else:
-        end_else = Operand()
-        end_else.name = new_label()
-        b_end_else = IRInstr("b", None, None, end_else)
-        label_end_else = IRInstr("label", None, None, end_else)
-        program.append(b_end_else)
-        program.append(label_end_if)
-        translate_stmt(stmt.opt_else)
-        program.append(b_end_else)
-        program.append(label_end_else)
-    else:
-        program.append(b_end_if)
-        program.append(label_end_if)
-
-def translate_condition(cond):
-    label = Operand()
-    label.name = new_label()
-    op1 = translate_exp(cond.op1)
-    if cond.op2:
-        op2 = translate_exp(cond.op2)
-        if cond.operator == "less_than":
-            cond_str = "bl"
-        elif cond.operator == "less_than_equal":
-            cond_str = "ble"
-        elif cond.operator == "greater_than":
-            cond_str = "bg"
-        elif cond.operator == "greater_than_equal":
-            cond_str = "bge"
-        elif cond.operator == "equal":
-            cond_str = "beq"
-        elif cond.operator == "not_equal":
-            cond_str = "bne"
-        cond_instr = IRInstr(cond_str, op1, op2, label)
-    else:
-        op2 = Operand()
-        op2.val = 0
-        cond_instr = IRInstr("bg", op1, op2, label)
-    program.append(cond_instr)
-    return label
-
-def translate_return_stmt(stmt):
-    t = translate_exp(stmt.exp)
-    program.append(IRInstr("ret", None, None, t))
-
-# Output operands are temporary variales, codegen push these on the stack.
-def translate_exp(exp):
-    if exp.is_exp:
-        t = Operand()
-        t.name = new_temp()
-        t.temp_var = True
-        op1 = translate_exp(exp.op1)
-        op2 = translate_exp(exp.op2)
-        program.append(IRInstr(exp.operator, op1, op2, t))
-        return t
-    elif exp.name:
-        op = Operand()
-        op.name = exp.name
-        op.local_index = exp.local_index
-        return op
-    elif exp.val:
-        op = Operand()
-        op.val = exp.val
-        return op
-    elif exp.func_call:
-        f = translate_func_call(exp.func_call)
-        f.dest.name = "CALL_" + f.dest.name
-        return f.dest
-
-def print_program():
+            t = self.translate_exp(stmt.exp)
+            dest_op = var(stmt.name, stmt.local_index)
+            self.program.append(IRInstr(MOV, t, None, dest_op))
+
+    @handles(ast.FUNC_CALL)
+    def translate_call_stmt(self, stmt):
+        self.translate_func_call(stmt, None)
+
+    # Func call IR instructions look like: CALL f(a,b,c,...), t
+    # The arguments are translated first, from left to right. A call in an
+    # expression is translated by translate_exp().
+    def translate_func_call(self, stmt, t):
+        args = [self.translate_exp(arg) for arg in stmt.args]
+        self.program.append(IRInstr(CALL, func(stmt.name), None, t, args))
+
+    # The instructions directly after the conditional branch is an unconditional
+    # branch to the end of the if-block. What follows the statement of the if
+    # is translated once the statement has been, by translate_else(), and the
+    # end of the else by end_else(), so that the labels are numbered in the
+    # order they are made in.
+    @handles(ast.IF)
+    def translate_if_stmt(self, stmt):
+        begin_if = self.translate_condition(stmt.condition)
+        end_if = self.new_label()
+        b_end_if = IRInstr(JUMP, None, None, end_if)
+        self.program.append(b_end_if)
+        label_begin_if = IRInstr(LABEL, None, None, begin_if)
+        self.program.append(label_begin_if)
+        self.work.append((self.translate_else, (stmt, end_if)))
+        self.translate_stmt(stmt.stmt)
+
+    def translate_else(self, argument):
+        stmt, end_if = argument
+        label_end_if = IRInstr(LABEL, None, None, end_if)
+        if stmt.opt_else:
+            end_else = self.new_label()
+            b_end_else = IRInstr(JUMP, None, None, end_else)
+            self.program.append(b_end_else)
+            self.program.append(label_end_if)
+            self.work.append((self.end_else, end_else))
+            self.translate_stmt(stmt.opt_else)
+        else:
+            self.program.append(IRInstr(JUMP, None, None, end_if))
+            self.program.append(label_end_if)
+
+    def end_else(self, end_else):
+        self.program.append(IRInstr(JUMP, None, None, end_else))
+        self.program.append(IRInstr(LABEL, None, None, end_else))
+
+    def translate_condition(self, cond):
+        label = self.new_label()
+        op1 = self.translate_exp(cond.op1)
+        if cond.op2:
+            op2 = self.translate_exp(cond.op2)
+            cond_instr = IRInstr(branch_ops[cond.operator], op1, op2, label)
+        else:
+            cond_instr = IRInstr(BG, op1, const(0), label)
+        self.program.append(cond_instr)
+        return label
+
+    @handles(ast.RETURN)
+    def translate_return_stmt(self, stmt):
+        t = self.translate_exp(stmt.exp)
+        self.program.append(IRInstr(RET, None, None, t))
+
+    # Output operands are temporary variables. Expression trees can be very
+    # deep, so instead of recursion the operands are translated with an
+    # explicit work stack: a node is visited (its temp is allocated and its
+    # operands, or the arguments of a call, are pushed), and once they have
+    # all been translated its instruction is emitted. Operands are left on a
+    # result stack.
+    def translate_exp(self, exp):
+        work = [(exp, None)]
+        results = []
+        program = self.program
+        while work:
+            node, t = work.pop()
+            if t and node.kind == ast.FUNC_CALL:
+                args = results[len(results) - len(node.args):]
+                del results[len(results) - len(node.args):]
+                program.append(IRInstr(CALL, func(node.name), None, t, args))
+                results.append(t)
+            elif t:
+                op2 = results.pop()
+                op1 = results.pop()
+                program.append(IRInstr(arithmetic_ops[node.operator], op1,
+                                       op2, t))
+                results.append(t)
+            elif node.kind == ast.BINARY_EXP:
+                work.append((node, self.new_temp()))
+                work.append((node.op2, None))
+                work.append((node.op1, None))
+            elif node.kind == ast.VARIABLE:
+                results.append(var(node.name, node.local_index))
+            elif node.kind == ast.LITERAL:
+                results.append(const(int(node.val)))
+            elif node.kind == ast.FUNC_CALL:
+                work.append((node, self.new_temp()))
+                work.extend((arg, None) for arg in reversed(node.args))
+        return results.pop()
+
+# Print the IR of a program, with the labels named as in the assembly.
+def print_program(program):
+    label_prefix = ".L"
     for instr in program:
-        print(instr.instr_str())
-        if instr.op == "end":
+        if instr.op == BEGIN:
+            label_prefix = ".L" + symbols.text(instr.dest.name) + "_"
+        print(instr.instr_str(label_prefix))
+        if instr.op == END:
             print("")
@@ -0,0 +1,120 @@
+###======================================================================###
+# Optimization of the jumps and branches of a function. The translation of #
+# an if statement branches to the then block and jumps over it to the end: #
+#   bl a, b, .L0; b .L1; label .L0; ...; b .L1; label .L1                  #
+# which becomes a branch on the inverted condition over the then block,    #
+# which falls through:                                                     #
+#   bge a, b, .L1; ...; label .L1                                          #
+# Jumps to jumps go straight to the end, jumps to the next instruction and #
+# the code after a jump or a return that no label leads to are removed,    #
+# and so are the labels nothing jumps to. This is repeated until nothing   #
+# changes.                                                                 #
+###======================================================================###
+from ir_instr import (IRInstr, LABEL, JUMP, RET, BL, BLE, BG, BGE, BEQ, BNE,
+                      branches)
+
+# The branch on the opposite condition.
+inverse = { BL : BGE, BGE : BL, BLE : BG, BG : BLE, BEQ : BNE, BNE : BEQ }
+
+# Optimize the jumps and branches of the body of a function.
+def optimize_jumps(func):
+    body = func.body
+    changed = True
+    while changed:
+        changed = False
+        for step in (thread, invert, remove_dead_code):
+            body, step_changed = step(body)
+            changed = changed or step_changed
+    func.set_body(body)
+
+# Where a jump to each label ends up: at the label a jump or another label
+# is followed to, up to a loop.
+def final_targets(body):
+    next_label = dict() # Label -> the label control goes to from it.
+    for i, instr in enumerate(body):
+        if instr.op == LABEL and i + 1 < len(body):
+            after = body[i + 1]
+            if after.op == LABEL or after.op == JUMP:
+                next_label[instr.dest] = after.dest
+    targets = dict()
+    for label in next_label:
+        if label in targets:
+            continue
+        seen = [label]
+        target = next_label[label]
+        while target in next_label and target not in seen:
+            if target in targets:
+                target = targets[target]
+                break
+            seen.append(target)
+            target = next_label[target]
+        else:
+            if target in seen:
+                target = label # A loop, which is kept as it is.
+        for other in seen:
+            targets[other] = target
+    return targets
+
+# Make jumps and branches go to their final targets.
+def thread(body):
+    targets = final_targets(body)
+    changed = False
+    for instr in body:
+        if instr.op == JUMP or instr.op in branches:
+            target = targets.get(instr.dest, instr.dest)
+            if target is not instr.dest:
+                instr.dest = target
+                changed = True
+    return body, changed
+
+# A branch over a jump to the label right after it becomes the inverted
+# branch to where the jump goes.
+def invert(body):
+    new_body = []
+    changed = False
+    i = 0
+    while i < len(body):
+        instr = body[i]
+        if instr.op in branches and i + 2 < len(body) and \
+           body[i + 1].op == JUMP and body[i + 2].op == LABEL and \
+           body[i + 2].dest is instr.dest:
+            new_body.append(IRInstr(inverse[instr.op], instr.src1, instr.src2,
+                                    body[i + 1].dest))
+            changed = True
+            i += 2
+            continue
+        new_body.append(instr)
+        i += 1
+    return new_body, changed
+
+# Remove the jumps and branches to the labels that directly follow them,
+# the instructions after a jump or a return up to the next label, which
+# can't be reached, and the labels that nothing jumps to.
+def remove_dead_code(body):
+    used = set()
+    for instr in body:
+        if instr.op == JUMP or instr.op in branches:
+            used.add(instr.dest)
+    new_body = []
+    reachable = True
+    for i, instr in enumerate(body):
+        op = instr.op
+        if op == LABEL:
+            if instr.dest not in used:
+                continue
+            reachable = True
+        elif not reachable:
+            continue
+        elif op == JUMP or op in branches:
+            j = i + 1
+            while j < len(body) and body[j].op == LABEL and \
+                  body[j].dest is not instr.dest:
+                j += 1
+            if j < len(body) and body[j].op == LABEL:
+                continue
+            if op == JUMP:
+                reachable = False
+        elif op == RET:
+            reachable = False
+        new_body.append(instr)
+    return new_body, len(new_body) != len(body)
@@ -1,14 +1,19 @@
 ###============================###
 # Lexer for a small subset of C. #
 ###============================###
+from array import array
+from itertools import accumulate
+import mmap
+import os
 import re
-import sys
+import symbols
 
 # This pattern define the current subset of the language. Currently it only
-# operates on integers.
-language = '[a-zA-Z][a-zA-Z0-9_]*|-?[0-9]+|[,;(){}+\-*/=!<>]'
+# operates on integers. Literals have no sign, a minus is always a token and
+# the parser decides whether it is unary or binary.
+language = '[a-zA-Z][a-zA-Z0-9_]*|[0-9]+|[,;(){}+\-*/=!<>]'
 id = '[a-zA-Z][a-zA-Z0-9_]*'
-literal = '-?[0-9]+'
+literal = '[0-9]+'
 valid_tokens = { "int" : "int", "return" : "return", "if" : "if",
                  "else" : "else", "(" : "left_paren", ")" : "right_paren",
                  "{" : "left_bracket", "}" : "right_bracket", ";" :
@@ -16,9 +21,45 @@ valid_tokens = { "int" : "int", "return" : "return", "if" : "if",
                  ">" : "greater_than", "+" : "add", "-" : "sub",
                  "*" : "mul", "/" : "div", "=" : "equal", "!" : "not"}
 
-# Get the input file from command line argument.
-with open(sys.argv[-1], 'r') as file:
-    inputStr = file.read()
+# Integer codes for the token kinds, used by tokenize() and the parser.
+# token_names maps a code back to the name that scan() uses for the kind.
+(EOF, ID, LITERAL, INT, RETURN, IF, ELSE, LEFT_PAREN, RIGHT_PAREN,
+ LEFT_BRACKET, RIGHT_BRACKET, SEPARATOR, COMMA, LESS_THAN, GREATER_THAN,
+ ADD, SUB, MUL, DIV, EQUAL, NOT) = range(21)
+token_names = ["eof", "id", "literal", "int", "return", "if", "else",
+               "left_paren", "right_paren", "left_bracket", "right_bracket",
+               "separator", "comma", "less_than", "greater_than", "add", "sub",
+               "mul", "div", "equal", "not"]
+
+# The kind of each fixed lexeme (keywords and punctuation). Any other lexeme
+# is an id if it starts with a letter, otherwise it is a literal.
+lexeme_kinds = { "int" : INT, "return" : RETURN, "if" : IF, "else" : ELSE,
+                 "(" : LEFT_PAREN, ")" : RIGHT_PAREN, "{" : LEFT_BRACKET,
+                 "}" : RIGHT_BRACKET, ";" : SEPARATOR, "," : COMMA,
+                 "<" : LESS_THAN, ">" : GREATER_THAN, "+" : ADD, "-" : SUB,
+                 "*" : MUL, "/" : DIV, "=" : EQUAL, "!" : NOT }
+
+# Splitting on the language pattern (with a capture group) gives every
+# lexeme at the odd positions and the skipped text in between at the even
+# positions, so the token offsets are the running sum of the piece lengths.
+splitter = re.compile('(' + language + ')')
+
+# The same pattern over bytes, used when streaming tokens from a mapped file.
+# Each class of lexeme has its own group, the group number of a match tells
+# which one it is. Punctuation is classified by its (only) byte.
+byte_pattern = re.compile(b'([a-zA-Z][a-zA-Z0-9_]*)|([0-9]+)'
+                          b'|([,;(){}+\\-*/=!<>])')
+keyword_kinds = { b"int" : INT, b"return" : RETURN, b"if" : IF,
+                  b"else" : ELSE }
+byte_kinds = { ord(k) : v for k, v in lexeme_kinds.items() if len(k) == 1 }
+
+# The input string used by scan().
+inputStr = ""
+
+# Read the whole input file.
+def read_input(path):
+    with open(path, 'r') as file:
+        return file.read()
 
 # Tokenize the string.
 def scan():
@@ -36,3 +77,78 @@ def scan():
 
     tokens.append(("eof", "$"))
     return tokens
+
+# Tokenize source in a single pass of the pattern. The result is three
+# parallel arrays: the kind of each token and the start/end offsets of its
+# lexeme in source. The last token is always EOF, with an empty lexeme.
+# Lexemes are classified once per distinct lexeme rather than once per token,
+# so keywords are only looked up for the ids actually seen in source.
+def tokenize(source):
+    pieces = splitter.split(source)
+    lexemes = pieces[1::2]
+    kind_of = dict(lexeme_kinds)
+    for w in set(lexemes).difference(kind_of):
+        kind_of[w] = ID if w[0].isalpha() else LITERAL
+    kinds = array('B', map(kind_of.__getitem__, lexemes))
+    offsets = array('q', accumulate(map(len, pieces)))
+    starts = offsets[0:-1:2]
+    ends = offsets[1::2]
+    kinds.append(EOF)
+    starts.append(len(source))
+    ends.append(len(source))
+    return kinds, starts, ends
+
+# Generate the tokens of an in-memory source as (kind, lexeme) tuples. The
+# lexeme of an id is its interned id, see symbols.py. The tokenize function
+# can be replaced by another backend, see numpy_lexer.py.
+def tokens(source, tokenize=tokenize):
+    kinds, starts, ends = tokenize(source)
+    intern = symbols.intern
+    for kind, start, end in zip(kinds, starts, ends):
+        if kind == ID:
+            yield ID, intern(source[start:end])
+        else:
+            yield kind, source[start:end]
+
+# Generate the tokens of the file at path as (kind, lexeme) tuples, without
+# reading the whole file into a string. The file is memory mapped and each
+# lexeme is a memoryview of the mapping, see lexeme_str(), except for ids
+# which are interned. A read-only view hashes like bytes, so keywords and
+# known ids are found without copying the id.
+def stream(path):
+    with open(path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size:
+            buf = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buf = b""   # An empty file can't be mapped.
+    view = memoryview(buf)
+    for m in byte_pattern.finditer(buf):
+        start, end = m.span()
+        group = m.lastindex
+        if group == 1:
+            lexeme = view[start:end]
+            kind = keyword_kinds.get(lexeme, ID)
+            if kind == ID:
+                yield ID, symbols.intern(lexeme)
+            else:
+                yield kind, lexeme
+        elif group == 2:
+            yield LITERAL, view[start:end]
+        else:
+            yield byte_kinds[buf[start]], view[start:end]
+    yield EOF, view[size:size]
+
+# A lexeme as a str, whichever of tokens() and stream() it came from.
+def lexeme_str(lexeme):
+    if isinstance(lexeme, str):
+        return lexeme
+    return str(lexeme, "ascii")
+
+# Convert the arrays from tokenize() to the (name, lexeme) tuples of scan().
+def token_list(source, kinds, starts, ends):
+    tokens = []
+    for i in range(len(kinds) - 1):
+        tokens.append((token_names[kinds[i]], source[starts[i]:ends[i]]))
+    tokens.append(("eof", "$"))
+    return tokens
@@ -0,0 +1,71 @@
+###======================================================================###
+# Local value numbering. Going down the instructions of a function, every  #
+# value gets a number: a constant, a variable until it is set, and each    #
+# arithmetic instruction by its op and the numbers of its operands, in a   #
+# fixed order for add and mul, which are commutative. An arithmetic        #
+# instruction whose value was computed before into a temporary is removed, #
+# and that temporary is read in place of its dest:                         #
+#   f(a*b + c, a*b - c)  ->  mul a, b, t1; add t1, c, t0; sub t1, c, t2    #
+# Setting a variable gives it a new number, so the values computed from    #
+# the old one are no longer found. Everything is forgotten at each label,  #
+# where control flow joins. Calls don't end what is known: a function has  #
+# no way to set the variables of its caller (there are no globals or       #
+# pointers), so every call is pure as far as the values here go. The value #
+# of a call is never reused though, as the call may print.                 #
+###======================================================================###
+from ir_instr import LABEL, MOV, ADD, MUL, CALL, RET, TEMP, arithmetic
+from itertools import count
+
+# Number the values of the body of a function, and remove the arithmetic
+# that computes a value again.
+def number_values(func):
+    numbers = dict() # Operand -> the number of its value.
+    computed = dict() # (op, number, number) -> number of the value.
+    holders = dict() # Number -> the temporary that holds it.
+    renamed = dict() # Temporary that was removed -> the one to read.
+    next_number = count(0, 1)
+    body = []
+    # The number of the value of op.
+    def number(op):
+        n = numbers.get(op)
+        if n is None:
+            n = numbers[op] = next(next_number)
+        return n
+    for instr in func.body:
+        op = instr.op
+        if op == LABEL:
+            numbers.clear()
+            computed.clear()
+            holders.clear()
+            body.append(instr)
+            continue
+        if renamed:
+            if instr.args is not None:
+                instr.args = [renamed.get(arg, arg) for arg in instr.args]
+            elif op == RET:
+                instr.dest = renamed.get(instr.dest, instr.dest)
+            else:
+                instr.src1 = renamed.get(instr.src1, instr.src1)
+                instr.src2 = renamed.get(instr.src2, instr.src2)
+        dest = instr.dest
+        if op in arithmetic:
+            n1 = number(instr.src1)
+            n2 = number(instr.src2)
+            if (op == ADD or op == MUL) and n2 < n1:
+                n1, n2 = n2, n1
+            key = (op, n1, n2)
+            n = computed.get(key)
+            if n is not None and dest.kind == TEMP and n in holders:
+                renamed[dest] = holders[n]
+                continue
+            if n is None:
+                n = computed[key] = next(next_number)
+            numbers[dest] = n
+            if dest.kind == TEMP:
+                holders[n] = dest
+        elif op == MOV:
+            numbers[dest] = number(instr.src1)
+        elif op == CALL and dest:
+            numbers[dest] = next(next_number)
+        body.append(instr)
+    func.set_body(body)
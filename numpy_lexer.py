@@ -0,0 +1,101 @@
+###======================================================================###
+# Optional lexer backend for very large inputs. Instead of matching one    #
+# token at a time, every byte of the source is classified in bulk with    #
+# NumPy and the token boundaries are found with vectorized operations.     #
+# The result is the same as lexer.tokenize() for the same source.          #
+###======================================================================###
+from array import array
+from lexer import ID, LITERAL, INT, RETURN, IF, ELSE, EOF, lexeme_kinds
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Lookup tables from a byte to its character class and, for punctuation, to
+# its token kind (0 is EOF, which no byte maps to).
+if np is not None:
+    letters = np.zeros(256, dtype=bool)
+    digits = np.zeros(256, dtype=bool)
+    punctuation = np.zeros(256, dtype=np.uint8)
+    for c in b"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ":
+        letters[c] = True
+    for c in b"0123456789":
+        digits[c] = True
+    for k, v in lexeme_kinds.items():
+        if len(k) == 1:
+            punctuation[ord(k)] = v
+    word = letters | digits
+    word[ord("_")] = True
+
+keywords = [(b"int", INT), (b"return", RETURN), (b"if", IF), (b"else", ELSE)]
+
+# The backend can only be selected if numpy is installed.
+def available():
+    return np is not None
+
+# Same result as lexer.tokenize(source): the kinds and the start/end offsets
+# of the tokens as arrays. Characters outside ASCII are never part of a
+# token, they are replaced by "?" so that byte offsets equal str offsets.
+def tokenize(source):
+    b = np.frombuffer(source.encode("ascii", "replace"), dtype=np.uint8)
+    n = len(b)
+    is_letter = letters[b]
+    is_digit = digits[b]
+    is_word = word[b]
+
+    # The regex scans left to right, so within a run of word characters the
+    # first letter starts an id that takes the rest of the run. Before that,
+    # each run of digits is a literal (and underscores are skipped).
+    after = np.zeros(n, dtype=bool)     # Is the next byte a word character?
+    after[:-1] = is_word[1:]
+    before = np.zeros(n, dtype=bool)    # Is the previous byte?
+    before[1:] = is_word[:-1]
+    run = np.cumsum(is_word & ~before)  # Word run number of each byte.
+    run_ends = np.flatnonzero(is_word & ~after) + 1
+
+    letter_pos = np.flatnonzero(is_letter)
+    letter_run = run[letter_pos]
+    first = np.ones(len(letter_pos), dtype=bool)
+    first[1:] = letter_run[1:] != letter_run[:-1]
+    id_starts = letter_pos[first]
+    id_ends = run_ends[letter_run[first] - 1]
+    first_letter = np.full(len(run_ends) + 1, n)
+    first_letter[letter_run[first]] = id_starts
+
+    digit_after = np.zeros(n, dtype=bool)
+    digit_after[:-1] = is_digit[1:]
+    digit_before = np.zeros(n, dtype=bool)
+    digit_before[1:] = is_digit[:-1]
+    digit_starts = np.flatnonzero(is_digit & ~digit_before)
+    digit_ends = np.flatnonzero(is_digit & ~digit_after) + 1
+    is_literal = digit_starts < first_letter[run[digit_starts]]
+    lit_starts = digit_starts[is_literal]
+    lit_ends = digit_ends[is_literal]
+
+    punct_kinds = punctuation[b]
+    punct_pos = np.flatnonzero(punct_kinds != 0)
+
+    # Keywords are ids with a keyword's length and bytes.
+    id_kinds = np.full(len(id_starts), ID, dtype=np.uint8)
+    id_lens = id_ends - id_starts
+    for keyword, kind in keywords:
+        match = np.flatnonzero(id_lens == len(keyword))
+        for j, c in enumerate(keyword):
+            match = match[b[id_starts[match] + j] == c]
+        id_kinds[match] = kind
+
+    starts = np.concatenate((id_starts, lit_starts, punct_pos))
+    ends = np.concatenate((id_ends, lit_ends, punct_pos + 1))
+    kinds = np.concatenate((id_kinds,
+                            np.full(len(lit_starts), LITERAL, dtype=np.uint8),
+                            punct_kinds[punct_pos]))
+    order = np.argsort(starts, kind="stable")
+
+    token_kinds = array('B', kinds[order].tobytes())
+    token_starts = array('q', starts[order].astype(np.int64).tobytes())
+    token_ends = array('q', ends[order].astype(np.int64).tobytes())
+    token_kinds.append(EOF)
+    token_starts.append(len(source))
+    token_ends.append(len(source))
+    return token_kinds, token_starts, token_ends
@@ -0,0 +1,73 @@
+###======================================================================###
+# The optimizer of the IR, run between translation and codegen. Each pass  #
+# works on one function (a cfg.Function) at a time, and runs at the        #
+# optimization levels from its own up (-O0 runs none of them):             #
+#   program = optimize.optimize(translator.program, 1)                     #
+# The program given isn't changed, the passes work on a copy of it. The    #
+# passes over the whole program, which run first, need all of it, so the   #
+# builds that compile the functions on their own (see parallel.py and      #
+# incremental.py) compile in one go at their levels.                       #
+###======================================================================###
+from errors import CompileError
+from ir_instr import IRInstr, CALL
+import cfg
+import inline
+import jumps
+import lvn
+import propagate
+import ssa
+import symbols
+import tail_calls
+
+# The highest optimization level.
+max_level = 3
+
+# Sparse conditional constant propagation, in SSA form.
+def constant_propagation(func):
+    versions = ssa.to_ssa(func)
+    ssa.sccp(func, versions)
+    ssa.from_ssa(func, versions)
+
+# The passes in the order they are run, with the level they start at.
+passes = [(2, tail_calls.eliminate_tail_calls), (1, propagate.propagate),
+          (1, constant_propagation), (1, jumps.optimize_jumps),
+          (2, lvn.number_values)]
+
+# The passes over the whole program, given as a list of functions and the
+# inlining threshold.
+program_passes = [(3, inline.inline_calls)]
+
+# Whether the whole program is needed to optimize at level.
+def whole_program(level):
+    return any(level >= pass_level for pass_level, run in program_passes)
+
+# The optimized IR of a program. Functions of at most inline_threshold
+# instructions are inlined (at the levels that inline).
+def optimize(program, level, inline_threshold=inline.default_threshold):
+    if level < 1:
+        return program
+    check(program)
+    funcs = cfg.functions(copy(program))
+    for pass_level, run in program_passes:
+        if level >= pass_level:
+            run(funcs, inline_threshold)
+    for func in funcs:
+        for pass_level, run in passes:
+            if level >= pass_level:
+                run(func)
+    return cfg.program(funcs)
+
+# A copy of the instructions of a program, which share the operands.
+def copy(program):
+    return [IRInstr(instr.op, instr.src1, instr.src2, instr.dest,
+                    None if instr.args is None else list(instr.args))
+            for instr in program]
+
+# The errors that codegen finds are checked for first, so that a program
+# that doesn't compile without optimizing doesn't compile with it, even if
+# the code with the error is removed.
+def check(program):
+    for instr in program:
+        if instr.op == CALL and instr.dest and \
+           instr.src1.name == symbols.PRINT:
+            raise CompileError("Codegen failed. Print is void.")
@@ -6,54 +6,64 @@ buf: .skip 1024
 f:
          pushq %rbp
          movq %rsp, %rbp
-         subq $16, %rsp
+         subq $56, %rsp
          movq 16(%rbp), %r8
          movq $2, %r9
          cmpq %r9, %r8
-         jl L0
-         jmp L1
-L0:
+         jl .Lf_0
+         jmp .Lf_1
+.Lf_0:
          movq 16(%rbp), %rax
          movq %rbp, %rsp
          popq %rbp
          ret
-         jmp L2
-L1:
+         jmp .Lf_2
+.Lf_1:
          movq 16(%rbp), %rax
          movq $2, %rbx
          subq %rbx, %rax
-         pushq %rax
+         movq %rax, -32(%rbp)
+         pushq -32(%rbp)
          call f
          addq $8, %rsp
+         movq %rax, -24(%rbp)
+         movq -24(%rbp), %rax
          movq %rax, -8(%rbp)
          movq 16(%rbp), %rax
          movq $1, %rbx
          subq %rbx, %rax
-         pushq %rax
+         movq %rax, -48(%rbp)
+         pushq -48(%rbp)
          call f
          addq $8, %rsp
+         movq %rax, -40(%rbp)
+         movq -40(%rbp), %rax
          movq %rax, -16(%rbp)
          movq -8(%rbp), %rax
          movq -16(%rbp), %rbx
          addq %rbx, %rax
-         pushq %rax
-         popq %rax
+         movq %rax, -56(%rbp)
+         movq -56(%rbp), %rax
+         movq %rbp, %rsp
+         popq %rbp
+         ret
+         jmp .Lf_2
+.Lf_2:
+         movq $0, %rax
          movq %rbp, %rsp
          popq %rbp
          ret
-         jmp L2
-L2:
 _start:
          pushq %rbp
          movq %rsp, %rbp
-         subq $8, %rsp
-         movq $9, %rax
-         pushq %rax
+         subq $16, %rsp
+         pushq $9
          call f
          addq $8, %rsp
+         movq %rax, -16(%rbp)
+         movq -16(%rbp), %rax
          movq %rax, -8(%rbp)
-         movq -8(%rbp), %rax
-         pushq %rax
+         pushq -8(%rbp)
          call print
          addq $8, %rsp
          movq $0, %rdi
@@ -0,0 +1,205 @@
+###======================================================================###
+# Parallel compilation. Once the signatures of all functions are known the #
+# functions can be compiled on their own, so the program is split into     #
+# batches of functions that are parsed, type checked, translated and       #
+# generated by a pool of processes, and the assembly of the batches is put #
+# together in source order. The assembly is the same as compiling the      #
+# program in one go, and so are the errors. The pool can be kept for many  #
+# programs (see compiler.Compiler), so that the processes start only once. #
+###======================================================================###
+from concurrent.futures import ProcessPoolExecutor
+from errors import CompileError
+from itertools import count
+from lexer import (EOF, ID, INT, LEFT_PAREN, RIGHT_PAREN, LEFT_BRACKET,
+                   RIGHT_BRACKET, COMMA)
+import codegen
+import ir_instr
+import lexer
+import optimize
+import parser
+import re
+import symbols
+import type_checker
+
+# Matches the kinds of the bracket tokens, in the bytes of the kinds array.
+bracket_pattern = re.compile(b"[%c%c]" % (LEFT_BRACKET, RIGHT_BRACKET))
+
+# A function definition is:
+#   "int" id "(" ["int" id {"," "int" id}] ")" "{" ... "}"
+# The signature of each function, and where it starts and ends, are found by
+# looking at the tokens of the headers and matching the brackets of the
+# bodies, which is much faster than parsing. Returns a list of (name,
+# nbr_params, start, end) where start and end are offsets in source, or None
+# if the program doesn't look like a list of function definitions, it is
+# then up to the parser to tell what is wrong.
+def split_functions(source, kinds, starts, ends):
+    brackets = [m.start() for m in bracket_pattern.finditer(kinds.tobytes())]
+    funcs = []
+    i = 0 # The first token of the next function.
+    b = 0 # The next bracket.
+    while kinds[i] != EOF:
+        if kinds[i] != INT or kinds[i + 1] != ID or \
+           kinds[i + 2] != LEFT_PAREN:
+            return None
+        name = source[starts[i + 1]:ends[i + 1]]
+        j = i + 3
+        nbr_params = 0
+        if kinds[j] == INT:
+            while True:
+                if kinds[j] != INT or kinds[j + 1] != ID:
+                    return None
+                nbr_params += 1
+                j += 2
+                if kinds[j] != COMMA:
+                    break
+                j += 1
+        if kinds[j] != RIGHT_PAREN or kinds[j + 1] != LEFT_BRACKET:
+            return None
+        while b < len(brackets) and brackets[b] <= j:
+            b += 1
+        depth = 1 # The "{" at j + 1.
+        b += 1
+        while depth:
+            if b == len(brackets):
+                return None
+            depth += 1 if kinds[brackets[b]] == LEFT_BRACKET else -1
+            b += 1
+        end = brackets[b - 1]
+        funcs.append((name, nbr_params, starts[i], ends[end]))
+        i = end + 1
+    return funcs
+
+# The stages of compiling, errors of an earlier stage are reported first.
+# Within a stage the error of the first function is reported. An error is
+# (stage, index of the function, rank, message), where the rank puts the
+# redeclaration of a function before errors in its body.
+PARSE, CHECK, CODEGEN = range(3)
+
+# The function table of the type checker for a list of (name, nbr_params)
+# signatures, in the order of the functions.
+def function_table(signatures):
+    f_table = type_checker.TypeChecker().f_table
+    for index, (name, nbr_params) in enumerate(signatures):
+        sym = symbols.intern(name)
+        f_table[sym] = type_checker.f_entry(sym, nbr_params, index)
+    return f_table
+
+# Each program compiled gets a key, and the batches of a program come with
+# its key and signatures. A process of the pool keeps the function table of
+# the last program it compiled a batch of, so that the table is made once
+# per program and process, not once per batch.
+program_keys = count()
+program_key = None
+f_table = None
+
+def compile_batch(key, signatures, source, first, opt_level):
+    global program_key, f_table
+    if key != program_key:
+        f_table = function_table(signatures)
+        program_key = key
+    return compile_functions(source, first, f_table, opt_level=opt_level)
+
+def run_batches(pool, signatures, batches):
+    key = next(program_keys)
+    futures = [pool.submit(compile_batch, key, signatures, *batch)
+               for batch in batches]
+    return [future.result() for future in futures]
+
+# Compile the source of the functions from index first on, with the function
+# table of the program (which isn't changed), at an optimization level.
+# Returns the lines of assembly, whether print was called and, if
+# per_function is True, the lines, whether print is called and the IR
+# (before it is optimized) of each function, or an error. The source is
+# tokenized with tokenize, which can hand back tokens made earlier.
+def compile_functions(source, first, f_table, per_function=False,
+                      opt_level=0, tokenize=lexer.tokenize):
+    try:
+        tok, prog = parser.parse_program(lexer.tokens(source, tokenize))
+        if tok[0] != EOF:
+            raise CompileError("Failed to parse input!")
+    except CompileError as error:
+        return None, (PARSE, first, 1, str(error))
+    checker = type_checker.TypeChecker()
+    checker.f_table = f_table
+    for index, func in enumerate(prog.funcs, first):
+        try:
+            checker.check_func(func, index)
+        except CompileError as error:
+            return None, (CHECK, index, 1, str(error))
+    translator = ir_instr.Translator()
+    generator = codegen.CodeGen(with_header=False, opt_level=opt_level)
+    functions = []
+    call_print = False
+    for index, func in enumerate(prog.funcs, first):
+        ir_start = len(translator.program)
+        translator.translate_func(func)
+        program = translator.program[ir_start:]
+        start = len(generator.program)
+        generator.call_print = False
+        try:
+            generator.code_gen(optimize.optimize(program, opt_level),
+                               print_func=False)
+        except CompileError as error:
+            return None, (CODEGEN, index, 1, str(error))
+        call_print = call_print or generator.call_print
+        if per_function:
+            functions.append((generator.program[start:],
+                              generator.call_print, program))
+    return (generator.program, call_print, functions), None
+
+# The signatures of the functions from split_functions(), checked in order up
+# to the first redeclaration. Returns the signatures as (name, nbr_params),
+# and the error of the redeclaration in a list.
+def check_signatures(funcs):
+    signatures = []
+    declared = { "print" }
+    for index, (name, nbr_params, start, end) in enumerate(funcs):
+        if name in declared:
+            return signatures, [(CHECK, index, 0,
+                                 "Error:  Redeclaration. (func)")]
+        declared.add(name)
+        signatures.append((name, nbr_params))
+    return signatures, []
+
+# Compile source with a pool of nbr_workers processes and return the
+# assembly, or None if the program can't be split into functions (compile
+# it in one go instead to get the error) or the optimizer needs the whole
+# program. Raises CompileError like CompilationSession.compile_tokens()
+# would. The pool is a ProcessPoolExecutor of nbr_workers processes that is
+# used for this program, or made for it and shut down after if it is None.
+def compile_parallel(source, nbr_workers, tokenize=lexer.tokenize,
+                     opt_level=0, pool=None):
+    if optimize.whole_program(opt_level):
+        return None
+    funcs = split_functions(source, *tokenize(source))
+    if funcs is None:
+        return None
+    signatures, errors = check_signatures(funcs)
+    nbr_batches = min(len(funcs), nbr_workers * 4)
+    batches = []
+    for i in range(nbr_batches):
+        first = len(funcs) * i // nbr_batches
+        last = len(funcs) * (i + 1) // nbr_batches - 1
+        batches.append((source[funcs[first][2]:funcs[last][3]], first,
+                        opt_level))
+    if pool is None:
+        with ProcessPoolExecutor(nbr_workers) as pool:
+            results = run_batches(pool, signatures, batches)
+    else:
+        results = run_batches(pool, signatures, batches)
+    program = list(codegen.header)
+    call_print = False
+    for result, error in results:
+        if error:
+            errors.append(error)
+        elif not errors:
+            lines, calls, programs = result
+            program.extend(lines)
+            call_print = call_print or calls
+    if errors:
+        raise CompileError(min(errors)[3])
+    if call_print:
+        generator = codegen.CodeGen(with_header=False)
+        generator.output_asm_func()
+        program.extend(generator.program)
+    return "\n".join(program) + "\n"
@@ -0,0 +1,185 @@
+###======================================================================###
+# Generator for the LL(1) prediction table of the parser. The grammar is   #
+# read from productions.txt, the FIRST and FOLLOW sets of the nonterminals #
+# are computed from it, and each production is entered in the table under #
+# the token kinds that predict it. The grammar is checked to be LL(1) on   #
+# the way. Run with the path of a grammar to print the sets and the table: #
+#   python parse_table.py productions.txt                                  #
+###======================================================================###
+from lexer import EOF, ID, LITERAL, lexeme_kinds, token_names
+import sys
+
+# A production is a tuple (lhs, rhs) where lhs is the name of a nonterminal
+# and rhs a list of symbols. A symbol is either the integer kind of a token
+# (a terminal), the name of a nonterminal, or the name of a semantic action
+# starting with "@". Actions don't derive anything, they are run by the
+# parser when it gets to them, see parser.py.
+#
+# In productions.txt terminals are quoted lexemes, except for "id", literal
+# and $ (the end of input). e is the empty string. Lines without "->" are
+# ignored.
+def read_grammar(path):
+    productions = []
+    with open(path, 'r') as file:
+        for line in file:
+            if "->" not in line:
+                continue
+            lhs, rhs = line.split("->")
+            rhs = [read_symbol(s) for s in rhs.split() if s != "e"]
+            productions.append((lhs.strip(), rhs))
+    defined = nonterminals(productions)
+    for lhs, rhs in productions:
+        for sym in rhs:
+            if not is_terminal(sym) and not is_action(sym) \
+               and sym not in defined:
+                print("Undefined nonterminal in grammar:", sym)
+                sys.exit()
+    return productions
+
+def read_symbol(s):
+    if s == '"id"':
+        return ID
+    elif s == "literal":
+        return LITERAL
+    elif s == "$":
+        return EOF
+    elif s[0] == '"':
+        if s[1:-1] not in lexeme_kinds:
+            print("Unknown token in grammar:", s)
+            sys.exit()
+        return lexeme_kinds[s[1:-1]]
+    return s
+
+def is_terminal(sym):
+    return isinstance(sym, int)
+
+def is_action(sym):
+    return not is_terminal(sym) and sym[0] == "@"
+
+def nonterminals(productions):
+    names = []
+    for lhs, rhs in productions:
+        if lhs not in names:
+            names.append(lhs)
+    return names
+
+# The FIRST set of a sequence of symbols, and whether it derives the empty
+# string (None stands for the empty string in a FIRST set).
+def first_of(seq, first):
+    result = set()
+    for sym in seq:
+        if is_terminal(sym):
+            result.add(sym)
+            return result
+        if is_action(sym):
+            continue
+        result |= first[sym] - {None}
+        if None not in first[sym]:
+            return result
+    result.add(None)
+    return result
+
+# FIRST and FOLLOW sets are the smallest sets that satisfy their equations,
+# they are found by applying the equations until nothing changes.
+def first_sets(productions):
+    first = { nt : set() for nt in nonterminals(productions) }
+    changed = True
+    while changed:
+        changed = False
+        for lhs, rhs in productions:
+            f = first_of(rhs, first)
+            if not f <= first[lhs]:
+                first[lhs] |= f
+                changed = True
+    return first
+
+def follow_sets(productions, first):
+    follow = { nt : set() for nt in nonterminals(productions) }
+    follow[productions[0][0]].add(EOF)
+    changed = True
+    while changed:
+        changed = False
+        for lhs, rhs in productions:
+            for i, sym in enumerate(rhs):
+                if is_terminal(sym) or is_action(sym):
+                    continue
+                f = first_of(rhs[i + 1:], first)
+                if None in f:
+                    f = (f - {None}) | follow[lhs]
+                if not f <= follow[sym]:
+                    follow[sym] |= f
+                    changed = True
+    return follow
+
+# The prediction table maps (nonterminal, token kind) to the index of the
+# production to expand. A production is predicted by the FIRST set of its
+# rhs, and also by the FOLLOW set of its lhs if the rhs can be empty.
+#
+# Two productions predicted by the same token means the grammar isn't LL(1).
+# The one exception is an empty production against one that isn't, where the
+# non-empty production is taken. That is the dangling else: an else belongs
+# to the closest if. Such conflicts are returned, any other is an error.
+def build_table(productions):
+    first = first_sets(productions)
+    follow = follow_sets(productions, first)
+    empty = [None in first_of(rhs, first) for lhs, rhs in productions]
+    table = dict()
+    resolved = []
+    errors = []
+    for i, (lhs, rhs) in enumerate(productions):
+        f = first_of(rhs, first)
+        if empty[i]:
+            f = (f - {None}) | follow[lhs]
+        for kind in sorted(f):
+            j = table.get((lhs, kind))
+            if j is None:
+                table[(lhs, kind)] = i
+            elif empty[j] and not empty[i]:
+                table[(lhs, kind)] = i
+                resolved.append((lhs, kind, i, j))
+            elif empty[i] and not empty[j]:
+                resolved.append((lhs, kind, j, i))
+            else:
+                errors.append((lhs, kind, j, i))
+    if errors:
+        print("The grammar is not LL(1):")
+        for lhs, kind, j, i in errors:
+            print(" ", lhs, token_names[kind], "predicts both",
+                  production_str(productions[j]), "and",
+                  production_str(productions[i]))
+        sys.exit()
+    return table, resolved
+
+def symbol_str(sym):
+    if is_terminal(sym):
+        return token_names[sym]
+    return sym
+
+def production_str(production):
+    lhs, rhs = production
+    return lhs + " -> " + (" ".join(map(symbol_str, rhs)) or "e")
+
+################################################################################
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python parse_table.py productions.txt")
+        sys.exit()
+    productions = read_grammar(sys.argv[1])
+    first = first_sets(productions)
+    follow = follow_sets(productions, first)
+    table, resolved = build_table(productions)
+    for nt in nonterminals(productions):
+        print(nt)
+        print("  first: ", " ".join(sorted(token_names[k] if k is not None
+                                           else "e" for k in first[nt])))
+        print("  follow:", " ".join(sorted(token_names[k]
+                                           for k in follow[nt])))
+        for (lhs, kind), i in sorted(table.items(), key=lambda e: e[0][1]):
+            if lhs == nt:
+                print("  %-14s %s" % (token_names[kind],
+                                      production_str(productions[i])))
+    for lhs, kind, taken, dropped in resolved:
+        print("Conflict on", lhs, token_names[kind] + ":", "took",
+              production_str(productions[taken]), "over",
+              production_str(productions[dropped]))
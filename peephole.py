@@ -0,0 +1,253 @@
+###======================================================================###
+# Peephole optimization of the assembly of a function, before it is added  #
+# to the program (see codegen.py). The lines are parsed into instructions, #
+# and a window slides down them: at each position the rules are tried in   #
+# order on the instructions from there, and the first that matches         #
+# replaces them. The window then goes back far enough for the rules to see #
+# the new instructions with those before them:                             #
+#   movq $1, %rbx; subq %rbx, %rax  ->  subq $1, %rax                      #
+# Which registers and flags are still needed after a window follows from   #
+# how codegen works: every IR instruction loads its operands from the      #
+# frame and stores its result in it, so no register or flag is live at a   #
+# label, a jump or a call, and only %rax is at a return. The rules only    #
+# make a register live to the next instruction, which keeps that true.     #
+# Each Peephole counts the hits of its rules, to see which ones pay off.   #
+###======================================================================###
+import re
+
+# An instruction, with its mnemonic and operands, or a label (op None and
+# the name as the only operand), and the white space it is indented with.
+class Instr:
+    __slots__ = ("op", "args", "indent")
+
+    def __init__(self, op, args, indent=""):
+        self.op = op
+        self.args = args
+        self.indent = indent
+
+    def __str__(self):
+        if self.op is None:
+            return self.indent + self.args[0] + ":"
+        if not self.args:
+            return self.indent + self.op
+        return self.indent + self.op + " " + ", ".join(self.args)
+
+# The instruction of a line of assembly.
+def parse(line):
+    text = line.lstrip(" ")
+    indent = line[:len(line) - len(text)]
+    if text.endswith(":"):
+        return Instr(None, [text[:-1]], indent)
+    op, _, rest = text.partition(" ")
+    return Instr(op, rest.split(", ") if rest else [], indent)
+
+# An instruction indented like instr.
+def like(instr, op, *args):
+    return Instr(op, list(args), instr.indent)
+
+register_pattern = re.compile(r"%[a-z0-9]+")
+
+# The 64 bit registers, by the names of their lower 32 bits.
+full_registers = { "%eax" : "%rax", "%ebx" : "%rbx", "%ecx" : "%rcx",
+                   "%edx" : "%rdx", "%esi" : "%rsi", "%edi" : "%rdi",
+                   "%r8d" : "%r8", "%r9d" : "%r9" }
+low_registers = dict((full, low) for low, full in full_registers.items())
+
+# The instructions that only write their last operand, and those that set
+# the flags.
+moves = frozenset(("movq", "movl", "leaq", "popq"))
+flag_setters = frozenset(("addq", "subq", "imulq", "idivq", "cmpq", "testq",
+                          "negq", "incq", "decq", "salq", "sarq", "shrq",
+                          "andq", "orq", "xor", "xorl", "xorq"))
+
+def is_register(arg):
+    return arg.startswith("%")
+
+def is_slot(arg):
+    return arg.endswith("(%rbp)")
+
+# The registers an operand names, as 64 bit registers.
+def registers(arg):
+    return [full_registers.get(name, name)
+            for name in register_pattern.findall(arg)]
+
+# The registers an instruction reads and writes.
+def reads_writes(instr):
+    op, args = instr.op, instr.args
+    if op == "cqto":
+        return ["%rax"], ["%rdx"]
+    if op == "idivq":
+        return ["%rax", "%rdx"] + registers(args[0]), ["%rax", "%rdx"]
+    if op == "imulq" and len(args) == 1:
+        return ["%rax"] + registers(args[0]), ["%rax", "%rdx"]
+    if op == "syscall":
+        return ["%rax", "%rdi", "%rsi", "%rdx"], ["%rax"]
+    if op == "pushq" or op == "cmpq" or op == "testq":
+        return sum(map(registers, args), []), []
+    if op in ("xor", "xorl", "xorq") and args[0] == args[1]:
+        return [], registers(args[1])
+    read = sum(map(registers, args[:-1]), [])
+    last = args[-1] if args else ""
+    if not is_register(last):
+        return read + registers(last), []
+    if op in moves:
+        return read, registers(last)
+    return read + registers(last), registers(last)
+
+# Whether control can go on after an instruction to the next one.
+def falls_through(instr):
+    return instr.op not in ("jmp", "ret")
+
+def is_jump(instr):
+    return instr.op is not None and instr.op.startswith("j")
+
+# The slots of the frame an instruction reads.
+def slot_reads(instr):
+    args = instr.args
+    if instr.op is None:
+        return []
+    if instr.op in moves and args:
+        args = args[:-1]
+    return [arg for arg in args if is_slot(arg)]
+
+# A store to a slot of the frame that is never read, or that is stored to
+# again before it is read.
+def dead_store(window, state):
+    store, = window
+    if store.op != "movq" or not is_slot(store.args[1]):
+        return None
+    slot = store.args[1]
+    if state.slot_reads.get(slot, 0) == 0:
+        return []
+    for instr in state.after():
+        if instr.op is None or is_jump(instr) or slot in slot_reads(instr):
+            return None
+        if instr.op == "movq" and instr.args[1] == slot:
+            return []
+    return None
+
+# A load of the slot that was just stored to reads the register instead.
+def redundant_load(window, state):
+    store, load = window
+    if store.op != "movq" or load.op != "movq" or \
+       not is_register(store.args[0]) or not is_slot(store.args[1]) or \
+       load.args[0] != store.args[1]:
+        return None
+    if load.args[1] == store.args[0]:
+        return [store]
+    return [store, like(load, "movq", store.args[0], load.args[1])]
+
+# A constant moved to a register that is only read by the next instruction
+# is its immediate operand.
+def fold_immediate(window, state):
+    move, instr = window
+    if move.op != "movq" or not move.args[0].startswith("$") or \
+       not is_register(move.args[1]) or len(instr.args) != 2 or \
+       instr.op not in ("addq", "subq", "imulq", "cmpq"):
+        return None
+    value = int(move.args[0][1:])
+    register = move.args[1]
+    if instr.args[0] != register or register in registers(instr.args[1]) or \
+       not -0x80000000 <= value <= 0x7fffffff or not state.dead(register):
+        return None
+    return [like(instr, instr.op, move.args[0], instr.args[1])]
+
+# Zero is moved to a register with a shorter xorl, which sets the flags, and
+# clears the upper half of the register as all writes of 32 bits do.
+def zero_register(window, state):
+    move, = window
+    if move.op != "movq" or move.args[0] != "$0" or \
+       move.args[1] not in low_registers or not state.flags_dead():
+        return None
+    low = low_registers[move.args[1]]
+    return [like(move, "xorl", low, low)]
+
+# The instructions after a jump or a return up to the next label, which
+# can't be reached.
+def unreachable(window, state):
+    first, second = window
+    if first.op is None or falls_through(first) or second.op is None:
+        return None
+    return [first]
+
+# The rules in the order they are tried, with their names and the number of
+# instructions they look at.
+rules = [("unreachable", 2, unreachable), ("dead_store", 1, dead_store),
+         ("redundant_load", 2, redundant_load),
+         ("fold_immediate", 2, fold_immediate),
+         ("zero_register", 1, zero_register)]
+
+# A peephole optimizer with a set of rules, by default those above, and the
+# number of times each one was applied.
+class Peephole:
+    def __init__(self, rules=None):
+        self.rules = list(globals()["rules"] if rules is None else rules)
+        self.hits = dict((name, 0) for name, size, rule in self.rules)
+        self.code = []
+        self.end = 0 # Where the window being matched ends.
+        self.slot_reads = dict() # Slot -> how many instructions read it.
+
+    # Optimize the lines of assembly of a function. Returns the new lines.
+    def optimize(self, lines):
+        code = self.code = [parse(line) for line in lines]
+        counts = self.slot_reads = dict()
+        for instr in code:
+            for slot in slot_reads(instr):
+                counts[slot] = counts.get(slot, 0) + 1
+        back = max([size for name, size, rule in self.rules] + [1]) - 1
+        i = 0
+        while i < len(code):
+            for name, size, rule in self.rules:
+                window = code[i:i + size]
+                if len(window) < size:
+                    continue
+                self.end = i + size
+                replacement = rule(window, self)
+                if replacement is None:
+                    continue
+                self.hits[name] += 1
+                for instr in window:
+                    for slot in slot_reads(instr):
+                        counts[slot] -= 1
+                for instr in replacement:
+                    for slot in slot_reads(instr):
+                        counts[slot] = counts.get(slot, 0) + 1
+                code[i:i + size] = replacement
+                i = max(i - back, 0)
+                break
+            else:
+                i += 1
+        self.code = []
+        return [str(instr) for instr in code]
+
+    # The instructions after the window.
+    def after(self):
+        code = self.code
+        for i in range(self.end, len(code)):
+            yield code[i]
+
+    # Whether the value of a register after the window is never read.
+    def dead(self, register):
+        for instr in self.after():
+            if instr.op is None or is_jump(instr) or instr.op == "call":
+                return True
+            if instr.op == "ret":
+                return register != "%rax"
+            read, written = reads_writes(instr)
+            if register in read:
+                return False
+            if register in written:
+                return True
+        return True
+
+    # Whether the flags after the window are never read.
+    def flags_dead(self):
+        for instr in self.after():
+            if instr.op is None or not falls_through(instr) or \
+               instr.op in ("call", "syscall"):
+                return True
+            if is_jump(instr):
+                return False
+            if instr.op in flag_setters:
+                return True
+        return True
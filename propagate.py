@@ -0,0 +1,92 @@
+###======================================================================###
+# Constant folding and copy propagation in straight-line code. Going down  #
+# the instructions of a function, what each variable and temporary is      #
+# known to hold (a constant, or the same value as another operand) is used #
+# in place of it, arithmetic on constants is computed, and branches on     #
+# constants become jumps. What is known is forgotten at each label, where  #
+# control flow joins. Variables are locals of the frame of the function,   #
+# so a call can't change them. The temporaries that are no longer read     #
+# are then removed:                                                        #
+#   int x = 3; int y = x * 4;  ->  mov 3, x; mov 12, y                     #
+###======================================================================###
+from ir_instr import (IRInstr, LABEL, JUMP, MOV, CALL, CONST, TEMP, branches,
+                      arithmetic, defining, const, fold, compare)
+
+# Propagate and fold the constants and copies in the body of a function.
+def propagate(func):
+    values = dict() # Operand -> the operand it holds the value of.
+    holders = dict() # Operand -> the operands that hold its value.
+    # Forget what is known about op, and what is known to be op, as it is
+    # set again.
+    def forget(op):
+        if op in values:
+            held = values.pop(op)
+            if held.kind != CONST:
+                holders[held].discard(op)
+        for holder in holders.pop(op, ()):
+            del values[holder]
+    def holds(op, held):
+        forget(op)
+        if held is not op:
+            values[op] = held
+            if held.kind != CONST:
+                holders.setdefault(held, set()).add(op)
+    body = []
+    for instr in func.body:
+        op = instr.op
+        if op == LABEL:
+            values.clear()
+            holders.clear()
+            body.append(instr)
+            continue
+        if values:
+            if instr.args is not None:
+                instr.args = [values.get(arg, arg) for arg in instr.args]
+            elif op in branches or op in defining:
+                instr.src1 = values.get(instr.src1, instr.src1)
+                instr.src2 = values.get(instr.src2, instr.src2)
+            elif op != JUMP:
+                instr.dest = values.get(instr.dest, instr.dest)
+        src1 = instr.src1
+        src2 = instr.src2
+        if op in arithmetic:
+            if src1.kind == CONST and src2.kind == CONST:
+                val = fold(op, src1.val, src2.val)
+                if val is not None:
+                    instr = IRInstr(MOV, const(val), None, instr.dest)
+                    op = MOV
+                    src1 = instr.src1
+        elif op in branches:
+            if src1.kind == CONST and src2.kind == CONST:
+                if compare[op](src1.val, src2.val):
+                    body.append(IRInstr(JUMP, None, None, instr.dest))
+                continue
+        if op == MOV:
+            dest = instr.dest
+            if values.get(dest, dest) is src1:
+                continue # The dest holds that value already.
+            holds(dest, src1)
+        elif op in defining and instr.dest:
+            forget(instr.dest)
+        body.append(instr)
+    func.set_body(remove_dead_temps(body))
+
+# The instructions without the ones that set a temporary that isn't read.
+# Going up from the end, the temporaries read below an instruction are
+# known when it is reached. Calls are kept, without their dest.
+def remove_dead_temps(body):
+    read = set()
+    kept = []
+    for instr in reversed(body):
+        dest = instr.dest
+        if instr.op in defining and dest and dest.kind == TEMP and \
+           dest not in read:
+            if instr.op != CALL:
+                continue
+            instr.dest = None
+        for op in instr.uses():
+            if op.kind == TEMP:
+                read.add(op)
+        kept.append(instr)
+    kept.reverse()
+    return kept
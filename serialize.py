@@ -0,0 +1,200 @@
+###======================================================================###
+# Binary format for the typed ast and the IR of a program, used by the     #
+# front end cache (see cache.py). Both are written as columns of fixed     #
+# width records, which are read back with a single copy each instead of    #
+# one object at a time. The ast is stored the way an Arena stores it (see  #
+# abstract_syntax_tree.py), with the local indices and nbr_locals that the #
+# type checker filled in. Interned ids only mean something in the process  #
+# that made them, so names are written as text and interned again on load, #
+# once per name. Loading the ast only reads its columns, the nodes are     #
+# built from the arena when they are needed.                               #
+###======================================================================###
+from array import array
+import abstract_syntax_tree as ast
+import ir_instr
+import struct
+import symbols
+
+ast_magic = b"AST1"
+ir_magic = b"IR02"
+
+# A blob is a magic number followed by sections. A section is a typecode
+# and a count, followed by count items of an array of that typecode, or by
+# a list of strings when the typecode is "s" (count is then the number of
+# bytes, the strings are separated by "\0").
+section_header = struct.Struct("<cI")
+
+def write_array(out, column):
+    out.append(section_header.pack(column.typecode.encode(), len(column)))
+    out.append(column.tobytes())
+
+def write_strings(out, strings):
+    data = "\0".join(strings).encode("utf-8")
+    out.append(section_header.pack(b"s", len(data)))
+    out.append(data)
+
+# Reads the sections of a blob in order. Raises ValueError if the blob is
+# not what is expected.
+class Reader:
+    def __init__(self, data, magic):
+        if data[:len(magic)] != magic:
+            raise ValueError("not a serialized " + magic.decode())
+        self.data = memoryview(data)
+        self.pos = len(magic)
+
+    def header(self, typecode):
+        pos = self.pos
+        code, count = section_header.unpack_from(self.data, pos)
+        if code != typecode.encode():
+            raise ValueError("bad section in serialized data")
+        self.pos = pos + section_header.size
+        return count
+
+    def array(self, typecode):
+        column = array(typecode)
+        size = self.header(typecode) * column.itemsize
+        column.frombytes(self.data[self.pos:self.pos + size])
+        self.pos += size
+        return column
+
+    def strings(self):
+        size = self.header("s")
+        data = str(self.data[self.pos:self.pos + size], "utf-8")
+        self.pos += size
+        return data.split("\0") if data else []
+
+################################################################################
+
+# The kinds of nodes whose name column is an interned id. For a literal it
+# is the index of its value instead.
+named_kinds = { ast.FUNC, ast.PARAM, ast.DECL, ast.ASSIGNMENT, ast.FUNC_CALL,
+                ast.VARIABLE }
+
+def dump_ast(prog):
+    arena = ast.Arena()
+    arena.add_tree(prog)
+    names = dict() # Interned id -> index in the names section.
+    name = array('i', [names.setdefault(n, len(names)) if k in named_kinds
+                       else n for k, n in zip(arena.kind, arena.name)])
+    out = [ast_magic]
+    write_strings(out, [symbols.text(n) for n in names])
+    write_strings(out, arena.values)
+    for column in (arena.kind, arena.op, name, arena.index, arena.child1,
+                   arena.child2, arena.child3, arena.next):
+        write_array(out, column)
+    return b"".join(out)
+
+# The ast of a blob, as an Arena whose columns are each read with a single
+# copy. The root is at handle 1, and arena.tree(1) builds the objects of the
+# tree when they are needed. Only the names are interned here, once each,
+# the name column keeps their indices (see Arena.ids).
+def load_ast(data):
+    reader = Reader(data, ast_magic)
+    arena = ast.Arena()
+    arena.ids = [symbols.intern(n) for n in reader.strings()]
+    arena.values = reader.strings()
+    arena.kind = reader.array('B')
+    arena.op = reader.array('B')
+    arena.name = reader.array('i')
+    arena.index = reader.array('i')
+    arena.child1 = reader.array('i')
+    arena.child2 = reader.array('i')
+    arena.child3 = reader.array('i')
+    arena.next = reader.array('i')
+    # The tree is built later, so the handles and indices are checked now.
+    rows = len(arena.kind)
+    columns = (arena.op, arena.name, arena.index, arena.child1,
+               arena.child2, arena.child3, arena.next)
+    if rows < 2 or any(len(column) != rows for column in columns) or \
+       max(arena.kind) >= len(ast.kind_names) or \
+       max(arena.op) >= len(ast.operators) or \
+       min(arena.name) < 0 or \
+       max(arena.name) >= max(len(arena.ids), len(arena.values), 1) or \
+       any(min(column) < 0 or max(column) >= rows
+           for column in columns[3:]):
+        raise ValueError("bad serialized ast")
+    return arena
+
+################################################################################
+
+# An operand record is its kind and a value: the name of a variable or a
+# function, or a constant, which are indices in the string table, or the id
+# of a temporary or label. Variables also have their local index.
+def dump_ir(program):
+    strings = dict() # String -> index in the table.
+    numbers = { None : 0 } # Operand -> number.
+    kinds = array('B', [0])
+    values = array('i', [0])
+    local_indices = array('i', [0])
+    # Operands are written once each, in the order they are first used, and
+    # are numbered from 1 (0 is no operand). The columns of the instructions
+    # are then made a column at a time.
+    for instr in program:
+        for op in (instr.src1, instr.src2, instr.dest) + \
+                  (tuple(instr.args) if instr.args else ()):
+            if op in numbers:
+                continue
+            numbers[op] = len(kinds)
+            kind = op.kind
+            kinds.append(kind)
+            if kind == ir_instr.VAR or kind == ir_instr.FUNC:
+                value = strings.setdefault(symbols.text(op.name), len(strings))
+            elif kind == ir_instr.CONST:
+                value = strings.setdefault(str(op.val), len(strings))
+            else:
+                value = op.id
+            values.append(value)
+            local_indices.append(op.local_index if kind == ir_instr.VAR else 0)
+    ops = array('B', [instr.op for instr in program])
+    srcs1 = array('i', [numbers[instr.src1] for instr in program])
+    srcs2 = array('i', [numbers[instr.src2] for instr in program])
+    dests = array('i', [numbers[instr.dest] for instr in program])
+    arg_counts = array('i', [-1 if instr.args is None else len(instr.args)
+                             for instr in program])
+    args = array('i', [numbers[arg] for instr in program if instr.args
+                       for arg in instr.args])
+    out = [ir_magic]
+    write_strings(out, strings)
+    for column in (kinds, values, local_indices, ops, srcs1, srcs2, dests,
+                   arg_counts, args):
+        write_array(out, column)
+    return b"".join(out)
+
+def load_ir(data):
+    reader = Reader(data, ir_magic)
+    strings = reader.strings()
+    kinds = reader.array('B')
+    values = reader.array('i')
+    local_indices = reader.array('i')
+    ops = reader.array('B')
+    srcs1, srcs2, dests, arg_counts, args = [reader.array('i')
+                                             for i in range(5)]
+    if ops and max(ops) >= len(ir_instr.op_names):
+        raise ValueError("bad op in serialized IR")
+    operands = [None]
+    for kind, value, local_index in zip(kinds[1:], values[1:],
+                                        local_indices[1:]):
+        if kind == ir_instr.VAR:
+            op = ir_instr.var(symbols.intern(strings[value]), local_index)
+        elif kind == ir_instr.CONST:
+            op = ir_instr.const(int(strings[value]))
+        elif kind == ir_instr.TEMP:
+            op = ir_instr.temp(value)
+        elif kind == ir_instr.LABEL_ID:
+            op = ir_instr.label(value)
+        elif kind == ir_instr.FUNC:
+            op = ir_instr.func(symbols.intern(strings[value]))
+        else:
+            raise ValueError("bad operand in serialized IR")
+        operands.append(op)
+    program = []
+    next_arg = 0
+    for op, src1, src2, dest, count in zip(ops, srcs1, srcs2, dests,
+                                           arg_counts):
+        instr = ir_instr.IRInstr(op, operands[src1], operands[src2],
+                                 operands[dest])
+        if count >= 0:
+            instr.args = [operands[a] for a in args[next_arg:next_arg + count]]
+            next_arg += count
+        program.append(instr)
+    return program
@@ -0,0 +1,280 @@
+###======================================================================###
+# Static single assignment form of the IR of a function, and sparse        #
+# conditional constant propagation (Wegman and Zadeck) on it. In SSA form  #
+# each assignment to a variable sets a version of it of its own, a         #
+# temporary, and where control flow joins a phi picks the version that     #
+# reaches it. Phis are placed in the iterated dominance frontiers of the   #
+# assignments (see cfg.py), for the variables that are read in a block     #
+# before they are set in it. The first version of a variable is the        #
+# variable itself: a param, or a local that hasn't been set.               #
+# Passes on the SSA form don't make two versions of a variable live at     #
+# the same time, so leaving SSA form is turning every version back into    #
+# its variable and dropping the phis.                                      #
+###======================================================================###
+from ir_instr import (IRInstr, LABEL, JUMP, RET, MOV, CALL, PHI, VAR, CONST,
+                      TEMP, branches, defining, const, temp, fold, compare)
+
+# Put a function (a cfg.Function) in SSA form. Returns the variable of each
+# version, for from_ssa().
+def to_ssa(func):
+    graph = func.cfg()
+    blocks = graph.blocks
+    reachable = graph.rpo()
+    # The variables set in each block, and the ones read in a block before
+    # they are set in it, which are the only ones that can need a phi.
+    def_blocks = dict() # Var -> blocks that set it.
+    needed = set()
+    for block in reachable:
+        defined = set()
+        for instr in block.instrs:
+            for op in instr.uses():
+                if op.kind == VAR and op not in defined:
+                    needed.add(op)
+            dest = instr.dest
+            if dest and dest.kind == VAR and instr.op in defining:
+                defined.add(dest)
+                block_list = def_blocks.setdefault(dest, [])
+                if not block_list or block_list[-1] is not block:
+                    block_list.append(block)
+    # Place the phis, with the variable as dest until it is renamed.
+    frontiers = graph.dominance_frontiers()
+    phis = [[] for block in blocks]
+    for var, var_blocks in def_blocks.items():
+        if var not in needed:
+            continue
+        has_phi = set()
+        work = list(var_blocks)
+        while work:
+            block = work.pop()
+            for join in frontiers[block.index]:
+                if join.index not in has_phi:
+                    has_phi.add(join.index)
+                    phis[join.index].append(IRInstr(PHI, None, None, var,
+                                                    [var] * len(join.preds)))
+                    work.append(join)
+    # Rename, walking the dominator tree with a stack of the versions of
+    # each variable. The first instruction of a block is its label, the
+    # phis go after it.
+    versions = dict() # Version -> Var.
+    stacks = dict() # Var -> versions, the current one last.
+    next_temp = func.nbr_temps()
+    children = graph.dominator_tree()
+    work = [(blocks[0], False)]
+    while work:
+        block, done = work.pop()
+        if done:
+            for instr in block.instrs:
+                if instr.op in defining and instr.dest in versions:
+                    stacks[versions[instr.dest]].pop()
+            continue
+        work.append((block, True))
+        instrs = block.instrs
+        block_phis = phis[block.index]
+        if block_phis:
+            start = 1 if instrs and instrs[0].op == LABEL else 0
+            instrs[start:start] = block_phis
+        for instr in instrs:
+            if instr.op != PHI:
+                if instr.args is not None:
+                    instr.args = [stacks[op][-1] if op in stacks else op
+                                  for op in instr.args]
+                elif instr.op == RET:
+                    if instr.dest in stacks:
+                        instr.dest = stacks[instr.dest][-1]
+                else:
+                    if instr.src1 in stacks:
+                        instr.src1 = stacks[instr.src1][-1]
+                    if instr.src2 in stacks:
+                        instr.src2 = stacks[instr.src2][-1]
+            dest = instr.dest
+            if instr.op in defining and dest and dest.kind == VAR:
+                version = temp(next_temp)
+                next_temp += 1
+                versions[version] = dest
+                stacks.setdefault(dest, [dest]).append(version)
+                instr.dest = version
+        for succ in block.succs:
+            j = succ.preds.index(block)
+            for phi in phis[succ.index]:
+                var = phi.dest if phi.dest.kind == VAR else \
+                    versions[phi.dest]
+                phi.args[j] = stacks[var][-1] if var in stacks else var
+        for child in children[block.index]:
+            work.append((child, False))
+    func.set_body(graph.instrs())
+    return versions
+
+# Leave SSA form: every version is its variable again, and phis go.
+def from_ssa(func, versions):
+    body = []
+    for instr in func.body:
+        if instr.op == PHI:
+            continue
+        if instr.args is not None:
+            instr.args = [versions.get(op, op) for op in instr.args]
+        instr.src1 = versions.get(instr.src1, instr.src1)
+        instr.src2 = versions.get(instr.src2, instr.src2)
+        instr.dest = versions.get(instr.dest, instr.dest)
+        body.append(instr)
+    func.set_body(body)
+
+################################################################################
+
+# The values of the lattice of constant propagation are unknown (no value
+# yet), a constant (an int), or varying.
+VARYING = object()
+
+# Sparse conditional constant propagation on a function in SSA form. The
+# value of every version and temporary is found by only following the
+# branches that can be taken with what is known, then the constants are
+# used in place of the values, branches on constants become jumps, and the
+# blocks that can't be reached are removed. Returns the number of branches
+# removed.
+def sccp(func, versions):
+    graph = func.cfg()
+    blocks = graph.blocks
+    label_blocks = graph.label_blocks
+    values = dict() # Temporary -> constant or VARYING, unknown if missing.
+    users = dict() # Temporary -> [(instr, block)] that read it.
+    for block in blocks:
+        for instr in block.instrs:
+            for op in instr.uses():
+                if op.kind == TEMP:
+                    users.setdefault(op, []).append((instr, block))
+    def value(op):
+        if op.kind == CONST:
+            return op.val
+        if op.kind == TEMP:
+            return values.get(op)
+        return VARYING # A param or a local that hasn't been set.
+    executable = [False] * len(blocks)
+    edges = set() # (pred index, succ index) of the edges that can be taken.
+    flow = [(None, blocks[0])]
+    ssa_work = []
+    # The value of an instruction from the values of its operands.
+    def evaluate(instr, block):
+        op = instr.op
+        if op == PHI:
+            result = None
+            for pred, arg in zip(block.preds, instr.args):
+                if (pred.index, block.index) not in edges:
+                    continue
+                v = value(arg)
+                if v is None:
+                    continue
+                if v is VARYING or result is not None and result != v:
+                    result = VARYING
+                    break
+                result = v
+        elif op == MOV:
+            result = value(instr.src1)
+        elif op == CALL:
+            result = VARYING
+        elif op in branches or op == JUMP or op == RET:
+            return visit_end(instr, block)
+        elif op == LABEL:
+            return
+        else:
+            a = value(instr.src1)
+            b = value(instr.src2)
+            if a is VARYING or b is VARYING:
+                result = VARYING
+            elif a is None or b is None:
+                result = None
+            else:
+                result = fold(op, a, b)
+                if result is None:
+                    result = VARYING
+        if result is None:
+            return
+        dest = instr.dest
+        old = values.get(dest)
+        if old is VARYING or old == result:
+            return
+        values[dest] = result
+        for user in users.get(dest, ()):
+            if executable[user[1].index]:
+                ssa_work.append(user)
+    # The successors that can be taken from the end of a block.
+    def visit_end(instr, block):
+        if instr.op == RET:
+            return
+        target = label_blocks[instr.dest]
+        if instr.op == JUMP:
+            flow.append((block, target))
+            return
+        a = value(instr.src1)
+        b = value(instr.src2)
+        if a is None or b is None:
+            return
+        if a is VARYING or b is VARYING:
+            flow.extend((block, succ) for succ in block.succs)
+        elif compare[instr.op](a, b):
+            flow.append((block, target))
+        elif block.index + 1 < len(blocks):
+            flow.append((block, blocks[block.index + 1]))
+    while flow or ssa_work:
+        while flow:
+            pred, block = flow.pop()
+            if pred:
+                if (pred.index, block.index) in edges:
+                    continue
+                edges.add((pred.index, block.index))
+            if executable[block.index]:
+                for instr in block.instrs:
+                    if instr.op == PHI:
+                        evaluate(instr, block)
+                continue
+            executable[block.index] = True
+            for instr in block.instrs:
+                evaluate(instr, block)
+            if not block.terminator() and block.index + 1 < len(blocks):
+                flow.append((block, blocks[block.index + 1]))
+        while ssa_work:
+            instr, block = ssa_work.pop()
+            evaluate(instr, block)
+    # Rewrite the function with what was found.
+    nbr_removed = 0
+    body = []
+    for block in blocks:
+        if not executable[block.index]:
+            nbr_removed += sum(instr.op in branches for instr in block.instrs)
+            continue
+        for instr in block.instrs:
+            op = instr.op
+            if op == PHI:
+                body.append(instr)
+                continue
+            if op in branches:
+                a = value(instr.src1)
+                b = value(instr.src2)
+                if type(a) is int and type(b) is int:
+                    nbr_removed += 1
+                    if compare[op](a, b):
+                        body.append(IRInstr(JUMP, None, None, instr.dest))
+                    continue
+            if op in defining and op != CALL:
+                v = values.get(instr.dest)
+                if type(v) is int:
+                    if instr.dest in versions:
+                        body.append(IRInstr(MOV, const(v), None, instr.dest))
+                    continue
+            if instr.args is not None:
+                instr.args = [constant(op, values) for op in instr.args]
+            elif op == RET:
+                instr.dest = constant(instr.dest, values)
+            else:
+                if instr.src1:
+                    instr.src1 = constant(instr.src1, values)
+                if instr.src2:
+                    instr.src2 = constant(instr.src2, values)
+            body.append(instr)
+    func.set_body(body)
+    return nbr_removed
+
+# The operand to use for op: its constant value, if it has one.
+def constant(op, values):
+    v = values.get(op)
+    if type(v) is int:
+        return const(v)
+    return op
@@ -0,0 +1,42 @@
+###======================================================================###
+# Interning table for identifiers, shared by all phases of the compiler.   #
+# The lexer gives each distinct identifier a small integer id once, after  #
+# that scopes, the function table, IR operands and codegen all work on the #
+# ids. The name is only looked up again when the assembly is printed.      #
+###======================================================================###
+
+import threading
+
+names = [None] # Id -> name. Id 0 is never used, so that every id is truthy.
+ids = dict()   # Name -> id, keyed by both the str and the bytes of a name.
+
+# The table is shared by all compilations in the process (see compiler.py),
+# so that ids never have to be translated between them. Names are only ever
+# added, and a new name is added under the lock so that two threads can't
+# give it different ids. Looking up a known name needs no lock.
+lock = threading.Lock()
+
+# Get the id of a name, giving it a new one the first time it is seen. The
+# name can also be bytes or a memoryview (from lexer.stream()), which hash
+# and compare like the bytes key, so a known name is found without a copy.
+def intern(name):
+    sym = ids.get(name)
+    if sym is None:
+        with lock:
+            sym = ids.get(name)
+            if sym is None:
+                if not isinstance(name, str):
+                    name = str(name, "ascii")
+                sym = len(names)
+                names.append(name)
+                ids[name.encode("ascii")] = sym
+                ids[name] = sym
+    return sym
+
+# Get the name of an id.
+def text(sym):
+    return names[sym]
+
+# Names the compiler itself needs to know about.
+PRINT = intern("print") # Built in function, see codegen.output_asm_func().
+MAIN = intern("main")
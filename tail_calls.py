@@ -0,0 +1,53 @@
+###======================================================================###
+# Tail call elimination for functions that call themselves. A call whose   #
+# value is returned right away is in tail position, and when it calls the  #
+# function it is in, the frame of the function isn't needed after it. So   #
+# instead of calling, the arguments are moved to the params (which are     #
+# above the frame, at 8*local_index(%rbp), see codegen.py) and the code    #
+# jumps back to the start of the body, in the same frame:                  #
+#   CALL f(t1, acc), t2; ret t2  ->  mov t1, n; b .L9                      #
+# A recursion that is all tail calls then runs in constant stack space.    #
+# The arguments are all read before any param is set, so an argument that  #
+# is a param (as in f(b, a)) is copied to a temporary first.               #
+###======================================================================###
+from ir_instr import IRInstr, LABEL, JUMP, MOV, CALL, RET, VAR, temp, label
+
+# Replace the calls to func in tail position by jumps to the start of its
+# body.
+def eliminate_tail_calls(func):
+    body = func.body
+    name = func.name()
+    sites = [i for i, instr in enumerate(body[:-1])
+             if instr.op == CALL and instr.src1.name == name and
+             instr.dest and body[i + 1].op == RET and
+             body[i + 1].dest is instr.dest]
+    if not sites:
+        return
+    params = dict() # Local index -> Var of the params that are read.
+    for instr in body:
+        for op in instr.uses():
+            if op.kind == VAR and op.local_index >= 2:
+                params[op.local_index] = op
+    next_temp = func.nbr_temps()
+    start = label(func.nbr_labels())
+    new_body = [IRInstr(LABEL, None, None, start)]
+    last = 0
+    for i in sites:
+        new_body.extend(body[last:i])
+        args = body[i].args
+        moves = []
+        for index, arg in enumerate(args, 2):
+            param = params.get(index)
+            if param is None or arg is param:
+                continue
+            if arg.kind == VAR and arg.local_index >= 2:
+                copy = temp(next_temp)
+                next_temp += 1
+                new_body.append(IRInstr(MOV, arg, None, copy))
+                arg = copy
+            moves.append(IRInstr(MOV, arg, None, param))
+        new_body.extend(moves)
+        new_body.append(IRInstr(JUMP, None, None, start))
+        last = i + 2
+    new_body.extend(body[last:])
+    func.set_body(new_body)
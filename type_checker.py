@@ -4,174 +4,279 @@
 # other cool stuff, like making sure that variables are declared before    #
 # they are used, correct number of function call arguments and so on.      #
 ###======================================================================###
-from collections import deque
 from dataclasses import dataclass
+from dispatch import Pass, handles
+from errors import CompileError
+import abstract_syntax_tree as ast
 import ir_instr as ir
-import sys
+import symbols
 
-# An entry in the function symbol table.
+# An entry in the function symbol table. Names are interned ids, and the
+# symbol tables are keyed on them. index is the position of the function in
+# the program, a function can only use the functions up to itself.
 @dataclass
 class f_entry:
-    name : str
+    name : int
     nbr_param : int
+    index : int = -1
 
-# An entry in the variable symbol table.
+# An entry in the variable symbol table. scope is the depth of the scope
+# the variable is declared in.
 @dataclass
 class v_entry:
-    name : str
+    name : int
     local_index : int
+    scope : int
     type : str = "int"
 
-v_table = deque() # Variable symbol table, scopes are dicts.
-f_table = dict() # Function symbol table.
-f_table["print"] = f_entry("print", 1) # Print function hard-coded in assembly.
-
-# Enter a new scope and put it on the variable symbol table stack.
-def enter_scope():
-    v_table.appendleft(dict())
-
-# Exit the current scope.
-def exit_scope():
-    v_table.popleft()
-
-# Check if name is already declared as a function.
-def check_ftable_def(name):
-    if f_table.get(name):
-        report_error("Redeclaration. (func)")
-
-# Check if name is already declared as a variable within the same scope.
-def check_vtable_def(name):
-    if v_table[0].get(name):
-        report_error("Redeclaration. (var)")
-
-# Make sure that functions are declared and that the number of param is correct.
-def check_ftable_use(name, nbr_param):
-    if f_table.get(name):
-        if f_table[name].nbr_param != nbr_param:
-            report_error("Wrong number of function arguments.")
-    else:
-        report_error("Function not declared.")
-
-# Make sure that variables are declared before they are used.
-def check_vtable_use(name):
-    for v in v_table:
-        if v.get(name):
-            return v[name].local_index
-    report_error("Variable used before declared.")
-
-# Add a function to the fucntion symbol table.
-def add_f_entry(name, nbr_param):
-    check_ftable_def(name)
-    f_table[name] = f_entry(name, nbr_param)
-
-# Add a variable to the current scope. For simplicity we don't allow shared
-# names between functions and variables.
-def add_v_entry(name, local_index):
-    check_ftable_def(name)
-    check_vtable_def(name)
-    v_table[0][name] = v_entry(name, local_index)
-
-# Note that the parser doesn't currently parse global variables.
-def type_check(prog_ast):
-    for func in prog_ast.funcs:
-        add_f_entry(func.name, len(func.params))
-        enter_scope()
-        type_check_func(func)
-        exit_scope()
-
-# Go through the function and look for defs and uses.
-# When we reference a parameter in assembly we do: local_index*8(%rbp)
-# The first parameter is 16 bytes away in memory so we start local_index on 2.
-def type_check_func(func):
-    local_index = 2
-    for param in func.params:
-        add_v_entry(param.name, local_index)
-        local_index += 1
-    type_check_block(func, func.block)
-
-# We pass func as an argument so that we can propagate it along to the
-# type_check_decl method, and update the nbr_locals used by codegen.
-def type_check_stmt(func, stmt):
-    if stmt.node_type == "decl_node":
-        type_check_decl(func, stmt)
-    elif stmt.node_type == "block_node":
-        enter_scope()
-        type_check_block(func, stmt)
-        exit_scope()
-    elif stmt.node_type == "assignment_node":
-        stmt.local_index = check_vtable_use(stmt.name)
-        type_check_exp(stmt.exp)
-    elif stmt.node_type == "func_call_node":
-        type_check_func_call(stmt)
-    elif stmt.node_type == "if_node":
-        type_check_if_stmt(func, stmt)
-    elif stmt.node_type == "return_node":
-        type_check_exp(stmt.exp)
-
-# The calling function make sure to enter a new scope for block, even though
-# type_check_block could do it, but this way is easier to scope params.
-def type_check_block(func, block):
-    for stmt in block.stmts:
-        type_check_stmt(func, stmt)
-
-# First make sure that we haven't declared the name earlier in scope.
-def type_check_decl(func, decl):
-    decl_name = decl.name
-    func.nbr_locals += 1
-    add_v_entry(decl_name, -func.nbr_locals)
-    decl.local_index = -func.nbr_locals
-    if decl.exp:
-        type_check_exp(decl.exp)
-
-def type_check_func_call(func_call):
-    check_ftable_use(func_call.name, len(func_call.args))
-    for arg in func_call.args:
-        type_check_exp(arg)
-
-def type_check_if_stmt(func, if_stmt):
-    condition = if_stmt.condition
-    stmt = if_stmt.stmt
-    opt_else = if_stmt.opt_else
-    type_check_exp(condition.op1)
-    if condition.op2:
-        type_check_exp(condition.op2)
-    if stmt.node_type == "block_node":
-        enter_scope()
-        type_check_block(func, stmt)
-        exit_scope()
-    else:
-        enter_scope()
-        type_check_stmt(func, stmt)
-        exit_scope()
-    if opt_else:
-        if opt_else.node_type == "block_node":
-            enter_scope()
-            type_check_block(func, opt_else)
-            exit_scope()
+# The variable symbol table. Every name maps to the stack of its entries,
+# the innermost declaration last, so looking up a name doesn't depend on how
+# deep the scopes are nested. The names declared are logged in order, and
+# exiting a scope undoes the declarations logged since it was entered.
+class VarTable:
+    def __init__(self):
+        self.entries = dict() # Name -> stack of entries.
+        self.log = [] # The names declared, in order.
+        self.marks = [] # The length of the log when each scope was entered.
+
+    def enter_scope(self):
+        self.marks.append(len(self.log))
+
+    def exit_scope(self):
+        mark = self.marks.pop()
+        log = self.log
+        entries = self.entries
+        while len(log) > mark:
+            name = log.pop()
+            stack = entries[name]
+            stack.pop()
+            if not stack:
+                del entries[name]
+
+    # The innermost entry of a name, or None.
+    def lookup(self, name):
+        stack = self.entries.get(name)
+        if stack:
+            return stack[-1]
+        return None
+
+    # Whether name is declared in the current scope.
+    def in_scope(self, name):
+        stack = self.entries.get(name)
+        return stack is not None and stack[-1].scope == len(self.marks)
+
+    # Declare a variable in the current scope.
+    def add(self, name, local_index):
+        entry = v_entry(name, local_index, len(self.marks))
+        self.entries.setdefault(name, []).append(entry)
+        self.log.append(name)
+
+    # The names in scope, innermost scope first, for debugging.
+    def scopes(self):
+        marks = self.marks + [len(self.log)]
+        return [self.log[marks[i]:marks[i + 1]]
+                for i in reversed(range(len(self.marks)))]
+
+# The state of type checking one program: the symbol tables. The checker
+# also annotates the ast, with the local_index of each variable use and the
+# nbr_locals of each function.
+class TypeChecker(Pass):
+    def __init__(self):
+        super().__init__()
+        self.func = None # The function being type checked.
+        self.func_index = 0 # Its position in the program.
+        self.work = [] # The statements still to check, see type_check_block.
+        self.v_table = VarTable() # Variable symbol table.
+        self.f_table = dict() # Function symbol table.
+        # Hard-coded in assembly.
+        self.f_table[symbols.PRINT] = f_entry(symbols.PRINT, 1)
+
+    # Enter a new scope in the variable symbol table.
+    def enter_scope(self):
+        self.v_table.enter_scope()
+
+    # Exit the current scope.
+    def exit_scope(self):
+        self.v_table.exit_scope()
+
+    # The entry of a function declared before the function being checked (or
+    # the function itself), or None. The table can hold the functions after
+    # it too, see parallel.py.
+    def declared_func(self, name):
+        entry = self.f_table.get(name)
+        if entry and entry.index <= self.func_index:
+            return entry
+        return None
+
+    # Check if name is already declared as a function.
+    def check_ftable_def(self, name):
+        if self.declared_func(name):
+            report_error("Redeclaration. (func)")
+
+    # Check if name is already declared as a variable within the same scope.
+    def check_vtable_def(self, name):
+        if self.v_table.in_scope(name):
+            report_error("Redeclaration. (var)")
+
+    # Make sure that functions are declared and that the number of param is
+    # correct.
+    def check_ftable_use(self, name, nbr_param):
+        entry = self.declared_func(name)
+        if entry:
+            if entry.nbr_param != nbr_param:
+                report_error("Wrong number of function arguments.")
         else:
-            enter_scope()
-            type_check_stmt(func, opt_else)
-            exit_scope()
-
-def type_check_exp(node):
-    if node.name:
-        node.local_index = check_vtable_use(node.name)
-    elif node.is_exp:
-        type_check_exp(node.op1)
-        type_check_exp(node.op2)
-    elif node.func_call:
-        type_check_func_call(node.func_call)
+            report_error("Function not declared.")
+
+    # Make sure that variables are declared before they are used.
+    def check_vtable_use(self, name):
+        entry = self.v_table.lookup(name)
+        if entry is None:
+            report_error("Variable used before declared.")
+        return entry.local_index
+
+    # Add a function to the fucntion symbol table.
+    def add_f_entry(self, name, nbr_param, index):
+        if self.f_table.get(name):
+            report_error("Redeclaration. (func)")
+        self.f_table[name] = f_entry(name, nbr_param, index)
+
+    # Add a variable to the current scope. For simplicity we don't allow shared
+    # names between functions and variables.
+    def add_v_entry(self, name, local_index):
+        self.check_ftable_def(name)
+        self.check_vtable_def(name)
+        self.v_table.add(name, local_index)
+
+    # Note that the parser doesn't currently parse global variables.
+    def type_check(self, prog_ast):
+        for index, func in enumerate(prog_ast.funcs):
+            self.add_f_entry(func.name, len(func.params), index)
+            self.check_func(func, index)
+
+    # Type check the function at index in the program, once the functions up
+    # to it are in the function table.
+    def check_func(self, func, index):
+        self.func_index = index
+        self.enter_scope()
+        self.type_check_func(func)
+        self.exit_scope()
+
+    # Go through the function and look for defs and uses.
+    # When we reference a parameter in assembly we do: local_index*8(%rbp)
+    # The first parameter is 16 bytes away in memory so we start local_index
+    # on 2. The function being checked is kept in self.func, decls update
+    # its nbr_locals used by codegen.
+    def type_check_func(self, func):
+        self.func = func
+        local_index = 2
+        for param in func.params:
+            self.add_v_entry(param.name, local_index)
+            local_index += 1
+        self.type_check_block(func.block)
+
+    # Statements are type checked by the handler of their kind.
+    def type_check_stmt(self, stmt):
+        self.work.append((self.dispatch[stmt.kind], stmt))
+
+    # The calling function make sure to enter a new scope for block, even
+    # though type_check_block could do it, but this way is easier to scope
+    # params. Statements nest (blocks, ifs and else ifs) as deep as the
+    # program likes, so they are checked with an explicit stack of work
+    # instead of recursion, in the same order. The work is (function,
+    # argument) pairs: the handler of a statement checks what it can at once,
+    # and pushes the statements in it, and the end of their scopes.
+    def type_check_block(self, block):
+        work = self.work = []
+        self.push_stmts(block)
+        while work:
+            function, argument = work.pop()
+            function(argument)
+
+    def push_stmts(self, block):
+        dispatch = self.dispatch
+        self.work.extend((dispatch[stmt.kind], stmt)
+                         for stmt in reversed(block.stmts))
+
+    # A block that is a statement of its own.
+    @handles(ast.BLOCK)
+    def type_check_scope(self, block):
+        self.enter_scope()
+        self.work.append((self.end_scope, None))
+        self.push_stmts(block)
+
+    # A statement in a scope of its own, and the end of a scope.
+    def type_check_nested(self, stmt):
+        self.enter_scope()
+        self.work.append((self.end_scope, None))
+        self.type_check_stmt(stmt)
+
+    def end_scope(self, argument):
+        self.exit_scope()
+
+    # First make sure that we haven't declared the name earlier in scope.
+    @handles(ast.DECL)
+    def type_check_decl(self, decl):
+        func = self.func
+        func.nbr_locals += 1
+        self.add_v_entry(decl.name, -func.nbr_locals)
+        decl.local_index = -func.nbr_locals
+        if decl.exp:
+            self.type_check_exp(decl.exp)
+
+    @handles(ast.ASSIGNMENT)
+    def type_check_assignment(self, assignment):
+        assignment.local_index = self.check_vtable_use(assignment.name)
+        self.type_check_exp(assignment.exp)
+
+    @handles(ast.FUNC_CALL)
+    def type_check_func_call(self, func_call):
+        self.type_check_exp(func_call)
+
+    # The statement and the else of an if have scopes of their own, the
+    # statement is checked first so it is pushed last.
+    @handles(ast.IF)
+    def type_check_if_stmt(self, if_stmt):
+        condition = if_stmt.condition
+        self.type_check_exp(condition.op1)
+        if condition.op2:
+            self.type_check_exp(condition.op2)
+        for stmt in (if_stmt.opt_else, if_stmt.stmt):
+            if stmt is None:
+                continue
+            if stmt.kind == ast.BLOCK:
+                self.type_check_stmt(stmt)
+            else:
+                self.work.append((self.type_check_nested, stmt))
+
+    @handles(ast.RETURN)
+    def type_check_return_stmt(self, return_stmt):
+        self.type_check_exp(return_stmt.exp)
+
+    # Expression trees can be very deep (a long chain of operators, or calls
+    # in the arguments of calls), so they are walked with an explicit stack
+    # instead of recursion, in the same order.
+    def type_check_exp(self, exp):
+        stack = [exp]
+        while stack:
+            node = stack.pop()
+            if node.kind == ast.VARIABLE:
+                node.local_index = self.check_vtable_use(node.name)
+            elif node.kind == ast.BINARY_EXP:
+                stack.append(node.op2)
+                stack.append(node.op1)
+            elif node.kind == ast.FUNC_CALL:
+                self.check_ftable_use(node.name, len(node.args))
+                stack.extend(reversed(node.args))
+
+    def print_tables(self):
+        print("f_table: ")
+        for f in self.f_table:
+            print(symbols.text(f))
+        print("---------------")
+        print("v_table: ")
+        for scope in self.v_table.scopes():
+            print([symbols.text(name) for name in scope])
 
 def report_error(str):
-    print("Error: ", str)
-    sys.exit()
-
-
-def print_tables():
-    print("f_table: ")
-    for f in f_table:
-        print(f)
-    print("---------------")
-    print("v_table: ")
-    for v in v_table:
-        print(v)
+    raise CompileError("Error:  " + str)